@@ -8,6 +8,9 @@ import sqlite3
 import base64
 import subprocess
 import traceback
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, Response
 import cv2
@@ -77,6 +80,15 @@ os.makedirs(LIBRARY_FOLDER, exist_ok=True)
 os.makedirs(ANIMATIONS_FOLDER_GENERATED, exist_ok=True)
 os.makedirs(TRANSPARENT_VIDEOS_FOLDER, exist_ok=True)
 
+# Shared keep-alive session for fetching source images from S3/CDN; GETs retry on gateway errors
+HTTP_SESSION = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=32, pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+)
+HTTP_SESSION.mount("https://", _http_adapter)
+HTTP_SESSION.mount("http://", _http_adapter)
+
 # Production mode check
 PRODUCTION_MODE = os.getenv('PRODUCTION_MODE', 'false').lower() == 'true'
 
@@ -110,6 +122,8 @@ def get_db_connection():
     conn = sqlite3.connect(DATABASE_PATH, timeout=10)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA busy_timeout=30000;")  # 30 second timeout for busy database
+    conn.execute("PRAGMA synchronous=NORMAL;")  # Safe with WAL, avoids an fsync per commit
+    conn.execute("PRAGMA temp_store=MEMORY;")  # Sorts/temp tables in RAM
     conn.row_factory = sqlite3.Row
     
     # Lazy initialization: Ensure table exists on every connection
@@ -234,8 +248,7 @@ def get_aspect_ratio_from_image(image_path):
     try:
         # Handle both S3 URLs and local file paths
         if image_path.startswith('http'):
-            import requests
-            img_response = requests.get(image_path)
+            img_response = HTTP_SESSION.get(image_path, timeout=(10, 60))
             img_response.raise_for_status()
             from io import BytesIO
             img = Image.open(BytesIO(img_response.content))
@@ -279,18 +292,12 @@ def preprocess_animation_image(source_image_path, background_color_str, white_ou
     """
     try:
         # Handle both S3 URLs and local file paths
-        temp_file = None
         if source_image_path.startswith('http'):
-            # Download from S3 first
-            import requests
+            # Decode the S3 download straight from memory - no temp file to clean up
             print(f"   ...downloading image from S3 for preprocessing: {source_image_path}")
-            img_response = requests.get(source_image_path)
+            img_response = HTTP_SESSION.get(source_image_path, timeout=(10, 60))
             img_response.raise_for_status()
-            temp_filename = f"temp_preprocess_{uuid.uuid4()}.png"
-            temp_file = os.path.join(UPLOADS_FOLDER, temp_filename)
-            with open(temp_file, "wb") as f:
-                f.write(img_response.content)
-            source_full_path = temp_file
+            source_full_path = io.BytesIO(img_response.content)
         else:
             # It's a local path
             if source_image_path.startswith('/'):
@@ -359,26 +366,12 @@ def preprocess_animation_image(source_image_path, background_color_str, white_ou
         fg_image.save(output_full_path, 'PNG')
         print(f"   ...saved pre-processed image to {output_full_path}")
         
-        # Clean up temp file if downloaded from S3
-        if temp_file:
-            try:
-                os.remove(temp_file)
-                print(f"   ...cleaned up temp file")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp file: {e}")
-        
         # Upload to S3 if enabled
         s3_key = f"uploads/{output_filename}"
         public_url = upload_file(output_full_path, s3_key)
         return public_url
     except Exception as e:
         print(f"Error during image pre-processing: {e}")
-        # Clean up temp file on error
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.remove(temp_file)
-            except:
-                pass
         return source_image_path
 
 
@@ -913,18 +906,11 @@ Style & Technique Description:
 Task:
 Create a description focusing entirely on the art style, genre, and aesthetic character — never on the subject itself."""
             
-            style_input_data = json.dumps({
+            style_input_data = {
                 "image_path": style_image_url,
                 "system_prompt": style_system_prompt,
                 "internal": True  # Hidden from UI
-            })
-            
-            cursor.execute(
-                "INSERT INTO jobs (job_type, status, created_at, prompt, input_data) VALUES (?, ?, ?, ?, ?)",
-                ('style_analysis', 'queued', datetime.now(), "Internal style analysis", style_input_data)
-            )
-            style_analysis_job_id = cursor.lastrowid
-            print(f"-> Created internal style analysis job {style_analysis_job_id}")
+            }
         
         # Create internal color analysis job if color ref provided
         if color_ref_image:
@@ -945,15 +931,41 @@ REQUIRED FORMAT - Return valid JSON only:
 
 No explanation text, just the JSON object."""
             
-            color_input_data = json.dumps({
+            color_input_data = {
                 "image_path": color_image_url,
                 "system_prompt": color_system_prompt,
                 "internal": True  # Hidden from UI
+            }
+        
+        if style_ref_image and color_ref_image:
+            # Both refs: one combined Vision call answers style and palette together
+            combined_input_data = json.dumps({
+                "image_path": style_input_data["image_path"],
+                "style_system_prompt": style_input_data["system_prompt"],
+                "color_image_path": color_input_data["image_path"],
+                "color_system_prompt": color_input_data["system_prompt"],
+                "internal": True  # Hidden from UI
             })
             
             cursor.execute(
                 "INSERT INTO jobs (job_type, status, created_at, prompt, input_data) VALUES (?, ?, ?, ?, ?)",
-                ('palette_analysis', 'queued', datetime.now(), "Internal color analysis", color_input_data)
+                ('combined_vision_analysis', 'queued', datetime.now(), "Internal style and color analysis", combined_input_data)
+            )
+            style_analysis_job_id = color_analysis_job_id = cursor.lastrowid
+            print(f"-> Created internal combined vision analysis job {style_analysis_job_id}")
+        
+        elif style_ref_image:
+            cursor.execute(
+                "INSERT INTO jobs (job_type, status, created_at, prompt, input_data) VALUES (?, ?, ?, ?, ?)",
+                ('style_analysis', 'queued', datetime.now(), "Internal style analysis", json.dumps(style_input_data))
+            )
+            style_analysis_job_id = cursor.lastrowid
+            print(f"-> Created internal style analysis job {style_analysis_job_id}")
+        
+        elif color_ref_image:
+            cursor.execute(
+                "INSERT INTO jobs (job_type, status, created_at, prompt, input_data) VALUES (?, ?, ?, ?, ?)",
+                ('palette_analysis', 'queued', datetime.now(), "Internal color analysis", json.dumps(color_input_data))
             )
             color_analysis_job_id = cursor.lastrowid
             print(f"-> Created internal color analysis job {color_analysis_job_id}")
@@ -1551,7 +1563,8 @@ def edit_job(job_id):
                     if color_job:
                         try:
                             color_input = json.loads(color_job['input_data'])
-                            job_dict['input_data']['color_ref_image_path'] = color_input.get('image_path')
+                            # Combined analysis jobs keep the color ref under its own key
+                            job_dict['input_data']['color_ref_image_path'] = color_input.get('color_image_path', color_input.get('image_path'))
                         except:
                             pass
         
@@ -2256,10 +2269,7 @@ def debug_sticker_effect():
         frame_pil.putalpha(original_alpha)
         frame_array = np.array(frame_pil)
         alpha_array = np.array(original_alpha)
-        mask = (alpha_array == 0)
-        frame_array[:, :, 0] = np.where(mask, 0, frame_array[:, :, 0])
-        frame_array[:, :, 1] = np.where(mask, 0, frame_array[:, :, 1])
-        frame_array[:, :, 2] = np.where(mask, 0, frame_array[:, :, 2])
+        frame_array[:, :, :3] *= (alpha_array != 0)[:, :, None]
         frame_pil = Image.fromarray(frame_array, 'RGBA')
         
         final_path = f"/static/library/debug_steps/{session_id}_8_final.png"
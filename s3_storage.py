@@ -5,10 +5,21 @@ Handles all file uploads/downloads to/from S3 for cloud deployment
 
 import os
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from pathlib import Path
+from urllib.parse import unquote
 import mimetypes
 
+# Large outputs (keyed videos, ZIPs) go up as 16MB parts, 8 in flight at a time
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+
 class S3Storage:
     """Handles file storage operations with AWS S3"""
     
@@ -21,7 +32,9 @@ class S3Storage:
                 's3',
                 aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
                 aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                region_name=os.getenv('AWS_REGION', 'us-east-1')
+                region_name=os.getenv('AWS_REGION', 'us-east-1'),
+                # Room for several concurrent jobs each running a multipart transfer
+                config=Config(max_pool_connections=32)
             )
             self.bucket_name = os.getenv('S3_BUCKET_NAME')
             self.cloudfront_url = os.getenv('CLOUDFRONT_URL', '')  # Optional CDN
@@ -67,7 +80,8 @@ class S3Storage:
                 local_file_path,
                 self.bucket_name,
                 s3_key,
-                ExtraArgs=extra_args
+                ExtraArgs=extra_args,
+                Config=TRANSFER_CONFIG
             )
             
             # Return public URL
@@ -83,6 +97,44 @@ class S3Storage:
             # Fallback to local path
             return f"/static/{s3_key}"
     
+    def upload_fileobj(self, file_object, s3_key, content_type=None):
+        """
+        Upload a readable file-like object (e.g. a streaming HTTP body) to S3
+        
+        Args:
+            file_object: Object with a read() method; does not need to be seekable
+            s3_key: S3 object key (path in bucket, e.g. 'library/image.png')
+            content_type: MIME type (guessed from s3_key if omitted)
+        
+        Returns:
+            str: Public URL of uploaded file, or local path if S3 disabled
+        """
+        if not self.enabled:
+            return f"/static/{s3_key}"
+        
+        try:
+            if content_type is None:
+                content_type, _ = mimetypes.guess_type(s3_key)
+            
+            # Note: ACL not needed - bucket policy makes all objects public
+            self.s3_client.upload_fileobj(
+                file_object,
+                self.bucket_name,
+                s3_key,
+                ExtraArgs={
+                    'ContentType': content_type or 'application/octet-stream',
+                    'CacheControl': 'public, max-age=31536000'  # Cache for 1 year
+                },
+                Config=TRANSFER_CONFIG
+            )
+            
+            return self.get_public_url(s3_key)
+            
+        except ClientError as e:
+            print(f"❌ S3 upload error: {e}")
+            # Fallback to local path
+            return f"/static/{s3_key}"
+    
     def download_file(self, s3_key, local_file_path):
         """
         Download a file from S3
@@ -106,7 +158,8 @@ class S3Storage:
             self.s3_client.download_file(
                 self.bucket_name,
                 s3_key,
-                local_file_path
+                local_file_path,
+                Config=TRANSFER_CONFIG
             )
             return True
             
@@ -189,6 +242,25 @@ class S3Storage:
             region = os.getenv('AWS_REGION', 'us-east-1')
             return f"https://{self.bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
     
+    def key_for_url(self, url):
+        """
+        Map a public URL of an object in this bucket back to its S3 key
+        
+        Args:
+            url: URL as returned by upload_file/get_public_url
+        
+        Returns:
+            str: S3 key, or None if S3 is disabled or the URL points elsewhere
+        """
+        if not self.enabled:
+            return None
+        
+        prefix = self.get_public_url('')
+        if not url.startswith(prefix):
+            return None
+        s3_key = unquote(url[len(prefix):].split('?', 1)[0])
+        return s3_key or None
+    
     def save_uploaded_file(self, file_object, s3_key):
         """
         Save an uploaded Flask file object to S3
@@ -243,6 +315,10 @@ def upload_file(local_path, s3_key):
     """Upload a local file to S3 or keep local if S3 disabled"""
     return storage.upload_file(local_path, s3_key)
 
+def upload_fileobj(file_object, s3_key, content_type=None):
+    """Upload a file-like object to S3 or keep local if S3 disabled"""
+    return storage.upload_fileobj(file_object, s3_key, content_type)
+
 def download_file(s3_key, local_path):
     """Download a file from S3 or use local if S3 disabled"""
     return storage.download_file(s3_key, local_path)
@@ -255,6 +331,10 @@ def get_public_url(s3_key):
     """Get public URL for a file"""
     return storage.get_public_url(s3_key)
 
+def key_for_url(url):
+    """S3 key for a public URL in our bucket, or None"""
+    return storage.key_for_url(url)
+
 def save_uploaded_file(file_object, s3_key):
     """Save uploaded Flask file to S3 or local"""
     return storage.save_uploaded_file(file_object, s3_key)
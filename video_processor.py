@@ -1,98 +1,448 @@
 import cv2
+import functools
+import json
 import numpy as np
 import os
+import queue
 import shutil
 import subprocess
 import tempfile
+import threading
+
+# Make sure OpenCV's SIMD kernels and its worker thread pool are in use (some builds/hosts default them off)
+cv2.setUseOptimized(True)
+cv2.setNumThreads(os.cpu_count() or 1)
+
+@functools.lru_cache(maxsize=None)
+def rect_kernel(size):
+    """
+    Cached rectangular structuring element. OpenCV runs all-ones rect kernels as
+    separable SIMD row/column passes, so cost grows with size, not size squared.
+    """
+    return cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+
+@functools.lru_cache(maxsize=None)
+def nvenc_available():
+    """
+    True if ffmpeg can actually encode with h264_nvenc on this host (checked once).
+    A build can list nvenc without a usable GPU, so this runs a tiny test encode.
+    """
+    test_cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'color=black:s=256x256:d=0.1',
+        '-c:v', 'h264_nvenc',
+        '-f', 'null', '-'
+    ]
+    try:
+        return subprocess.run(test_cmd, capture_output=True, timeout=30).returncode == 0
+    except Exception:
+        return False
+
+def h264_encoder_args():
+    """ffmpeg args for an opaque H.264 encode: NVENC when available, x264 ultrafast otherwise."""
+    if nvenc_available():
+        return ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', '23']
+    return [
+        '-c:v', 'libx264',
+        '-preset', 'ultrafast',  # Fastest encoding preset
+        '-tune', 'zerolatency',  # No lookahead/B-frame buffering
+        '-threads', '0',         # Let x264 use all cores
+        '-crf', '23',            # Reasonable quality for fallback
+    ]
+
+# VP9 speed for the transparent WebM encodes (keying/sticker output). libvpx's default cpu-used 1
+# dominates CPU-only keying jobs; "good" at cpu-used 3 with row-mt and tiles gets most of the speedup
+# at about the same quality. realtime + cpu-used 8 is faster still but visibly worse (opt-in).
+VP9_DEADLINE = os.environ.get("VP9_DEADLINE", "good")
+VP9_CPU_USED = os.environ.get("VP9_CPU_USED", "3")
+# log2 of the tile-column count; tiles are encoded in parallel (libvpx clamps it to what the width allows)
+VP9_TILE_COLUMNS = os.environ.get("VP9_TILE_COLUMNS", "2")
+
+def vp9_alpha_encoder_args(crf, deadline=None, cpu_used=None):
+    """
+    ffmpeg args for a multithreaded VP9 encode that keeps the alpha channel (yuva420p).
+    deadline/cpu_used default to VP9_DEADLINE/VP9_CPU_USED.
+    """
+    return [
+        '-c:v', 'libvpx-vp9',
+        '-pix_fmt', 'yuva420p',
+        '-crf', str(crf),
+        '-b:v', '0',
+        '-deadline', deadline or VP9_DEADLINE,
+        '-cpu-used', str(cpu_used if cpu_used is not None else VP9_CPU_USED),
+        '-row-mt', '1',                      # Row-based multithreading
+        '-tile-columns', VP9_TILE_COLUMNS,   # Parallel tiles (also speeds up decoding)
+        '-threads', str(os.cpu_count() or 1),
+    ]
+
+# Optional: fused despill kernel (compiled with numba; falls back to the NumPy version)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("⚠️ numba not available - using NumPy despill")
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, nogil=True)
+    def _despill_to_bgra(frame, gray_frame, mask, spill_map):
+        """
+        One pass over the frame: blend each pixel towards its gray value by spill_map
+        and write BGRA with alpha = 255 - mask. Same arithmetic as the NumPy path, so
+        output is bit-identical, but without the float64 frame-sized temporaries.
+        nogil so concurrent keying jobs run it in parallel.
+        """
+        height, width = mask.shape
+        bgra_frame = np.empty((height, width, 4), np.uint8)
+        for y in range(height):
+            for x in range(width):
+                weight = spill_map[y, x] / 255.0
+                keep = 1 - weight
+                gray = gray_frame[y, x]
+                bgra_frame[y, x, 0] = np.uint8(frame[y, x, 0] * keep + gray * weight)
+                bgra_frame[y, x, 1] = np.uint8(frame[y, x, 1] * keep + gray * weight)
+                bgra_frame[y, x, 2] = np.uint8(frame[y, x, 2] * keep + gray * weight)
+                bgra_frame[y, x, 3] = 255 - mask[y, x]
+        return bgra_frame
+
+# Optional: CUDA keying (needs an OpenCV build with the CUDA modules and an NVIDIA GPU)
+try:
+    CUDA_KEYING_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    CUDA_KEYING_AVAILABLE = False
+if CUDA_KEYING_AVAILABLE:
+    print("🚀 CUDA device found - chroma keying will run on the GPU")
+
+_cuda_local = threading.local()  # Per-thread stream, frame buffer and filters so worker threads overlap
+
+def _cuda_filter(kind, size):
+    """Per-thread cache of CUDA morphology/Gaussian filters for single-channel masks."""
+    filters = _cuda_local.__dict__.setdefault('filters', {})
+    key = (kind, size)
+    if key not in filters:
+        if kind == 'gaussian':
+            filters[key] = cv2.cuda.createGaussianFilter(cv2.CV_8UC1, cv2.CV_8UC1, (size, size), 0)
+        else:
+            op = cv2.MORPH_ERODE if kind == 'erode' else cv2.MORPH_DILATE
+            filters[key] = cv2.cuda.createMorphologyFilter(op, cv2.CV_8UC1, rect_kernel(size))
+    return filters[key]
+
+def _process_single_frame_cuda(frame, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount):
+    """
+    GPU version of process_single_frame: the frame is uploaded once (or arrives as a
+    GpuMat straight from NVDEC) and stays on the device through HSV threshold,
+    morphology, blur and despill. Returns BGRA.
+    """
+    global CUDA_KEYING_AVAILABLE
+    try:
+        if not hasattr(_cuda_local, 'stream'):
+            _cuda_local.stream = cv2.cuda.Stream()
+            _cuda_local.frame = cv2.cuda_GpuMat()
+        stream = _cuda_local.stream
+        if isinstance(frame, cv2.cuda_GpuMat):
+            # NVDEC frames are BGRA
+            gpu_frame = cv2.cuda.cvtColor(frame, cv2.COLOR_BGRA2BGR, stream=stream) if frame.channels() == 4 else frame
+        else:
+            gpu_frame = _cuda_local.frame
+            gpu_frame.upload(frame, stream)
+        
+        hsv_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGR2HSV, stream=stream)
+        mask = cv2.cuda.inRange(hsv_frame, tuple(lower_green), tuple(upper_green), stream=stream)
+        
+        # Same erode/dilate sign conventions as the CPU path
+        for amount, positive_op, negative_op in ((erode_amount, 'erode', 'dilate'), (dilate_amount, 'dilate', 'erode')):
+            if amount > 0:
+                mask = _cuda_filter(positive_op, amount).apply(mask, stream=stream)
+            elif amount < 0:
+                mask = _cuda_filter(negative_op, -amount).apply(mask, stream=stream)
+        
+        if blur_amount > 0:
+            blur_amount = blur_amount if blur_amount % 2 != 0 else blur_amount + 1
+            mask = _cuda_filter('gaussian', blur_amount).apply(mask, stream=stream)
+        
+        inverted_mask = cv2.cuda.bitwise_not(mask, stream=stream)
+        
+        spill_map = _cuda_filter('dilate', 2 * spill_amount + 1).apply(mask, stream=stream) if spill_amount > 0 else mask
+        spill_map = _cuda_filter('gaussian', 5).apply(spill_map, stream=stream)
+        
+        frame_gray = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGR2GRAY, stream=stream)
+        frame_desaturated = cv2.cuda.cvtColor(frame_gray, cv2.COLOR_GRAY2BGR, stream=stream)
+        
+        # frame * (1 - spill) + desaturated * spill, as a per-pixel weighted blend
+        spill_weights = spill_map.convertTo(cv2.CV_32FC1, 1.0 / 255.0, 0.0, stream)
+        frame_weights = spill_weights.convertTo(cv2.CV_32FC1, -1.0, 1.0, stream)
+        frame_despilled = cv2.cuda.blendLinear(gpu_frame, frame_desaturated, frame_weights, spill_weights, stream=stream)
+        
+        bgr = frame_despilled.download(stream)
+        alpha = inverted_mask.download(stream)
+        stream.waitForCompletion()
+        return cv2.merge([*cv2.split(bgr), alpha])
+    except Exception as e:
+        print(f"⚠️ CUDA keying failed, falling back to CPU: {e}")
+        CUDA_KEYING_AVAILABLE = False
+        return None
 
 def process_single_frame(frame, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount):
     """
     Applies chroma keying and returns a single, transparent 4-channel BGRA frame.
     """
+    if CUDA_KEYING_AVAILABLE:
+        bgra_frame = _process_single_frame_cuda(frame, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount)
+        if bgra_frame is not None:
+            return bgra_frame
+    if isinstance(frame, cv2.cuda_GpuMat):
+        # Decoded on the GPU but keying fell back to the CPU
+        frame = frame.download()
+        if frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    
     hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
     mask = cv2.inRange(hsv_frame, np.array(lower_green), np.array(upper_green))
-    
+    return key_frame_with_mask(frame, mask, erode_amount, dilate_amount, blur_amount, spill_amount)
+
+def key_frame_with_mask(frame, mask, erode_amount, dilate_amount, blur_amount, spill_amount):
+    """
+    CPU keying from an already thresholded green mask: morphology, blur, despill and
+    alpha. Returns the transparent BGRA frame.
+    """
     # Handle erode (positive = erode, negative = dilate)
     if erode_amount > 0:
-        erode_kernel = np.ones((erode_amount, erode_amount), np.uint8)
-        mask = cv2.erode(mask, erode_kernel, iterations=1)
+        mask = cv2.erode(mask, rect_kernel(erode_amount))
     elif erode_amount < 0:
         # Negative erode means dilate
-        dilate_kernel = np.ones((abs(erode_amount), abs(erode_amount)), np.uint8)
-        mask = cv2.dilate(mask, dilate_kernel, iterations=1)
+        mask = cv2.dilate(mask, rect_kernel(-erode_amount))
         
     # Handle dilate (positive = dilate, negative = erode)
     if dilate_amount > 0:
-        dilate_kernel = np.ones((dilate_amount, dilate_amount), np.uint8)
-        mask = cv2.dilate(mask, dilate_kernel, iterations=1)
+        mask = cv2.dilate(mask, rect_kernel(dilate_amount))
     elif dilate_amount < 0:
         # Negative dilate means erode
-        erode_kernel = np.ones((abs(dilate_amount), abs(dilate_amount)), np.uint8)
-        mask = cv2.erode(mask, erode_kernel, iterations=1)
+        mask = cv2.erode(mask, rect_kernel(-dilate_amount))
 
     if blur_amount > 0:
         blur_amount = blur_amount if blur_amount % 2 != 0 else blur_amount + 1
         mask = cv2.GaussianBlur(mask, (blur_amount, blur_amount), 0)
-        
-    inverted_mask = cv2.bitwise_not(mask)
     
-    spill_map = cv2.dilate(mask, np.ones((3,3), np.uint8), iterations=spill_amount)
+    # N iterations of a 3x3 dilate == one (2N+1)x(2N+1) dilate, but with a single pass over the frame
+    spill_map = cv2.dilate(mask, rect_kernel(2 * spill_amount + 1)) if spill_amount > 0 else mask
     spill_map = cv2.GaussianBlur(spill_map, (5,5), 0)
     
     frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    frame_desaturated = cv2.cvtColor(frame_gray, cv2.COLOR_GRAY2BGR)
+    if NUMBA_AVAILABLE:
+        return _despill_to_bgra(frame, frame_gray, mask, spill_map)
     
-    spill_map_normalized = spill_map / 255.0
-    spill_map_3d = np.stack([spill_map_normalized]*3, axis=-1)
+    inverted_mask = cv2.bitwise_not(mask)
     
-    frame_despilled = (frame * (1 - spill_map_3d) + frame_desaturated * spill_map_3d).astype(np.uint8)
+    # Single-channel weights and gray broadcast over BGR as views (no 3-channel copies)
+    spill_weight = (spill_map / 255.0)[:, :, None]
+    frame_desaturated = frame_gray[:, :, None]
+    
+    frame_despilled = (frame * (1 - spill_weight) + frame_desaturated * spill_weight).astype(np.uint8)
     
     b, g, r = cv2.split(frame_despilled)
     bgra_frame = cv2.merge([b, g, r, inverted_mask])
     
     return bgra_frame
 
-def process_video_with_opencv(video_path, output_path, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount, skip_encoding=False):
+def iter_video_frames(video_path):
+    """
+    Yields decoded frames. With CUDA keying available, frames are decoded by NVDEC
+    (cv2.cudacodec) and yielded as GpuMats so they never round-trip through host
+    memory before keying; otherwise yields BGR arrays from cv2.VideoCapture.
+    """
+    if CUDA_KEYING_AVAILABLE and hasattr(cv2, 'cudacodec'):
+        frames_read = 0
+        try:
+            reader = cv2.cudacodec.createVideoReader(video_path)
+            while True:
+                success, gpu_frame = reader.nextFrame()
+                if not success:
+                    return
+                frames_read += 1
+                yield gpu_frame
+        except cv2.error as e:
+            if frames_read:
+                raise
+            print(f"   ...NVDEC decode unavailable ({e}), decoding on the CPU")
+    
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        while True:
+            success, frame = video_capture.read()
+            if not success:
+                return
+            yield frame
+    finally:
+        video_capture.release()
+
+FRAME_BUFFER_SIZE = 8  # Frames in flight between the decode, keying and PNG-writing threads
+
+def prefetch_frames(frames, maxsize=FRAME_BUFFER_SIZE):
+    """
+    Runs a frame iterator on a background thread so decoding overlaps with keying.
+    Yields the same frames in order; decoder errors are re-raised in the caller.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up if the consumer has stopped, instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for frame in frames:
+                if not put((frame, None)):
+                    return
+            put((None, None))
+        except Exception as e:
+            put((None, e))
+        finally:
+            frames.close()
+
+    threading.Thread(target=produce, name="FrameReader", daemon=True).start()
+    try:
+        while True:
+            frame, error = buffer.get()
+            if error is not None:
+                raise error
+            if frame is None:
+                return
+            yield frame
+    finally:
+        stop.set()
+
+def get_video_fps(video_path):
+    """Frame rate of the video as reported by OpenCV."""
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        return video_capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        video_capture.release()
+
+KEYING_BATCH_SIZE = 16  # Frames thresholded per cvtColor/inRange call on the CPU path
+
+def _key_frame_batch(frames, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount):
+    """
+    Keys an (n, h, w, 3) block of BGR frames. The HSV conversion and green threshold run
+    as one OpenCV call each over the whole block (viewed as an (n*h, w) image), so the
+    per-call overhead is paid once per batch; the neighbourhood filters stay per frame.
+    """
+    n, height, width, _ = frames.shape
+    hsv_frames = cv2.cvtColor(frames.reshape(n * height, width, 3), cv2.COLOR_BGR2HSV)
+    masks = cv2.inRange(hsv_frames, np.array(lower_green), np.array(upper_green)).reshape(n, height, width)
+    for frame, mask in zip(frames, masks):
+        yield key_frame_with_mask(frame, mask, erode_amount, dilate_amount, blur_amount, spill_amount)
+
+def iter_keyed_frames(video_path, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount, frame_step=1):
+    """
+    Yields keyed BGRA frames in order, straight from memory (nothing is written to disk).
+    Decoding runs on a background thread so it overlaps with keying; with frame_step > 1 only
+    every Nth frame is keyed (the others are decoded and dropped). On the CPU, frames are
+    keyed in batches of KEYING_BATCH_SIZE copied into one reused block.
+    """
+    keying_args = (lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount)
+    frames = prefetch_frames(iter_video_frames(video_path))
+    if CUDA_KEYING_AVAILABLE:
+        for index, frame in enumerate(frames):
+            if index % frame_step == 0:
+                yield process_single_frame(frame, *keying_args)
+        return
+
+    batch, count = None, 0
+    for index, frame in enumerate(frames):
+        if index % frame_step:
+            continue
+        if batch is None:
+            batch = np.empty((KEYING_BATCH_SIZE, *frame.shape), np.uint8)
+        batch[count] = frame
+        count += 1
+        if count == KEYING_BATCH_SIZE:
+            yield from _key_frame_batch(batch, *keying_args)
+            count = 0
+    if count:
+        yield from _key_frame_batch(batch[:count], *keying_args)
+
+def save_keyed_frame(bgra_frame, frame_filename):
+    """Writes a BGRA frame as an RGBA PNG."""
+    # CRITICAL: Use PIL to save PNG with alpha, OpenCV can corrupt alpha channel
+    # Convert BGRA (OpenCV) to RGBA (PIL)
+    from PIL import Image
+    b, g, r, a = cv2.split(bgra_frame)
+    rgba_frame = cv2.merge([r, g, b, a])  # Reorder to RGB + Alpha
+    pil_image = Image.fromarray(rgba_frame, 'RGBA')
+    pil_image.save(frame_filename, 'PNG')
+
+class FrameWriter:
+    """Saves keyed frames on a background thread (PNG compression releases the GIL)."""
+
+    def __init__(self, maxsize=FRAME_BUFFER_SIZE):
+        self.buffer = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="FrameWriter", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.buffer.get()
+            if item is None:
+                return
+            if self.error is None:  # After a failure keep draining so the producer never blocks
+                try:
+                    save_keyed_frame(*item)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, bgra_frame, frame_filename):
+        if self.error is not None:
+            raise self.error
+        self.buffer.put((bgra_frame, frame_filename))
+
+    def close(self):
+        """Waits for every queued frame to be written; re-raises the first write error."""
+        self.buffer.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+def process_video_with_opencv(video_path, output_path, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount, skip_encoding=False, scratch_dir=None, frame_step=1):
     """
     Processes a video using a manual ffmpeg pipeline. Audio is ignored.
     
     Args:
         skip_encoding: If True, only processes frames and returns (fps, frame_count, temp_frame_dir)
                        without encoding to WebM. Used when sticker effects will be applied next.
+        scratch_dir: Parent folder for the temporary frame folder (defaults to the working directory).
+        frame_step: Keep only every Nth source frame (posterize time); kept frames are numbered sequentially.
     
     Returns:
         If skip_encoding=False: None (output_path is created)
         If skip_encoding=True: (fps, frame_count, temp_frame_dir)
     """
-    temp_frame_dir = "temp_keyed_frames"
-    if os.path.exists(temp_frame_dir):
-        shutil.rmtree(temp_frame_dir)
-    os.makedirs(temp_frame_dir)
+    # Unique per call so concurrent keying jobs never share (or wipe) each other's frames
+    temp_frame_dir = tempfile.mkdtemp(prefix="temp_keyed_frames_", dir=scratch_dir or ".")
 
     try:
         print("-> Step 1: Extracting and processing frames...")
-        video_capture = cv2.VideoCapture(video_path)
-        original_fps = video_capture.get(cv2.CAP_PROP_FPS)
+        original_fps = get_video_fps(video_path)
         frame_count = 0
-        while True:
-            success, frame = video_capture.read()
-            if not success:
-                break
-            
-            bgra_frame = process_single_frame(frame, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount)
-            frame_filename = os.path.join(temp_frame_dir, f"frame_{frame_count:05d}.png")
-            
-            # CRITICAL: Use PIL to save PNG with alpha, OpenCV can corrupt alpha channel
-            # Convert BGRA (OpenCV) to RGBA (PIL)
-            from PIL import Image
-            b, g, r, a = cv2.split(bgra_frame)
-            rgba_frame = cv2.merge([r, g, b, a])  # Reorder to RGB + Alpha
-            pil_image = Image.fromarray(rgba_frame, 'RGBA')
-            pil_image.save(frame_filename, 'PNG')
-            
-            frame_count += 1
-            
-        video_capture.release()
+        # Decode, keying and PNG writes overlap: reader and writer threads with bounded buffers
+        frame_writer = FrameWriter()
+        try:
+            keyed_frames = iter_keyed_frames(video_path, lower_green, upper_green, erode_amount, dilate_amount, blur_amount, spill_amount,
+                                             frame_step=frame_step)
+            for bgra_frame in keyed_frames:
+                frame_writer.write(bgra_frame, os.path.join(temp_frame_dir, f"frame_{frame_count:05d}.png"))
+                frame_count += 1
+        finally:
+            frame_writer.close()
+        
         print(f"   ...processed and saved {frame_count} frames to {temp_frame_dir}")
 
         # If skip_encoding=True, return the frame info for further processing (sticker effects)
@@ -106,16 +456,17 @@ def process_video_with_opencv(video_path, output_path, lower_green, upper_green,
             'ffmpeg', '-y',
             '-framerate', str(original_fps),
             '-i', os.path.join(temp_frame_dir, 'frame_%05d.png'),
-            '-c:v', 'libvpx-vp9',
-            '-pix_fmt', 'yuva420p',
-            '-crf', '10',
-            '-b:v', '0',
+            *vp9_alpha_encoder_args(10),
             output_path
         ]
         
         subprocess.run(ffmpeg_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         print(f"   ...successfully created transparent video at {output_path}")
 
+    except BaseException:
+        # The caller never gets the frame folder on failure - don't leave the PNG sequence behind
+        shutil.rmtree(temp_frame_dir, ignore_errors=True)
+        raise
     finally:
         # Only clean up if we encoded (skip_encoding=False)
         if not skip_encoding:
@@ -124,16 +475,42 @@ def process_video_with_opencv(video_path, output_path, lower_green, upper_green,
                 shutil.rmtree(temp_frame_dir)
             print("   ...done.")
 
+def probe_video_stream(video_path):
+    """
+    Returns (codec, width, height, frame_rate, pix_fmt) of the first video stream,
+    or None if ffprobe is unavailable or fails.
+    """
+    ffprobe_cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,width,height,r_frame_rate,pix_fmt',
+        '-of', 'json',
+        video_path
+    ]
+    try:
+        result = subprocess.run(ffprobe_cmd, check=True, capture_output=True, text=True, timeout=30)
+        stream = json.loads(result.stdout)['streams'][0]
+        return (stream.get('codec_name'), stream.get('width'), stream.get('height'), stream.get('r_frame_rate'), stream.get('pix_fmt'))
+    except Exception as e:
+        print(f"   ...ffprobe failed for {video_path}: {e}")
+        return None
+
 def stitch_videos_with_ffmpeg(video_paths, output_path, target_resolution=None):
     """
     Stitches two videos together using a simple, reliable approach.
-    Uses concat protocol for maximum reliability and speed.
+    Uses the concat demuxer with stream copy when the inputs share codec, size,
+    frame rate and pixel format; otherwise goes straight to re-encoding.
     """
     print(f"-> Stitching videos: {video_paths}")
     
-    # Create temporary file list for concat protocol (most reliable method)
-    import tempfile
+    # Stream copy only works for matching inputs - mismatches either fail after the
+    # timeout or silently produce a broken file, so check up front
+    stream_info = [probe_video_stream(video_path) for video_path in video_paths]
+    if None not in stream_info and len(set(stream_info)) > 1:
+        print(f"   ...input streams differ {stream_info}, skipping stream copy")
+        return _fallback_stitch_with_reencoding(video_paths, output_path)
     
+    # Create temporary file list for concat protocol (most reliable method)
     try:
         # Create a temporary file list for ffmpeg concat
         with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
@@ -206,7 +583,7 @@ def _fallback_stitch_with_reencoding(video_paths, output_path):
     Fallback method that re-encodes videos to ensure compatibility.
     Used when the fast copy method fails.
     """
-    print("   ...using fallback re-encoding method")
+    print(f"   ...using fallback re-encoding method ({'NVENC' if nvenc_available() else 'libx264'})")
     
     # Simple filter_complex with re-encoding - more compatible but slower
     ffmpeg_cmd = [
@@ -215,9 +592,7 @@ def _fallback_stitch_with_reencoding(video_paths, output_path):
         '-i', video_paths[1],
         '-filter_complex', '[0:v][1:v]concat=n=2:v=1[v]',  # Simple concat, no audio
         '-map', '[v]',
-        '-c:v', 'libx264',
-        '-preset', 'ultrafast',  # Fastest encoding preset
-        '-crf', '23',           # Reasonable quality for fallback
+        *h264_encoder_args(),   # Transparent WebM outputs stay on VP9 - NVENC has no alpha support
         '-pix_fmt', 'yuv420p',
         '-movflags', '+faststart',
         '-y',
@@ -1,29 +1,43 @@
 import sqlite3
+import sys
+import re
 import time
+import asyncio
 import json
 import os
 import requests
+import httpx
 import replicate
 from PIL import Image
 import io
 import uuid
 import shutil
+import tempfile
 import base64
-import traceback
+import contextlib
+import functools
+import atexit
+import logging
+import logging.handlers
+from dataclasses import dataclass, field, fields
 import subprocess
 import signal
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import collections
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait as wait_futures
 from datetime import datetime, timedelta
 from replicate.exceptions import ReplicateError
 from dotenv import load_dotenv
 from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from video_processor import process_video_with_opencv, stitch_videos_with_ffmpeg
-from s3_storage import storage, upload_file, save_uploaded_file, get_public_url, is_s3_enabled, download_file
+from video_processor import process_video_with_opencv, iter_keyed_frames, get_video_fps, probe_video_stream, stitch_videos_with_ffmpeg, nvenc_available, vp9_alpha_encoder_args
+from s3_storage import storage, upload_file, upload_fileobj, save_uploaded_file, get_public_url, is_s3_enabled, download_file, key_for_url
 import cv2
 import numpy as np
-from PIL import ImageChops, ImageEnhance, ImageFilter
 import gc
 
 # Optional: Memory monitoring (graceful degradation if psutil not available)
@@ -34,8 +48,59 @@ except ImportError:
     MEMORY_MONITORING_AVAILABLE = False
     print("⚠️ psutil not available - memory monitoring disabled")
 
+# Optional: faster JSON parsing/serialization (falls back to the standard json module)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("⚠️ orjson not available - using standard json")
+
+# Optional: numba-compiled sticker kernels (falls back to the NumPy/OpenCV helpers)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("⚠️ numba not available - using NumPy sticker effects")
+
+# Optional: HTTP/2 for the shared OpenAI client (httpx needs the h2 package for it)
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    print("⚠️ h2 not available - OpenAI client using HTTP/1.1")
+
+# Optional: SIMD base64 encoder for inlined vision images (falls back to the standard base64 module)
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+    print("⚠️ pybase64 not available - using standard base64")
+
+# --- LOGGING ---
+# Error paths log through a queue: the job thread only enqueues the record, and the
+# listener thread formats the message/traceback and writes it to stdout.
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that hands the record over as-is, so formatting happens on the listener thread."""
+    def prepare(self, record):
+        return record
+
+LOG_QUEUE = queue.Queue(-1)
+LOG_LISTENER = logging.handlers.QueueListener(LOG_QUEUE, logging.StreamHandler(sys.stdout))
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)  # Flush queued records on exit
+
+logger = logging.getLogger("worker")
+logger.setLevel(logging.INFO)
+logger.addHandler(DeferredQueueHandler(LOG_QUEUE))
+logger.propagate = False
+
 # --- CONFIGURATION ---
 load_dotenv()
+logger.setLevel(os.environ.get("WORKER_LOG_LEVEL", "INFO").upper())  # e.g. DEBUG while troubleshooting
 LEONARDO_API_KEY = os.environ.get("LEONARDO_API_KEY")
 REPLICATE_API_KEY = os.environ.get("REPLICATE_API_KEY")
 
@@ -65,12 +130,56 @@ def clear_memory():
     """Force garbage collection to free memory"""
     gc.collect()
     gc.collect()  # Call twice for thorough cleanup
+
+# --- JSON / BASE64 HELPERS ---
+def json_loads(text):
+    """Parse a JSON column value (orjson when available)."""
+    return orjson.loads(text) if ORJSON_AVAILABLE else json.loads(text)
+
+def json_dumps(data):
+    """Serialize a value for a JSON column (orjson when available)."""
+    return orjson.dumps(data).decode('utf-8') if ORJSON_AVAILABLE else json.dumps(data)
+
+def b64encode_str(data):
+    """Base64-encode bytes to an ASCII str (pybase64 when available)."""
+    return (pybase64 if PYBASE64_AVAILABLE else base64).b64encode(data).decode('ascii')
+
+@functools.lru_cache(maxsize=1024)
+def cached_json_loads(text):
+    """
+    json_loads memoized on the column text, for rows the scheduler re-reads every tick.
+    The result is shared between calls - copy it before mutating.
+    """
+    return json_loads(text)
+
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
 # Parallel processing configuration
 MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "3"))  # Process up to 3 jobs simultaneously
 print(f"Worker: Configured for {MAX_CONCURRENT_JOBS} concurrent jobs")
 
+# I/O-bound animation jobs run as coroutines on a single event loop thread (0 = use the thread pool).
+# Each one is a paid Replicate prediction, so the default keeps the MAX_CONCURRENT_JOBS bound.
+MAX_ASYNC_JOBS = int(os.environ.get("MAX_ASYNC_JOBS", str(MAX_CONCURRENT_JOBS)))
+print(f"Worker: Configured for {MAX_ASYNC_JOBS} concurrent async animation jobs")
+
+# Network-bound jobs (provider APIs + S3 transfers) get their own threads so they never queue behind
+# CPU-heavy keying/stitching/trim jobs on the MAX_CONCURRENT_JOBS threads (0 = share those threads).
+# Opt-in: these are paid provider calls, and each lane adds to the worker's total concurrency.
+MAX_IO_JOBS = int(os.environ.get("MAX_IO_JOBS", "0"))
+IO_JOB_TYPES = ('image_generation', 'background_removal', 'style_analysis', 'palette_analysis',
+                'animation_prompting', 'combined_vision_analysis')
+print(f"Worker: Configured for {MAX_IO_JOBS} concurrent I/O-bound jobs")
+
+# One pooled session for all provider/CDN HTTP calls so keep-alive connections (and their TLS
+# handshakes) are reused across jobs; the pool is sized for every job that can run at once.
+# Idempotent requests (GET/HEAD, not the provider POSTs) are retried on transient gateway errors.
+HTTP_SESSION = requests.Session()
+HTTP_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+_http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=MAX_CONCURRENT_JOBS + MAX_IO_JOBS + MAX_ASYNC_JOBS, max_retries=HTTP_RETRY)
+HTTP_SESSION.mount("https://", _http_adapter)
+HTTP_SESSION.mount("http://", _http_adapter)
+
 # Set REPLICATE_API_TOKEN for the replicate library
 if REPLICATE_API_KEY:
     os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_KEY
@@ -78,16 +187,57 @@ if REPLICATE_API_KEY:
 else:
     print("Worker: No Replicate API key found in environment")
 
+# Shared Replicate clients: every run/poll reuses pooled keep-alive connections (HTTP/2 when h2 is
+# installed). The library builds its sync and async httpx clients from the same kwargs, so the
+# async animation jobs get a client of their own with an async transport.
+_replicate_limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+replicate_client = replicate.Client(
+    api_token=REPLICATE_API_KEY,
+    transport=httpx.HTTPTransport(http2=HTTP2_AVAILABLE, limits=_replicate_limits),
+)
+replicate_async_client = replicate.Client(
+    api_token=REPLICATE_API_KEY,
+    transport=httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=_replicate_limits),
+)
+
 try:
+    # Shared by every worker thread; concurrent Vision calls multiplex over HTTP/2 when available
     openai_client = OpenAI(
         api_key=os.environ.get("OPENAI_API_KEY"),
         organization=os.environ.get("OPENAI_ORG_ID"),
+        http_client=httpx.Client(
+            http2=HTTP2_AVAILABLE,
+            timeout=120,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        ),
     )
     print("Worker: OpenAI client initialized successfully.")
 except Exception as e:
     openai_client = None
     print(f"Worker: OpenAI client could not be initialized: {e}")
 
+# --- REPLICATE MODEL CACHE ---
+# replicate_client.run() re-fetches the version metadata for pinned refs ("owner/name:version") on every call.
+# Resolve each pinned ref once per worker process and hand the cached Version object to replicate_client.run().
+REPLICATE_MODEL_CACHE = {}
+
+def get_replicate_model(model_ref):
+    """Return a cached Replicate Version for pinned refs, or the ref itself for unpinned models."""
+    cached = REPLICATE_MODEL_CACHE.get(model_ref)
+    if cached is not None:
+        return cached
+    if ':' not in model_ref:
+        # Unpinned models run against the model endpoint - there is no version to resolve
+        return model_ref
+    try:
+        model_name, version_id = model_ref.split(':', 1)
+        version = replicate_client.models.get(model_name).versions.get(version_id)
+    except Exception as e:
+        print(f"Worker: could not resolve Replicate model {model_ref}, using ref directly: {e}")
+        return model_ref
+    REPLICATE_MODEL_CACHE[model_ref] = version
+    return version
+
 DATABASE_PATH = 'jobs.db'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
@@ -97,11 +247,32 @@ UPLOADS_FOLDER = os.path.join(STATIC_FOLDER, 'uploads')
 TRANSPARENT_VIDEOS_FOLDER = os.path.join(STATIC_FOLDER, 'library', 'transparent_videos')
 os.makedirs(TRANSPARENT_VIDEOS_FOLDER, exist_ok=True)
 
+# Folder prefixes so hot paths can build file paths by concatenation instead of os.path.join
+BASE_DIR_PREFIX = BASE_DIR + os.sep
+LIBRARY_PREFIX = LIBRARY_FOLDER + os.sep
+TRANSPARENT_VIDEOS_PREFIX = TRANSPARENT_VIDEOS_FOLDER + os.sep
+
+def local_static_path(src):
+    """Map a web path like '/static/library/x.png' (or 'static/...') to its file under BASE_DIR."""
+    return BASE_DIR_PREFIX + src.lstrip('/')
+
+# --- SCRATCH FOLDER FOR TEMP FILES ---
+# Downloads and intermediate frames live here instead of next to library outputs.
+# Point SCRATCH_DIR at a tmpfs (e.g. /dev/shm/pipeline) for RAM-backed temp files.
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", os.path.join(STATIC_FOLDER, 'tmp'))
+os.makedirs(SCRATCH_DIR, exist_ok=True)
+
 # --- TEXTURE FOLDERS FOR STICKER EFFECT ---
 TEXTURE_DISPLACEMENT_FOLDER = os.path.join(STATIC_FOLDER, 'textures', 'displacement')
 TEXTURE_SCREEN_FOLDER = os.path.join(STATIC_FOLDER, 'textures', 'screen')
 os.makedirs(TEXTURE_DISPLACEMENT_FOLDER, exist_ok=True)
 os.makedirs(TEXTURE_SCREEN_FOLDER, exist_ok=True)
+# Textures are resized with cv2 (INTER_AREA down, INTER_LINEAR up); set STICKER_TEXTURE_LANCZOS=true for PIL LANCZOS
+STICKER_TEXTURE_LANCZOS = os.environ.get("STICKER_TEXTURE_LANCZOS", "false").lower() == "true"
+# Sticker frames are independent; the numba/cv2/NumPy work releases the GIL, so frames run on a thread pool
+STICKER_FRAME_WORKERS = max(1, min(MAX_CONCURRENT_JOBS * 2, os.cpu_count() or 1))
+# Frames per pipe read / pool task / encoder write in the sticker video pipeline
+STICKER_FRAME_BATCH = 4
 
 # --- STICKER EFFECT FUNCTIONS ---
 def load_texture_sequence(folder_path):
@@ -121,39 +292,96 @@ def load_texture_sequence(folder_path):
         print(f"   ❌ Error loading textures from {folder_path}: {e}")
         return []
 
+def _div255(values):
+    """Rounded values / 255 for uint16 arrays in 0..255*255 (exact; t = x + 128, (t + (t >> 8)) >> 8)."""
+    values = values + 128
+    return (values + (values >> 8)) >> 8
+
+def _mix_opacity(result_rgb, base_rgb, opacity):
+    """result * opacity + base * (1 - opacity) on uint16 RGB with a 0-255 integer weight."""
+    weight = np.uint16(round(min(max(opacity, 0.0), 1.0) * 255))
+    return _div255(result_rgb * weight + base_rgb * (np.uint16(255) - weight))
+
+def _resize_texture(texture, size):
+    """Resize a PIL texture to size (w, h) and return it as an RGBA uint8 array."""
+    texture = texture.convert('RGBA')
+    if STICKER_TEXTURE_LANCZOS:
+        return np.asarray(texture.resize(size, Image.LANCZOS))
+    array = np.asarray(texture)
+    if texture.size == tuple(size):
+        return array
+    shrinking = size[0] * size[1] < texture.size[0] * texture.size[1]
+    return cv2.resize(array, tuple(size), interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+
+@functools.lru_cache(maxsize=2)
+def _load_resized_textures(folder_path, fingerprint, size):
+    """
+    Texture sequence resized to size, as read-only contiguous RGBA uint8 arrays (cached per fingerprint/size).
+    The frames are views into one (n, h, w, 4) block, so a sequence is a single allocation.
+    Two entries = both folders at one resolution; a new resolution evicts the old full-size sequences.
+    """
+    textures = load_texture_sequence(folder_path)
+    block = np.empty((len(textures), size[1], size[0], 4), dtype=np.uint8)
+    for i, texture in enumerate(textures):
+        block[i] = _resize_texture(texture, size)
+    block.flags.writeable = False
+    return tuple(block)
+
+def get_sticker_textures(folder_path, size):
+    """
+    Texture sequence from folder_path pre-resized to the frame size (w, h), shared across frames and jobs.
+    The cache key includes each PNG's name and mtime (one scandir, no decoding), so added, removed
+    and overwritten textures are all picked up.
+    """
+    try:
+        with os.scandir(folder_path) as entries:
+            fingerprint = tuple(sorted((entry.name, entry.stat().st_mtime_ns)
+                                       for entry in entries if entry.name.lower().endswith('.png')))
+    except OSError:
+        return ()
+    return _load_resized_textures(folder_path, fingerprint, tuple(size))
+
+def read_rgba_png(path):
+    """Read a PNG as an RGBA uint8 array with cv2 (libpng), adding opaque alpha to RGB files."""
+    array = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if array is None:
+        raise IOError(f"Could not read image: {path}")
+    if array.ndim == 2:
+        return cv2.cvtColor(array, cv2.COLOR_GRAY2RGBA)
+    if array.shape[2] == 3:
+        return cv2.cvtColor(array, cv2.COLOR_BGR2RGBA)
+    return cv2.cvtColor(array, cv2.COLOR_BGRA2RGBA)
+
+def write_rgba_png(path, rgba_array):
+    """Write an RGBA uint8 array as a PNG with cv2 at compression level 1 (fast; frames are re-encoded or zipped later)."""
+    if not cv2.imwrite(path, cv2.cvtColor(rgba_array, cv2.COLOR_RGBA2BGRA), [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+        raise IOError(f"Could not write image: {path}")
+
+def _texture_array(texture, size):
+    """RGBA uint8 array for a sticker texture: cached arrays pass through, PIL textures are resized to size."""
+    if texture is None or isinstance(texture, np.ndarray):
+        return texture
+    return _resize_texture(texture, size)
+
 def blend_multiply(base, overlay, opacity=1.0):
     """Multiply blend mode with clipping mask (like Photoshop/After Effects)."""
     try:
-        # STEP 1: Save original alpha FIRST
-        original_alpha = base.split()[3]
-        alpha_array = np.array(original_alpha)
-        
-        # STEP 2: Convert to numpy arrays
-        base_array = np.array(base)
-        overlay_array = np.array(overlay)
-        
-        # STEP 3: Create alpha mask (3D for RGB masking)
-        alpha_mask = (alpha_array > 0).astype(float)
-        alpha_mask_3d = np.stack([alpha_mask, alpha_mask, alpha_mask], axis=2)
+        # Integer math on uint8 data (widened to uint16 for the products) - no float buffers
+        base_array = np.asarray(base.convert('RGBA'))
+        overlay_array = np.asarray(overlay.convert('RGBA'))
+        alpha_array = base_array[:, :, 3]
+        base_rgb = base_array[:, :, :3].astype(np.uint16)
         
-        # STEP 4: Apply texture ONLY where alpha > 0 (clipping mask)
-        base_rgb = base_array[:, :, :3].astype(float) / 255.0
-        overlay_rgb = overlay_array[:, :, :3].astype(float) / 255.0
-        
-        # Multiply formula: base * overlay
-        result_rgb = base_rgb * overlay_rgb
+        # Multiply formula: base * overlay / 255
+        result_rgb = _div255(base_rgb * overlay_array[:, :, :3])
         
         # Apply opacity
         if opacity < 1.0:
-            result_rgb = result_rgb * opacity + base_rgb * (1 - opacity)
-        
-        # STEP 5: Apply alpha mask - effect ONLY on non-transparent pixels
-        result_rgb = result_rgb * alpha_mask_3d + (base_rgb * (1 - alpha_mask_3d))
+            result_rgb = _mix_opacity(result_rgb, base_rgb, opacity)
         
-        # Convert back to uint8
-        result_array = np.zeros_like(base_array)
-        result_array[:, :, :3] = (result_rgb * 255).astype(np.uint8)
-        result_array[:, :, 3] = alpha_array  # CRITICAL: Restore original alpha
+        # Effect ONLY on non-transparent pixels (clipping mask); original alpha kept as-is
+        result_array = base_array.copy()
+        np.copyto(result_array[:, :, :3], result_rgb, where=alpha_array[:, :, None] > 0, casting='unsafe')
         
         return Image.fromarray(result_array, 'RGBA')
     except Exception as e:
@@ -163,36 +391,22 @@ def blend_multiply(base, overlay, opacity=1.0):
 def blend_add(base, overlay, opacity=1.0):
     """Add blend mode with clipping mask (like Photoshop/After Effects)."""
     try:
-        # STEP 1: Save original alpha FIRST
-        original_alpha = base.split()[3]
-        alpha_array = np.array(original_alpha)
-        
-        # STEP 2: Convert to numpy arrays
-        base_array = np.array(base)
-        overlay_array = np.array(overlay)
-        
-        # STEP 3: Create alpha mask (3D for RGB masking)
-        alpha_mask = (alpha_array > 0).astype(float)
-        alpha_mask_3d = np.stack([alpha_mask, alpha_mask, alpha_mask], axis=2)
+        # Integer math on uint8 data (widened to uint16 for the sums) - no float buffers
+        base_array = np.asarray(base.convert('RGBA'))
+        overlay_array = np.asarray(overlay.convert('RGBA'))
+        alpha_array = base_array[:, :, 3]
+        base_rgb = base_array[:, :, :3].astype(np.uint16)
         
-        # STEP 4: Apply texture ONLY where alpha > 0 (clipping mask)
-        base_rgb = base_array[:, :, :3].astype(float) / 255.0
-        overlay_rgb = overlay_array[:, :, :3].astype(float) / 255.0
-        
-        # Add (Linear Dodge) formula: base + overlay (clamped to 1.0)
-        result_rgb = np.clip(base_rgb + overlay_rgb, 0, 1.0)
+        # Add (Linear Dodge) formula: base + overlay, clamped to 255
+        result_rgb = np.minimum(base_rgb + overlay_array[:, :, :3], np.uint16(255))
         
         # Apply opacity
         if opacity < 1.0:
-            result_rgb = result_rgb * opacity + base_rgb * (1 - opacity)
-        
-        # STEP 5: Apply alpha mask - effect ONLY on non-transparent pixels
-        result_rgb = result_rgb * alpha_mask_3d + (base_rgb * (1 - alpha_mask_3d))
+            result_rgb = _mix_opacity(result_rgb, base_rgb, opacity)
         
-        # Convert back to uint8
-        result_array = np.zeros_like(base_array)
-        result_array[:, :, :3] = (result_rgb * 255).astype(np.uint8)
-        result_array[:, :, 3] = alpha_array  # CRITICAL: Restore original alpha
+        # Effect ONLY on non-transparent pixels (clipping mask); original alpha kept as-is
+        result_array = base_array.copy()
+        np.copyto(result_array[:, :, :3], result_rgb, where=alpha_array[:, :, None] > 0, casting='unsafe')
         
         return Image.fromarray(result_array, 'RGBA')
     except Exception as e:
@@ -202,22 +416,23 @@ def blend_add(base, overlay, opacity=1.0):
 def apply_displacement(image, displacement_map, intensity=5):
     """Warp image using displacement map."""
     try:
-        # Convert to numpy arrays
-        img_array = np.array(image)
+        # Convert to numpy arrays (read-only view is enough for cv2.remap)
+        img_array = np.asarray(image)
         h, w = img_array.shape[:2]
         
         # Resize displacement map to match image size
         disp_map = displacement_map.resize((w, h), Image.Resampling.BILINEAR).convert('L')
-        disp_array = np.array(disp_map).astype(float) / 255.0  # Normalize to 0-1
+        disp_gray = np.asarray(disp_map)
         
-        # Create displacement vectors (center at 0.5, scale by intensity)
-        disp_x = (disp_array - 0.5) * intensity
-        disp_y = (disp_array - 0.5) * intensity
-        
-        # Create mesh grid for remapping
-        map_x, map_y = np.meshgrid(np.arange(w), np.arange(h))
-        map_x = (map_x + disp_x).astype(np.float32)
-        map_y = (map_y + disp_y).astype(np.float32)
+        # Remap coordinates: (x + d, y + d) with d = (gray / 255 - 0.5) * intensity
+        map_x = np.empty((h, w), np.float32)
+        map_y = np.empty((h, w), np.float32)
+        if NUMBA_AVAILABLE:
+            _build_displacement_maps(disp_gray, float(intensity), map_x, map_y)
+        else:
+            disp_offset = (disp_gray / 255.0 - 0.5) * intensity
+            np.add(np.arange(w)[None, :], disp_offset, out=map_x, casting='unsafe')
+            np.add(np.arange(h)[:, None], disp_offset, out=map_y, casting='unsafe')
         
         # Remap the image
         warped = cv2.remap(img_array, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
@@ -227,12 +442,37 @@ def apply_displacement(image, displacement_map, intensity=5):
         print(f"   ⚠️ Displacement failed: {e}, returning original")
         return image
 
+@functools.lru_cache(maxsize=32)
+def _sobel_kernels(dx, dy, ksize):
+    """Separable (kx, ky) float32 Sobel kernels, built once per derivative order and size."""
+    kernel_x, kernel_y = cv2.getDerivKernels(dx, dy, ksize, ktype=cv2.CV_32F)
+    kernel_x.flags.writeable = False
+    kernel_y.flags.writeable = False
+    return kernel_x, kernel_y
+
+@functools.lru_cache(maxsize=32)
+def _gaussian_kernel(ksize, ktype):
+    """1-D Gaussian kernel with GaussianBlur's default sigma for ksize, built once per size and type."""
+    kernel = cv2.getGaussianKernel(ksize, 0, ktype=ktype)
+    kernel.flags.writeable = False
+    return kernel
+
+def _sobel(src, dx, dy, ksize):
+    """cv2.Sobel(src, CV_32F, dx, dy, ksize) through sepFilter2D with cached kernels (same result)."""
+    kernel_x, kernel_y = _sobel_kernels(dx, dy, ksize)
+    return cv2.sepFilter2D(src, cv2.CV_32F, kernel_x, kernel_y)
+
+def _gaussian_blur(src, ksize):
+    """cv2.GaussianBlur(src, (ksize, ksize), 0) for float masks through sepFilter2D with a cached kernel."""
+    kernel = _gaussian_kernel(ksize, cv2.CV_64F if src.dtype == np.float64 else cv2.CV_32F)
+    return cv2.sepFilter2D(src, -1, kernel, kernel)
+
 def apply_surface_bevel(image, depth=3, highlight=0.5, shadow=0.5):
     """Apply bevel & emboss effect using After Effects-style relief map (Overlay blend)."""
     try:
         # Convert to grayscale for relief calculation
         gray = image.convert('L')
-        gray_array = np.array(gray, dtype=np.float32)
+        gray_array = np.asarray(gray, dtype=np.float32)
         
         # Create emboss kernel (relief map)
         kernel_size = max(3, depth)
@@ -240,21 +480,24 @@ def apply_surface_bevel(image, depth=3, highlight=0.5, shadow=0.5):
             kernel_size += 1
         
         # Sobel filters for X and Y gradients
-        grad_x = cv2.Sobel(gray_array, cv2.CV_32F, 1, 0, ksize=kernel_size)
-        grad_y = cv2.Sobel(gray_array, cv2.CV_32F, 0, 1, ksize=kernel_size)
+        grad_x = _sobel(gray_array, 1, 0, kernel_size)
+        grad_y = _sobel(gray_array, 0, 1, kernel_size)
+        
+        if NUMBA_AVAILABLE:
+            # Relief + Overlay blend per pixel, only the taken Overlay branch is evaluated
+            result_array = _surface_bevel_kernel(np.asarray(image), grad_x, grad_y,
+                                                 np.float32(highlight), np.float32(shadow))
+            return Image.fromarray(result_array, 'RGBA')
         
         # Combine gradients to create relief map
         relief = grad_x * highlight - grad_y * shadow
         relief = relief + 128  # Shift to mid-gray (neutral for Overlay)
         relief = np.clip(relief, 0, 255).astype(np.uint8)
         
-        # Create relief RGB image
-        relief_rgb = np.stack([relief, relief, relief], axis=2)
-        relief_img = Image.fromarray(relief_rgb, 'RGB')
-        
-        # Apply Overlay blend mode
-        base_rgb = np.array(image.convert('RGB')).astype(float) / 255.0
-        overlay_rgb = np.array(relief_img).astype(float) / 255.0
+        # Apply Overlay blend mode (the gray relief broadcasts over RGB)
+        image_array = np.asarray(image)
+        base_rgb = image_array[:, :, :3] / 255.0
+        overlay_rgb = (relief / 255.0)[:, :, None]
         
         # Overlay formula: base < 0.5 ? 2*base*overlay : 1 - 2*(1-base)*(1-overlay)
         result_rgb = np.where(
@@ -262,12 +505,12 @@ def apply_surface_bevel(image, depth=3, highlight=0.5, shadow=0.5):
             2 * base_rgb * overlay_rgb,
             1 - 2 * (1 - base_rgb) * (1 - overlay_rgb)
         )
-        result_rgb = (result_rgb * 255).astype(np.uint8)
         
         # Restore alpha
-        result = Image.fromarray(result_rgb, 'RGB').convert('RGBA')
-        result.putalpha(image.split()[3])
-        return result
+        result_array = np.empty(image_array.shape, np.uint8)
+        result_array[:, :, :3] = result_rgb * 255
+        result_array[:, :, 3] = image_array[:, :, 3]
+        return Image.fromarray(result_array, 'RGBA')
     except Exception as e:
         print(f"   ⚠️ Surface bevel failed: {e}, returning original")
         return image
@@ -275,60 +518,71 @@ def apply_surface_bevel(image, depth=3, highlight=0.5, shadow=0.5):
 def apply_alpha_bevel(image, size=15, blur=2, angle=70, highlight_intensity=0.6, shadow_intensity=0.6):
     """Apply bevel effect to the alpha channel boundaries."""
     try:
-        # Get the current alpha channel
-        alpha = image.split()[3]
-        alpha_array = np.array(alpha, dtype=np.float32)
+        # Get the current alpha channel (a view of the image array, no split)
+        image_array = np.asarray(image)
+        alpha_array = image_array[:, :, 3].astype(np.float32)
         
         # Calculate gradients (edge normals) of the alpha channel
         kernel_size = min(size, 31)
         if kernel_size % 2 == 0:
             kernel_size += 1  # Must be odd
-        gradient_x = cv2.Sobel(alpha_array, cv2.CV_32F, 1, 0, ksize=min(kernel_size, 31))
-        gradient_y = cv2.Sobel(alpha_array, cv2.CV_32F, 0, 1, ksize=min(kernel_size, 31))
-        
-        # Calculate the angle of each edge normal (in radians)
-        edge_angles = np.arctan2(gradient_y, gradient_x)
+        gradient_x = _sobel(alpha_array, 1, 0, min(kernel_size, 31))
+        gradient_y = _sobel(alpha_array, 0, 1, min(kernel_size, 31))
         
         # Convert light angle from degrees to radians
         light_angle_rad = np.deg2rad(angle)
         
-        # Calculate how aligned each edge is with the light direction
-        angle_diff = edge_angles - light_angle_rad
-        alignment = np.cos(angle_diff)
-        
-        # Calculate edge magnitude (strength)
-        edge_magnitude = np.sqrt(gradient_x**2 + gradient_y**2)
-        edge_magnitude = edge_magnitude / (edge_magnitude.max() + 1e-8)  # Normalize
-        
-        # Separate highlights and shadows with different intensities
-        highlight_mask = np.maximum(0, alignment) * edge_magnitude * highlight_intensity
-        shadow_mask = np.maximum(0, -alignment) * edge_magnitude * shadow_intensity
+        if NUMBA_AVAILABLE:
+            # Angle, magnitude and both masks in one kernel (no per-step H x W temporaries)
+            highlight_mask, shadow_mask = _alpha_bevel_masks(
+                gradient_x, gradient_y, np.cos(light_angle_rad), np.sin(light_angle_rad),
+                highlight_intensity, shadow_intensity)
+        else:
+            # Calculate the angle of each edge normal (in radians)
+            edge_angles = np.arctan2(gradient_y, gradient_x)
+            
+            # Calculate how aligned each edge is with the light direction
+            angle_diff = edge_angles - light_angle_rad
+            alignment = np.cos(angle_diff)
+            
+            # Calculate edge magnitude (strength)
+            edge_magnitude = np.sqrt(gradient_x**2 + gradient_y**2)
+            edge_magnitude = edge_magnitude / (edge_magnitude.max() + 1e-8)  # Normalize
+            
+            # Separate highlights and shadows with different intensities
+            highlight_mask = np.maximum(0, alignment) * edge_magnitude * highlight_intensity
+            shadow_mask = np.maximum(0, -alignment) * edge_magnitude * shadow_intensity
         
         # Blur the effect to create smooth bevels
         if blur > 0:
             blur_kernel = blur * 2 + 1
             if blur_kernel % 2 == 0:
                 blur_kernel += 1
-            highlight_mask = cv2.GaussianBlur(highlight_mask, (blur_kernel, blur_kernel), 0)
-            shadow_mask = cv2.GaussianBlur(shadow_mask, (blur_kernel, blur_kernel), 0)
+            highlight_mask = _gaussian_blur(highlight_mask, blur_kernel)
+            shadow_mask = _gaussian_blur(shadow_mask, blur_kernel)
         
         # Apply the bevel effect to the image
-        result_array = np.array(image)
-        original_alpha = alpha_array.astype(np.uint8)
-        
-        # Apply highlights and shadows to RGB channels separately
+        result_array = image_array.copy()
+        original_alpha = image_array[:, :, 3]
+        
+        if NUMBA_AVAILABLE:
+            # Highlights then shadows on RGB in place; alpha is not touched
+            _apply_alpha_bevel_masks(result_array, highlight_mask, shadow_mask)
+            return Image.fromarray(result_array, 'RGBA')
+        
+        # Apply highlights and shadows to RGB channels separately, scaling the masks once
+        # and reusing one scratch buffer (same promotion and truncation as per-step astype)
+        highlight_255 = highlight_mask * 255
+        shadow_255 = shadow_mask * 255
+        scratch = np.empty(highlight_255.shape, np.result_type(highlight_255, shadow_255, np.float32))
         for c in range(3):  # RGB channels
+            channel = result_array[:, :, c]
             # Brighten with highlights
-            result_array[:, :, c] = np.clip(
-                result_array[:, :, c].astype(np.float32) + highlight_mask * 255,
-                0, 255
-            ).astype(np.uint8)
-            
+            np.add(channel, highlight_255, out=scratch)
+            channel[...] = np.clip(scratch, 0, 255, out=scratch)
             # Darken with shadows
-            result_array[:, :, c] = np.clip(
-                result_array[:, :, c].astype(np.float32) - shadow_mask * 255,
-                0, 255
-            ).astype(np.uint8)
+            np.subtract(channel, shadow_255, out=scratch)
+            channel[...] = np.clip(scratch, 0, 255, out=scratch)
         
         # Keep the original alpha unchanged
         result_array[:, :, 3] = original_alpha
@@ -339,213 +593,617 @@ def apply_alpha_bevel(image, size=15, blur=2, angle=70, highlight_intensity=0.6,
         return image
 
 def apply_drop_shadow(image, blur=10, offset_x=5, offset_y=5, opacity=0.5):
-    """Apply drop shadow to image."""
+    """
+    Apply drop shadow to image.
+    Works on the alpha array; the composite reproduces the PIL paste() calls it replaced
+    (mask-weighted blend of every band with a black shadow), blur is a Gaussian with sigma = blur.
+    """
     try:
-        # Create shadow layer
-        alpha = image.split()[3]
-        shadow = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        shadow.putalpha(alpha)
+        image_array = np.asarray(image)
+        alpha = cv2.extractChannel(image_array, 3)
+        height, width = alpha.shape
         
         # Blur the shadow
-        if blur > 0:
-            shadow = shadow.filter(ImageFilter.GaussianBlur(radius=blur))
-        
-        # Adjust shadow opacity
-        shadow_alpha = shadow.split()[3]
-        shadow_alpha = ImageEnhance.Brightness(shadow_alpha).enhance(opacity)
-        shadow.putalpha(shadow_alpha)
-        
-        # Create result image with shadow
-        result = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        result.paste(shadow, (offset_x, offset_y), shadow)
-        result.paste(image, (0, 0), image)
-        
-        return result
+        shadow_alpha = cv2.GaussianBlur(alpha, (0, 0), sigmaX=blur) if blur > 0 else alpha
+        
+        # Adjust shadow opacity (truncating, like ImageEnhance.Brightness) through a 256-entry table
+        opacity_lut = np.clip(np.arange(256) * np.float32(opacity), 0, 255).astype(np.uint8)
+        shadow_alpha = cv2.LUT(shadow_alpha, opacity_lut)
+        
+        # Offset the shadow, clipped at the frame edges
+        offset_x, offset_y = int(offset_x), int(offset_y)
+        shifted = np.zeros_like(alpha)
+        y0, y1 = max(offset_y, 0), min(height, height + offset_y)
+        x0, x1 = max(offset_x, 0), min(width, width + offset_x)
+        if y1 > y0 and x1 > x0:
+            shifted[y0:y1, x0:x1] = shadow_alpha[y0 - offset_y:y1 - offset_y, x0 - offset_x:x1 - offset_x]
+        
+        # Shadow pasted onto transparent black, then the image pasted over it with its own alpha
+        # RGB: round(rgb * alpha / 255) (cv2 rounds exactly like PIL's blend); alpha is rewritten below
+        result = cv2.multiply(image_array, cv2.cvtColor(alpha, cv2.COLOR_GRAY2BGRA), scale=1 / 255)
+        fg_alpha = alpha.astype(np.uint16)
+        shifted = shifted.astype(np.uint16)
+        result[:, :, 3] = _div255(_div255(shifted * shifted) * (255 - fg_alpha) + fg_alpha * fg_alpha)
+        
+        return Image.fromarray(result, 'RGBA')
     except Exception as e:
         print(f"   ⚠️ Drop shadow failed: {e}, returning original")
         return image
 
-def apply_sticker_effect_to_frame(frame_pil, disp_texture, screen_texture, 
-                                   displacement_intensity=50, darker_opacity=1.0, screen_opacity=0.7,
-                                   enable_bevel=False, bevel_depth=3, bevel_highlight=0.5, bevel_shadow=0.5,
-                                   enable_alpha_bevel=False, alpha_bevel_size=15, alpha_bevel_blur=2, 
-                                   alpha_bevel_angle=70, alpha_bevel_highlight=0.6, alpha_bevel_shadow=0.6,
-                                   enable_shadow=False, shadow_blur=0, shadow_x=1, shadow_y=1, shadow_opacity=1.0):
-    """Apply sticker effect to a single frame with all advanced effects."""
+if NUMBA_AVAILABLE:
+    @njit(cache=True, nogil=True)
+    def _reflect_index(i, n):
+        """cv2.BORDER_REFLECT indexing (fedcba|abcdefgh|hgfedcb)."""
+        if i < 0:
+            i = -i - 1
+        if i >= n:
+            i = 2 * n - i - 1
+        return min(max(i, 0), n - 1)
+
+    @njit(cache=True, nogil=True)
+    def _div255_int(value):
+        """Rounded value / 255 for an int in 0..255*255 - the scalar form of _div255."""
+        value += 128
+        return (value + (value >> 8)) >> 8
+
+    @njit(cache=True, nogil=True)
+    def _build_displacement_maps(disp_gray, intensity, map_x, map_y):
+        """Fill the float32 cv2.remap maps for apply_displacement in one pass (no meshgrid/offset temporaries)."""
+        for y in range(disp_gray.shape[0]):
+            for x in range(disp_gray.shape[1]):
+                offset = (disp_gray[y, x] / 255.0 - 0.5) * intensity
+                map_x[y, x] = x + offset
+                map_y[y, x] = y + offset
+
+    @njit(cache=True, nogil=True)
+    def _surface_bevel_kernel(rgba, grad_x, grad_y, highlight, shadow):
+        """
+        apply_surface_bevel in one pass: relief = clip(gx * highlight - gy * shadow + 128) Overlay-blended
+        onto RGB, alpha copied. Same float32/float64 operations as the NumPy path (bit-identical).
+        """
+        height, width = grad_x.shape
+        out = np.empty((height, width, 4), np.uint8)
+        for y in range(height):
+            for x in range(width):
+                relief = grad_x[y, x] * highlight - grad_y[y, x] * shadow + np.float32(128.0)
+                relief = min(max(relief, np.float32(0.0)), np.float32(255.0))
+                overlay = int(relief) / 255.0
+                for c in range(3):
+                    base = rgba[y, x, c] / 255.0
+                    if base < 0.5:
+                        value = 2 * base * overlay
+                    else:
+                        value = 1 - 2 * (1 - base) * (1 - overlay)
+                    out[y, x, c] = int(value * 255)
+                out[y, x, 3] = rgba[y, x, 3]
+        return out
+
+    @njit(cache=True, nogil=True)
+    def _alpha_bevel_masks(gradient_x, gradient_y, light_cos, light_sin, highlight_intensity, shadow_intensity):
+        """
+        apply_alpha_bevel highlight/shadow masks from the alpha Sobel gradients.
+        cos(edge_angle - light_angle) * |g| / max|g| is the dot product g . light / max|g|, so no trig per pixel.
+        Squares are taken in float64: large Sobel kernels overflow float32.
+        """
+        height, width = gradient_x.shape
+        max_sq = 0.0
+        for y in range(height):
+            for x in range(width):
+                gx = np.float64(gradient_x[y, x])
+                gy = np.float64(gradient_y[y, x])
+                max_sq = max(max_sq, gx * gx + gy * gy)
+        scale = 1.0 / (np.sqrt(max_sq) + 1e-8)
+        highlight = np.empty((height, width), np.float32)
+        shadow = np.empty((height, width), np.float32)
+        for y in range(height):
+            for x in range(width):
+                aligned = (gradient_x[y, x] * light_cos + gradient_y[y, x] * light_sin) * scale
+                highlight[y, x] = max(aligned, 0.0) * highlight_intensity
+                shadow[y, x] = max(-aligned, 0.0) * shadow_intensity
+        return highlight, shadow
+
+    @njit(cache=True, nogil=True)
+    def _apply_alpha_bevel_masks(rgba, highlight, shadow):
+        """Brighten RGB by highlight * 255 then darken by shadow * 255, clipping (and truncating) after each step."""
+        for y in range(rgba.shape[0]):
+            for x in range(rgba.shape[1]):
+                lift = highlight[y, x] * np.float32(255.0)
+                drop = shadow[y, x] * np.float32(255.0)
+                for c in range(3):
+                    value = np.float32(rgba[y, x, c]) + lift
+                    value = np.float32(int(min(max(value, np.float32(0.0)), np.float32(255.0)))) - drop
+                    rgba[y, x, c] = int(min(max(value, np.float32(0.0)), np.float32(255.0)))
+
+    @njit(cache=True, nogil=True)
+    def _sticker_kernel(frame, disp_gray, disp_rgba, screen_rgba, intensity, multiply_opacity, add_opacity):
+        """
+        Displacement warp + Multiply blend + Add blend in one pass, integer math on uint8 (rounded like _div255).
+        Same steps as apply_displacement -> blend_multiply -> blend_add; opacities are 0-255
+        (0 skips that step) and intensity 0 skips the warp. Blends only touch alpha > 0 pixels.
+        """
+        height, width = frame.shape[0], frame.shape[1]
+        out = np.empty((height, width, 4), np.uint8)
+        pixel = np.empty(4, np.int32)
+        for y in range(height):
+            for x in range(width):
+                # (a) Displacement: bilinear sample at (x + d, y + d), d = (gray / 255 - 0.5) * intensity
+                if intensity != 0:
+                    offset = (disp_gray[y, x] / np.float32(255.0) - np.float32(0.5)) * intensity
+                    sx = x + offset
+                    sy = y + offset
+                    x0 = int(np.floor(sx))
+                    y0 = int(np.floor(sy))
+                    fx = sx - x0
+                    fy = sy - y0
+                    xa = _reflect_index(x0, width)
+                    xb = _reflect_index(x0 + 1, width)
+                    ya = _reflect_index(y0, height)
+                    yb = _reflect_index(y0 + 1, height)
+                    for c in range(4):
+                        top = frame[ya, xa, c] * (1 - fx) + frame[ya, xb, c] * fx
+                        bottom = frame[yb, xa, c] * (1 - fx) + frame[yb, xb, c] * fx
+                        pixel[c] = int(top * (1 - fy) + bottom * fy + np.float32(0.5))
+                else:
+                    for c in range(4):
+                        pixel[c] = frame[y, x, c]
+                
+                if pixel[3] > 0:
+                    for c in range(3):
+                        value = pixel[c]
+                        # (b) Multiply: base * overlay / 255, mixed with base by opacity
+                        if multiply_opacity > 0:
+                            blended = _div255_int(value * disp_rgba[y, x, c])
+                            value = _div255_int(blended * multiply_opacity + value * (255 - multiply_opacity))
+                        # (c) Add (linear dodge): min(255, base + overlay), mixed by opacity
+                        if add_opacity > 0:
+                            blended = min(255, value + screen_rgba[y, x, c])
+                            value = _div255_int(blended * add_opacity + value * (255 - add_opacity))
+                        pixel[c] = value
+                
+                for c in range(4):
+                    out[y, x, c] = pixel[c]
+        return out
+
+def _opacity_to_u8(opacity):
+    """0.0-1.0 opacity as the 0-255 integer weight used by _sticker_kernel."""
+    return int(round(min(max(opacity, 0.0), 1.0) * 255))
+
+def apply_texture_blends_fused(frame_pil, disp_texture, screen_texture, displacement_intensity, darker_opacity, screen_opacity):
+    """
+    Steps 1-3 of the sticker effect (displacement, Multiply, Add) as a single _sticker_kernel pass.
+    Textures are frame-sized RGBA uint8 arrays (or None).
+    """
+    frame = np.asarray(frame_pil.convert('RGBA'))
+    empty_rgba = np.zeros((1, 1, 4), np.uint8)
+    use_disp = disp_texture is not None
+    use_screen = screen_texture is not None and screen_opacity > 0
+    intensity = float(displacement_intensity) if use_disp and displacement_intensity > 0 else 0.0
+    disp_gray = np.asarray(Image.fromarray(disp_texture, 'RGBA').convert('L')) if intensity else np.zeros((1, 1), np.uint8)
+    disp_rgba = disp_texture if use_disp else empty_rgba
+    screen_rgba = screen_texture if use_screen else empty_rgba
+    result = _sticker_kernel(
+        frame, disp_gray, disp_rgba, screen_rgba, np.float32(intensity),
+        _opacity_to_u8(darker_opacity) if use_disp else 0,
+        _opacity_to_u8(screen_opacity) if use_screen else 0
+    )
+    return Image.fromarray(result, 'RGBA')
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class StickerSettings:
+    """Sticker effect parameters, read once per job from the keying settings (same names and defaults)."""
+    displacement_intensity: float = 50
+    darker_opacity: float = 1.0
+    screen_opacity: float = 0.7
+    enable_bevel: bool = False
+    bevel_depth: float = 3
+    bevel_highlight: float = 0.5
+    bevel_shadow: float = 0.5
+    enable_alpha_bevel: bool = False
+    alpha_bevel_size: int = 15
+    alpha_bevel_blur: int = 2
+    alpha_bevel_angle: float = 70
+    alpha_bevel_highlight: float = 0.6
+    alpha_bevel_shadow: float = 0.6
+    enable_shadow: bool = False
+    shadow_blur: float = 0
+    shadow_x: int = 1
+    shadow_y: int = 1
+    shadow_opacity: float = 1.0
+
+    @classmethod
+    def from_keying_settings(cls, settings):
+        """The sticker fields of a keying settings dict; missing keys keep their defaults, other keys are ignored."""
+        return cls(**{f.name: settings[f.name] for f in fields(cls) if f.name in settings})
+
+def apply_sticker_effect_to_frame(frame_pil, disp_texture, screen_texture, sticker):
+    """
+    Apply sticker effect to a single frame with all advanced effects (parameters from a StickerSettings).
+    Textures are frame-sized arrays from get_sticker_textures, or PIL images (resized here).
+    """
     try:
-        # Resize textures to match frame size
-        if disp_texture:
-            disp_texture = disp_texture.resize(frame_pil.size, Image.LANCZOS)
-        if screen_texture:
-            screen_texture = screen_texture.resize(frame_pil.size, Image.LANCZOS)
-        
-        # Step 1: Apply displacement using displacement texture
-        if disp_texture and displacement_intensity > 0:
-            frame_pil = apply_displacement(frame_pil, disp_texture, displacement_intensity)
-        
-        # Step 2: Apply Multiply blend (shadows/creases) using displacement texture
-        if disp_texture and darker_opacity > 0:
-            frame_pil = blend_multiply(frame_pil, disp_texture, darker_opacity)
-        
-        # Step 3: Apply Add blend (highlights) using screen texture
-        if screen_texture and screen_opacity > 0:
-            frame_pil = blend_add(frame_pil, screen_texture, screen_opacity)
+        # Textures as frame-sized RGBA arrays (already the case for cached sequences)
+        disp_texture = _texture_array(disp_texture, frame_pil.size)
+        screen_texture = _texture_array(screen_texture, frame_pil.size)
+        
+        if NUMBA_AVAILABLE and (disp_texture is not None or screen_texture is not None):
+            # Steps 1-3 fused: one read and one write of the frame instead of a float buffer per step
+            frame_pil = apply_texture_blends_fused(frame_pil, disp_texture, screen_texture,
+                                                   sticker.displacement_intensity, sticker.darker_opacity, sticker.screen_opacity)
+        else:
+            disp_image = Image.fromarray(disp_texture, 'RGBA') if disp_texture is not None else None
+            screen_image = Image.fromarray(screen_texture, 'RGBA') if screen_texture is not None else None
+            
+            # Step 1: Apply displacement using displacement texture
+            if disp_image and sticker.displacement_intensity > 0:
+                frame_pil = apply_displacement(frame_pil, disp_image, sticker.displacement_intensity)
+            
+            # Step 2: Apply Multiply blend (shadows/creases) using displacement texture
+            if disp_image and sticker.darker_opacity > 0:
+                frame_pil = blend_multiply(frame_pil, disp_image, sticker.darker_opacity)
+            
+            # Step 3: Apply Add blend (highlights) using screen texture
+            if screen_image and sticker.screen_opacity > 0:
+                frame_pil = blend_add(frame_pil, screen_image, sticker.screen_opacity)
         
         # Step 4: Apply surface bevel & emboss (relief map) if enabled
-        if enable_bevel:
-            frame_pil = apply_surface_bevel(frame_pil, bevel_depth, bevel_highlight, bevel_shadow)
+        if sticker.enable_bevel:
+            frame_pil = apply_surface_bevel(frame_pil, sticker.bevel_depth, sticker.bevel_highlight, sticker.bevel_shadow)
         
         # Step 5: Apply alpha bevel (edge effect) if enabled
-        if enable_alpha_bevel:
-            frame_pil = apply_alpha_bevel(frame_pil, alpha_bevel_size, alpha_bevel_blur, 
-                                         alpha_bevel_angle, alpha_bevel_highlight, alpha_bevel_shadow)
+        if sticker.enable_alpha_bevel:
+            frame_pil = apply_alpha_bevel(frame_pil, sticker.alpha_bevel_size, sticker.alpha_bevel_blur, 
+                                         sticker.alpha_bevel_angle, sticker.alpha_bevel_highlight, sticker.alpha_bevel_shadow)
         
         # Step 6: Apply drop shadow if enabled
-        if enable_shadow:
-            frame_pil = apply_drop_shadow(frame_pil, shadow_blur, shadow_x, shadow_y, shadow_opacity)
+        if sticker.enable_shadow:
+            frame_pil = apply_drop_shadow(frame_pil, sticker.shadow_blur, sticker.shadow_x, sticker.shadow_y, sticker.shadow_opacity)
         
         return frame_pil
     except Exception as e:
-        print(f"   ⚠️ Sticker effect failed on frame: {e}")
-        traceback.print_exc()
+        logger.exception("   ⚠️ Sticker effect failed on frame: %s", e)
         return frame_pil
 
+def warm_up_sticker_kernels():
+    """
+    Compile (or load from numba's on-disk cache) the sticker kernels on a tiny frame with the same
+    argument types real frames use, so the first sticker job doesn't pay the JIT latency.
+    """
+    if not NUMBA_AVAILABLE:
+        return
+    start_time = time.time()
+    try:
+        frame = Image.fromarray(np.full((8, 8, 4), 128, np.uint8), 'RGBA')
+        texture = np.full((8, 8, 4), 128, np.uint8)
+        texture.flags.writeable = False  # Like the cached textures from get_sticker_textures
+        apply_sticker_effect_to_frame(frame, texture, texture, StickerSettings(
+            displacement_intensity=10, enable_bevel=True, enable_alpha_bevel=True, alpha_bevel_size=3,
+            alpha_bevel_blur=1, enable_shadow=True))
+        apply_displacement(frame, frame, 5)
+        print(f"Worker: numba sticker kernels ready ({time.time() - start_time:.1f}s)")
+    except Exception as e:
+        print(f"Worker: ⚠️ numba warm-up failed ({e}) - kernels will compile on first use")
+
+def _process_sticker_video_frame(frame, disp_texture, screen_texture, sticker, out=None):
+    """Sticker-process one decoded RGBA frame (h, w, 4) into out (or a new array) and return it; runs on the sticker frame pool."""
+    frame_pil = Image.fromarray(frame, 'RGBA')
+    
+    # Apply sticker effect with all parameters
+    processed_frame = apply_sticker_effect_to_frame(frame_pil, disp_texture, screen_texture, sticker)
+    
+    # CRITICAL: Ensure original alpha is preserved exactly (no modifications to transparent areas)
+    frame_array = out if out is not None else np.empty_like(frame)
+    np.copyto(frame_array, np.asarray(processed_frame.convert('RGBA')))
+    alpha_array = frame[:, :, 3]
+    frame_array[:, :, 3] = alpha_array
+    
+    # Zero out RGB values in fully transparent areas to prevent compression artifacts
+    # Where alpha is 0, set RGB to 0 (fully transparent black); one in-place pass over the RGB slice only
+    frame_array[:, :, :3] *= (alpha_array != 0)[:, :, None]
+    return frame_array
+
+def posterize_frame_step(source_fps, target_fps):
+    """Posterize time keeps every Nth source frame: N = source fps // target fps (at least 1)."""
+    return max(1, int(source_fps / target_fps))
+
+def load_sticker_settings(settings):
+    """StickerSettings for a job's keying settings (logs the main parameters)."""
+    sticker = StickerSettings.from_keying_settings(settings)
+    print(f"      Displacement: {sticker.displacement_intensity}, Multiply: {sticker.darker_opacity}, Add: {sticker.screen_opacity}")
+    print(f"      Surface bevel: {sticker.enable_bevel}, Alpha bevel: {sticker.enable_alpha_bevel}, Drop shadow: {sticker.enable_shadow}")
+    return sticker
+
+def _process_sticker_frame_file(frame_path, disp_texture, screen_texture, sticker):
+    """Sticker-process one keyed PNG in place; returns False if the frame is missing. Runs on the sticker frame pool."""
+    if not os.path.exists(frame_path):
+        return False
+    # Read keyed frame (RGBA, alpha preserved) through cv2 - faster PNG decode than PIL
+    frame_pil = Image.fromarray(read_rgba_png(frame_path), 'RGBA')
+    processed_frame = apply_sticker_effect_to_frame(frame_pil, disp_texture, screen_texture, sticker)
+    # Save processed frame (overwrite the keyed frame)
+    write_rgba_png(frame_path, np.asarray(processed_frame.convert('RGBA')))
+    return True
+
+def _process_sticker_video_batch(frames, disp_batch, screen_batch, sticker, out):
+    """Sticker-process a (n, h, w, 4) block of decoded frames with their per-frame textures into the out block."""
+    for i in range(len(frames)):
+        _process_sticker_video_frame(frames[i], disp_batch[i], screen_batch[i], sticker, out[i])
+    return out
+
+def _process_keyed_video_batch(frames, disp_batch, screen_batch, sticker, out):
+    """RGBA bytes for a batch of keyed BGRA frames into the out block, sticker-processed when sticker settings are given; runs on the sticker frame pool."""
+    for i, bgra_frame in enumerate(frames):
+        cv2.cvtColor(bgra_frame, cv2.COLOR_BGRA2RGBA, dst=out[i])
+        if sticker is not None:
+            processed_frame = apply_sticker_effect_to_frame(Image.fromarray(out[i], 'RGBA'), disp_batch[i], screen_batch[i], sticker)
+            np.copyto(out[i], np.asarray(processed_frame.convert('RGBA')))
+    return out
+
+def read_frames_into(stream, block):
+    """Fill an (n, h, w, 4) block from a raw RGBA pipe; returns the number of whole frames read (fewer only at EOF)."""
+    view = memoryview(block).cast('B')
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled // block[0].nbytes
+
+# GIF export in one ffmpeg pass: frames are decoded once and split between palettegen and paletteuse
+GIF_PALETTE_FILTER = 'split[a][b];[a]palettegen=stats_mode=diff[p];[b][p]paletteuse=dither=bayer:bayer_scale=5'
+
+def _finish_gif_encoder(job_id, gif_encoder, gif_path):
+    """Close a streaming GIF encoder's input and wait for it; a failed GIF is logged and removed (never fails the job)."""
+    with contextlib.suppress(BrokenPipeError):
+        gif_encoder.stdin.close()
+    gif_error = gif_encoder.stderr.read().decode(errors='replace')
+    if gif_encoder.wait() != 0:
+        print(f"   JOB #{job_id}: ⚠️ GIF export failed: {gif_error}")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(gif_path)
+
+def encode_keyed_video_streaming(job_id, video_path, output_path, keying_args, sticker=None, posterize_fps=None, gif_path=None):
+    """
+    Key a video, optionally sticker-process and posterize it, and encode the transparent WebM without
+    writing frame PNGs: keyed frames stream from memory through the sticker frame pool into a rawvideo
+    ffmpeg encoder. Same frames and texture indices as the PNG path. With gif_path the same RGBA frames
+    are also piped into a GIF encoder (gif_path only exists afterwards if that succeeded).
+    Returns an error message or None.
+    """
+    fps = get_video_fps(video_path)
+    output_fps, frame_interval = fps, 1
+    if posterize_fps:
+        # Posterize time: keep every Nth frame, encoded at the target rate for a stop-motion look
+        frame_interval = posterize_frame_step(fps, posterize_fps)
+        output_fps = posterize_fps
+        print(f"   JOB #{job_id}: ⏱️  Posterize time: {fps}fps → {posterize_fps}fps, keeping every {frame_interval} frame(s)")
+    
+    encoder = gif_encoder = None
+    disp_textures = screen_textures = ()
+    pending = collections.deque()
+    max_in_flight = STICKER_FRAME_WORKERS + 1
+    free_blocks = []  # Output blocks go back here once written, so the window reuses a fixed set of buffers
+    frames, frame_indices = [], []
+    written = 0
+    try:
+        with ThreadPoolExecutor(max_workers=STICKER_FRAME_WORKERS, thread_name_prefix="StickerFrame") as executor:
+            def submit_batch():
+                # Textures follow the source frame index, as if every frame had been processed
+                disp_batch = [disp_textures[i % len(disp_textures)] for i in frame_indices] if disp_textures else [None] * len(frames)
+                screen_batch = [screen_textures[i % len(screen_textures)] for i in frame_indices] if screen_textures else [None] * len(frames)
+                out_block = free_blocks.pop() if free_blocks else np.empty((STICKER_FRAME_BATCH,) + frames[0].shape, np.uint8)
+                future = executor.submit(_process_keyed_video_batch, list(frames), disp_batch, screen_batch, sticker, out_block[:len(frames)])
+                pending.append((future, out_block))
+                frames.clear()
+                frame_indices.clear()
+            
+            def write_oldest_batch():
+                nonlocal gif_encoder
+                future, out_block = pending.popleft()
+                rgba_block = future.result()
+                encoder.stdin.write(rgba_block)
+                if gif_encoder is not None:
+                    try:
+                        gif_encoder.stdin.write(rgba_block)
+                    except BrokenPipeError:
+                        # The GIF encoder died; finish it (logs the error) and carry on with the WebM
+                        _finish_gif_encoder(job_id, gif_encoder, gif_path)
+                        gif_encoder = None
+                free_blocks.append(out_block)
+            
+            for kept_idx, bgra_frame in enumerate(iter_keyed_frames(video_path, *keying_args, frame_step=frame_interval)):
+                frame_idx = kept_idx * frame_interval  # Source frame number
+                if encoder is None:
+                    height, width = bgra_frame.shape[:2]
+                    if sticker is not None:
+                        disp_textures = get_sticker_textures(TEXTURE_DISPLACEMENT_FOLDER, (width, height))
+                        screen_textures = get_sticker_textures(TEXTURE_SCREEN_FOLDER, (width, height))
+                        print(f"   JOB #{job_id}: 📦 Loaded {len(disp_textures)} displacement textures, {len(screen_textures)} screen textures")
+                    ffmpeg_cmd = [
+                        'ffmpeg', '-y', '-v', 'error',
+                        '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+                        '-framerate', str(output_fps),
+                        '-i', '-',
+                        *vp9_alpha_encoder_args(15),
+                        output_path
+                    ]
+                    print(f"   📝 FFmpeg command: {' '.join(ffmpeg_cmd)}")
+                    encoder = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+                    if gif_path:
+                        gif_cmd = [
+                            'ffmpeg', '-y', '-v', 'error',
+                            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+                            '-framerate', str(output_fps),
+                            '-i', '-',
+                            '-filter_complex', GIF_PALETTE_FILTER,
+                            gif_path
+                        ]
+                        gif_encoder = subprocess.Popen(gif_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+                
+                frames.append(bgra_frame)
+                frame_indices.append(frame_idx)
+                if len(frames) == STICKER_FRAME_BATCH:
+                    submit_batch()
+                    if len(pending) >= max_in_flight:
+                        write_oldest_batch()
+                written += 1
+                if written % 10 == 0:
+                    print(f"      Processed {written} frames...")
+                if written % 100 == 0:
+                    log_memory(job_id, f"at frame {written}")
+            
+            if frames:
+                submit_batch()
+            while pending:
+                write_oldest_batch()
+        
+        if encoder is None:
+            return "No frames could be decoded from the input video"
+        if gif_encoder is not None:
+            _finish_gif_encoder(job_id, gif_encoder, gif_path)
+        encoder.stdin.close()
+        encoder_error = encoder.stderr.read().decode(errors='replace')
+        if encoder.wait() != 0:
+            print(f"   ❌ FFmpeg encoding error: {encoder_error}")
+            return "FFmpeg encoding failed after sticker effects"
+        print(f"   JOB #{job_id}: ✅ Encoded {written} frames at {output_fps}fps without intermediate PNGs")
+        return None
+    finally:
+        for proc in (encoder, gif_encoder):
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+def write_png_zip(frames_dir, frame_count, zip_path):
+    """
+    Zips the keyed frame_00000.png .. sequence (frame_count frames, named by index - no directory
+    scan) and returns the frame count. PNG data is already deflated, so entries are stored rather
+    than compressed a second time.
+    """
+    import zipfile
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+        for frame_idx in range(frame_count):
+            frame_file = f"frame_{frame_idx:05d}.png"
+            zipf.write(os.path.join(frames_dir, frame_file), arcname=frame_file)
+    return frame_count
+
 def apply_sticker_effect_to_video(input_video_path, output_video_path, 
                                    displacement_intensity=50, darker_opacity=1.0, screen_opacity=0.7,
                                    enable_bevel=False, bevel_depth=3, bevel_highlight=0.5, bevel_shadow=0.5,
                                    enable_alpha_bevel=False, alpha_bevel_size=15, alpha_bevel_blur=2, 
                                    alpha_bevel_angle=70, alpha_bevel_highlight=0.6, alpha_bevel_shadow=0.6,
                                    enable_shadow=False, shadow_blur=0, shadow_x=1, shadow_y=1, shadow_opacity=1.0):
-    """Apply sticker effect to entire video frame-by-frame with animated textures and all advanced effects."""
+    """
+    Apply sticker effect to entire video frame-by-frame with animated textures and all advanced effects.
+    Frames stream as raw RGBA from an ffmpeg decoder, through the sticker frame pool, into an ffmpeg encoder.
+    """
+    decoder = encoder = None
     try:
         print(f"   🎨 Applying sticker effect to video...")
         print(f"      Displacement: {displacement_intensity}, Multiply opacity: {darker_opacity}, Add opacity: {screen_opacity}")
         print(f"      Surface bevel: {enable_bevel}, Alpha bevel: {enable_alpha_bevel}, Drop shadow: {enable_shadow}")
         
-        # Load texture sequences
-        disp_textures = load_texture_sequence(TEXTURE_DISPLACEMENT_FOLDER)
-        screen_textures = load_texture_sequence(TEXTURE_SCREEN_FOLDER)
+        # Get video properties from the stream header
+        stream_info = probe_video_stream(input_video_path)
+        if not stream_info or not stream_info[1] or not stream_info[2]:
+            print(f"   ❌ Could not read video properties")
+            return input_video_path
+        _, width, height, frame_rate, _ = stream_info
+        fps = 30  # Default
+        try:
+            fps_parts = (frame_rate or '').split('/')
+            fps = float(fps_parts[0]) / float(fps_parts[1]) if len(fps_parts) == 2 else float(fps_parts[0])
+        except (ValueError, ZeroDivisionError):
+            pass
+        frame_size = width * height * 4
+        
+        print(f"      Video: {width}x{height} @ {fps}fps")
         
+        # Texture sequences pre-resized to the frame size once (cached across jobs)
+        disp_textures = get_sticker_textures(TEXTURE_DISPLACEMENT_FOLDER, (width, height))
+        screen_textures = get_sticker_textures(TEXTURE_SCREEN_FOLDER, (width, height))
         if not disp_textures and not screen_textures:
             print(f"   ⚠️ No textures found, skipping sticker effect")
             return input_video_path  # Return original if no textures
         
-        # Use ffmpeg to extract frames with alpha channel preserved
-        print(f"      Extracting frames from video with alpha channel...")
-        temp_extract_dir = os.path.join(TRANSPARENT_VIDEOS_FOLDER, f"sticker_extract_{uuid.uuid4().hex[:8]}")
-        os.makedirs(temp_extract_dir, exist_ok=True)
-        
-        # Extract frames as PNG with alpha (PNG automatically preserves alpha)
-        extract_cmd = [
-            'ffmpeg', '-y', '-i', input_video_path,
-            os.path.join(temp_extract_dir, 'frame_%06d.png')
+        sticker = StickerSettings(
+            displacement_intensity=displacement_intensity, darker_opacity=darker_opacity, screen_opacity=screen_opacity,
+            enable_bevel=enable_bevel, bevel_depth=bevel_depth, bevel_highlight=bevel_highlight, bevel_shadow=bevel_shadow,
+            enable_alpha_bevel=enable_alpha_bevel, alpha_bevel_size=alpha_bevel_size, alpha_bevel_blur=alpha_bevel_blur,
+            alpha_bevel_angle=alpha_bevel_angle, alpha_bevel_highlight=alpha_bevel_highlight, alpha_bevel_shadow=alpha_bevel_shadow,
+            enable_shadow=enable_shadow, shadow_blur=shadow_blur, shadow_x=shadow_x, shadow_y=shadow_y, shadow_opacity=shadow_opacity)
+        
+        # Decode to raw RGBA on stdout (alpha preserved) and re-encode raw RGBA from stdin
+        decode_cmd = [
+            'ffmpeg', '-v', 'error', '-i', input_video_path,
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-'
         ]
-        result = subprocess.run(extract_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"   ❌ Frame extraction failed: {result.stderr}")
-            shutil.rmtree(temp_extract_dir, ignore_errors=True)
-            return input_video_path
-        
-        # Get frame files
-        frame_files = sorted([f for f in os.listdir(temp_extract_dir) if f.endswith('.png')])
-        if not frame_files:
-            print(f"   ❌ No frames extracted")
-            shutil.rmtree(temp_extract_dir, ignore_errors=True)
-            return input_video_path
-        
-        # Get video properties from first frame
-        first_frame = Image.open(os.path.join(temp_extract_dir, frame_files[0]))
-        width, height = first_frame.size
-        total_frames = len(frame_files)
-        
-        # Get FPS from original video
-        probe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', 
-                     '-show_entries', 'stream=r_frame_rate', '-of', 'default=noprint_wrappers=1:nokey=1', 
-                     input_video_path]
-        probe_result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        fps = 30  # Default
-        if probe_result.returncode == 0 and probe_result.stdout.strip():
-            try:
-                fps_parts = probe_result.stdout.strip().split('/')
-                fps = float(fps_parts[0]) / float(fps_parts[1]) if len(fps_parts) == 2 else float(fps_parts[0])
-            except:
-                pass
-        
-        print(f"      Video: {width}x{height} @ {fps}fps, {total_frames} frames")
-        
-        # Create temporary directory for processed frames
-        temp_frames_dir = os.path.join(TRANSPARENT_VIDEOS_FOLDER, f"sticker_temp_{uuid.uuid4().hex[:8]}")
-        os.makedirs(temp_frames_dir, exist_ok=True)
-        
-        frame_idx = 0
-        for frame_file in frame_files:
-            # Load frame with alpha
-            frame_path = os.path.join(temp_extract_dir, frame_file)
-            frame_pil = Image.open(frame_path).convert('RGBA')
-            
-            # Store original alpha before any processing
-            original_alpha = frame_pil.split()[3]
-            
-            # Get textures for this frame (loop if textures are shorter than video)
-            disp_texture = disp_textures[frame_idx % len(disp_textures)] if disp_textures else None
-            screen_texture = screen_textures[frame_idx % len(screen_textures)] if screen_textures else None
-            
-            # Apply sticker effect with all parameters
-            processed_frame = apply_sticker_effect_to_frame(
-                frame_pil, disp_texture, screen_texture,
-                displacement_intensity, darker_opacity, screen_opacity,
-                enable_bevel, bevel_depth, bevel_highlight, bevel_shadow,
-                enable_alpha_bevel, alpha_bevel_size, alpha_bevel_blur, 
-                alpha_bevel_angle, alpha_bevel_highlight, alpha_bevel_shadow,
-                enable_shadow, shadow_blur, shadow_x, shadow_y, shadow_opacity
-            )
-            
-            # CRITICAL: Ensure original alpha is preserved exactly (no modifications to transparent areas)
-            processed_frame.putalpha(original_alpha)
-            
-            # Zero out RGB values in fully transparent areas to prevent compression artifacts
-            frame_array = np.array(processed_frame)
-            alpha_array = np.array(original_alpha)
-            # Where alpha is 0, set RGB to 0 (fully transparent black)
-            mask = (alpha_array == 0)
-            # Apply mask to each RGB channel separately
-            frame_array[:, :, 0] = np.where(mask, 0, frame_array[:, :, 0])  # Red
-            frame_array[:, :, 1] = np.where(mask, 0, frame_array[:, :, 1])  # Green
-            frame_array[:, :, 2] = np.where(mask, 0, frame_array[:, :, 2])  # Blue
-            processed_frame = Image.fromarray(frame_array, 'RGBA')
-            
-            # Save frame
-            frame_path = os.path.join(temp_frames_dir, f"frame_{frame_idx:06d}.png")
-            processed_frame.save(frame_path, 'PNG')
-            
-            frame_idx += 1
-            if frame_idx % 10 == 0:
-                print(f"      Processed {frame_idx}/{total_frames} frames...")
-        
-        print(f"   ✅ Processed all {frame_idx} frames")
-        
-        # Clean up extraction directory
-        shutil.rmtree(temp_extract_dir, ignore_errors=True)
-        
-        # Re-encode video using FFmpeg with high quality settings and alpha preservation
-        print(f"   🎬 Re-encoding video with FFmpeg (preserving alpha)...")
         ffmpeg_cmd = [
-            'ffmpeg', '-y',
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
             '-framerate', str(fps),
-            '-i', os.path.join(temp_frames_dir, 'frame_%06d.png'),
-            '-c:v', 'libvpx-vp9',
-            '-pix_fmt', 'yuva420p',
-            '-crf', '15',
-            '-b:v', '0',
+            '-i', '-',
+            *vp9_alpha_encoder_args(15),
             output_video_path
         ]
-        
+        print(f"   🎬 Streaming frames through FFmpeg (preserving alpha)...")
         print(f"   📝 FFmpeg command: {' '.join(ffmpeg_cmd)}")
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"   ❌ FFmpeg error: {result.stderr}")
+        decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=frame_size * 2)
+        encoder = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        # Batches are processed out of order on the pool but written in order; the window bounds memory.
+        # Each batch reads into and writes out of a (decoded, processed) block pair that is reused once written.
+        max_in_flight = STICKER_FRAME_WORKERS + 1
+        pending = collections.deque()
+        free_blocks = []
+        frame_idx = 0
+        with ThreadPoolExecutor(max_workers=STICKER_FRAME_WORKERS, thread_name_prefix="StickerFrame") as executor:
+            def write_oldest_batch():
+                future, blocks = pending.popleft()
+                encoder.stdin.write(future.result())
+                free_blocks.append(blocks)
+            
+            while True:
+                if free_blocks:
+                    in_block, out_block = free_blocks.pop()
+                else:
+                    in_block, out_block = (np.empty((STICKER_FRAME_BATCH, height, width, 4), np.uint8) for _ in range(2))
+                batch_len = read_frames_into(decoder.stdout, in_block)
+                if batch_len == 0:
+                    break
+                
+                # Get textures for these frames (loop if textures are shorter than video)
+                batch_indices = range(frame_idx, frame_idx + batch_len)
+                disp_batch = [disp_textures[i % len(disp_textures)] for i in batch_indices] if disp_textures else [None] * batch_len
+                screen_batch = [screen_textures[i % len(screen_textures)] for i in batch_indices] if screen_textures else [None] * batch_len
+                future = executor.submit(_process_sticker_video_batch, in_block[:batch_len], disp_batch, screen_batch, sticker, out_block[:batch_len])
+                pending.append((future, (in_block, out_block)))
+                
+                if len(pending) >= max_in_flight:
+                    write_oldest_batch()
+                if (frame_idx + batch_len) // 10 > frame_idx // 10:
+                    print(f"      Processed {frame_idx + batch_len} frames...")
+                if (frame_idx + batch_len) // 100 > frame_idx // 100:
+                    mem = get_memory_usage()
+                    if mem:
+                        print(f"      💾 Memory: {mem['rss_mb']:.1f} MB RSS at frame {frame_idx + batch_len}")
+                frame_idx += batch_len
+            
+            while pending:
+                write_oldest_batch()
+        
+        encoder.stdin.close()
+        decoder_error = decoder.stderr.read().decode(errors='replace')
+        encoder_error = encoder.stderr.read().decode(errors='replace')
+        if decoder.wait() != 0 or frame_idx == 0:
+            print(f"   ❌ Frame decoding failed: {decoder_error or 'no frames decoded'}")
+            return input_video_path
+        if encoder.wait() != 0:
+            print(f"   ❌ FFmpeg error: {encoder_error}")
             return input_video_path
         
+        print(f"   ✅ Processed all {frame_idx} frames")
+        
         # Verify the output has alpha
         verify_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', 
                       '-show_entries', 'stream=pix_fmt', '-of', 'default=noprint_wrappers=1:nokey=1', 
@@ -556,103 +1214,220 @@ def apply_sticker_effect_to_video(input_video_path, output_video_path,
         if 'yuva' not in output_pix_fmt:
             print(f"   ⚠️ WARNING: Output video may not have alpha channel! Got {output_pix_fmt} instead of yuva420p")
         
-        # Clean up temp frames
-        shutil.rmtree(temp_frames_dir, ignore_errors=True)
-        
         print(f"   ✅ Sticker effect video saved: {output_video_path}")
         return output_video_path
         
     except Exception as e:
-        print(f"   ❌ Sticker effect failed: {e}")
-        traceback.print_exc()
+        logger.exception("   ❌ Sticker effect failed: %s", e)
         return input_video_path  # Return original if processing fails
+    finally:
+        for proc in (decoder, encoder):
+            if proc and proc.poll() is None:
+                proc.kill()
+                proc.wait()
 
 # --- IMAGE PREPROCESSING FOR BOOMERANG ---
+BOOMERANG_BG_COLORS = {"green": (0, 255, 0), "blue": (0, 0, 255)}
+BOOMERANG_BG_ARRAYS = {}  # (color, size) -> read-only float32 RGB array, filled once per size
+
+def get_boomerang_background(background_color_str, size):
+    """Return a cached, read-only solid RGB background array of the given (width, height)."""
+    key = (background_color_str, size)
+    bg_array = BOOMERANG_BG_ARRAYS.get(key)
+    if bg_array is None:
+        bg_array = np.empty((size[1], size[0], 3), dtype=np.float32)
+        bg_array[...] = BOOMERANG_BG_COLORS[background_color_str]
+        bg_array.flags.writeable = False
+        BOOMERANG_BG_ARRAYS[key] = bg_array
+    return bg_array
+
+def composite_scaled_on_background(fg_rgba, bg_rgb, scale=0.9):
+    """
+    Shrink an RGBA image by `scale` and alpha-composite it centered on a solid RGB background.
+    Uses OpenCV's SIMD/multithreaded Lanczos on premultiplied color (like Pillow's RGBA resize).
+    Returns a uint8 RGB array.
+    """
+    height, width = fg_rgba.shape[:2]
+    new_w, new_h = int(width * scale), int(height * scale)
+    alpha = fg_rgba[..., 3].astype(np.float32) / 255.0
+    premultiplied = fg_rgba[..., :3].astype(np.float32) * alpha[..., None]
+    premultiplied = cv2.resize(premultiplied, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
+    alpha = np.clip(cv2.resize(alpha, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4), 0.0, 1.0)[..., None]
+    
+    canvas = bg_rgb.copy()
+    x, y = (width - new_w) // 2, (height - new_h) // 2
+    region = canvas[y:y + new_h, x:x + new_w]
+    region *= 1.0 - alpha
+    region += premultiplied
+    return np.clip(canvas, 0, 255).astype(np.uint8)
+
 def preprocess_animation_image_for_boomerang(source_image_path, background_color_str):
     """
     Preprocess images for boomerang automation to ensure consistent backgrounds.
     """
     try:
         # Handle both relative and absolute paths more safely
-        if source_image_path.startswith('/'):
-            source_full_path = os.path.join(BASE_DIR, source_image_path.lstrip('/'))
-        else:
-            source_full_path = os.path.join(BASE_DIR, source_image_path)
+        source_full_path = local_static_path(source_image_path)
         
         if not os.path.exists(source_full_path):
             print(f"   ...preprocessing error: Source file not found at {source_full_path}")
             return source_image_path
 
-        color_map = {"green": (0, 255, 0), "blue": (0, 0, 255)}
-        background_color = color_map.get(background_color_str)
-        if not background_color: 
+        if background_color_str not in BOOMERANG_BG_COLORS: 
             print(f"   ...using original image (unsupported background color: {background_color_str})")
             return source_image_path
 
         print(f"   ...preprocessing {source_image_path} with {background_color_str} background")
-        with Image.open(source_full_path).convert("RGBA") as fg_image:
-            bg_image = Image.new("RGBA", fg_image.size, background_color)
-            new_size = (int(fg_image.width * 0.9), int(fg_image.height * 0.9))
-            fg_image_resized = fg_image.resize(new_size, Image.Resampling.LANCZOS)
-            paste_position = ((bg_image.width - fg_image_resized.width) // 2, (bg_image.height - fg_image_resized.height) // 2)
-            bg_image.paste(fg_image_resized, paste_position, fg_image_resized)
-            
-            output_filename = f"boomerang_preprocessed_{uuid.uuid4()}.png"
-            output_full_path = os.path.join(LIBRARY_FOLDER, output_filename)
-            bg_image.convert("RGB").save(output_full_path, 'PNG')
-            print(f"   ...saved preprocessed image to {output_full_path}")
-            
-            # Upload to S3 if enabled
-            s3_key = f"library/{output_filename}"
-            public_url = upload_file(output_full_path, s3_key)
-            return public_url
+        with Image.open(source_full_path) as source_image:
+            fg_rgba = np.asarray(source_image.convert("RGBA"))
+        bg_rgb = get_boomerang_background(background_color_str, (fg_rgba.shape[1], fg_rgba.shape[0]))
+        result_rgb = composite_scaled_on_background(fg_rgba, bg_rgb, 0.9)
+        
+        output_filename = f"boomerang_preprocessed_{uuid.uuid4().hex}.png"
+        output_full_path = LIBRARY_PREFIX + output_filename
+        # Opaque RGB output, so OpenCV's PNG encoder is safe here; low compression keeps the save fast
+        cv2.imwrite(output_full_path, cv2.cvtColor(result_rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        print(f"   ...saved preprocessed image to {output_full_path}")
+        
+        # Upload to S3 if enabled
+        s3_key = f"library/{output_filename}"
+        public_url = upload_file(output_full_path, s3_key)
+        return public_url
             
     except Exception as e:
         print(f"   ...error during boomerang preprocessing: {e}")
         return source_image_path
 
 # --- DATABASE HELPER ---
+# Finished jobs are queued here and written in batches by the status writer thread
+PENDING_UPDATES = queue.Queue()
+STATUS_FLUSH_INTERVAL = 0.2  # seconds
+
+# Wakes the main loop as soon as a job finishes or statuses are committed in this process.
+# Jobs queued by the web app live in another process, so the loop still polls every JOB_POLL_INTERVAL -
+# but an idle poll is just PRAGMA data_version, which only changes when another connection commits.
+JOB_EVENTS = threading.Condition()
+JOB_POLL_INTERVAL = 1.0  # seconds
+
+def notify_job_event(*_):
+    """Wake the main loop (usable directly or as a future done-callback)."""
+    with JOB_EVENTS:
+        JOB_EVENTS.notify_all()
+
+# Keyed outputs are uploaded to S3 by a background thread (write-behind). A keying job's local /static/
+# URLs are committed while it stays 'keying_processing'; the upload thread then switches it to the S3 URLs
+# and 'completed', so the web app never sees a finished job whose outputs only exist on the worker's disk.
+UPLOAD_QUEUE = queue.Queue()  # ids of jobs whose keyed outputs still have to go to S3
+STATIC_URL_PREFIX = "/static/"
+
+@dataclass(slots=True)
+class Job:
+    """A claimed row of the jobs table, copied once at claim time and handed to the handlers."""
+    id: int
+    job_type: str
+    status: str
+    created_at: str | None = None
+    prompt: str | None = None
+    input_data: str | None = None
+    result_data: str | None = None
+    error_message: str | None = None
+    keying_settings: str | None = None
+    keyed_result_data: str | None = None
+    parent_job_id: int | None = None
+    parent_job_type: str | None = None  # Looked up by the claim, so finishing a child needs no extra query
+    _inputs: dict | None = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_row(cls, row):
+        columns = row.keys()
+        return cls(**{f.name: row[f.name] for f in fields(cls) if f.name in columns})
+
+    def inputs(self):
+        """input_data parsed on first use and shared by every handler the job passes through - don't mutate it."""
+        if self._inputs is None:
+            self._inputs = json_loads(self.input_data)
+        return self._inputs
+
 def get_db_connection():
     """Creates a database connection with WAL mode enabled for high concurrency."""
     try:
         conn = sqlite3.connect(DATABASE_PATH, timeout=10)
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("PRAGMA busy_timeout=30000;")  # 30 second timeout for busy database
+        conn.execute("PRAGMA synchronous=NORMAL;")  # Safe with WAL, avoids an fsync per commit
+        conn.execute("PRAGMA mmap_size=268435456;")  # Read pages through a 256MB memory map
+        conn.execute("PRAGMA cache_size=-64000;")  # 64MB page cache per connection
+        conn.execute("PRAGMA temp_store=MEMORY;")  # Sorts/temp tables in RAM
         conn.row_factory = sqlite3.Row
         return conn
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         raise
 
+_thread_db = threading.local()
+
+def get_thread_db_connection():
+    """This thread's long-lived connection (opened and configured once), for loops that hit the DB every tick."""
+    conn = getattr(_thread_db, 'conn', None)
+    if conn is None:
+        conn = _thread_db.conn = get_db_connection()
+    return conn
+
+def close_thread_db_connection():
+    """Close this thread's connection from get_thread_db_connection, if it has one (call at thread exit)."""
+    conn = getattr(_thread_db, 'conn', None)
+    if conn is not None:
+        _thread_db.conn = None
+        conn.close()
+
+def ensure_db_indexes():
+    """Create the indexes the scheduler queries rely on (idempotent, run at worker startup)."""
+    try:
+        with get_db_connection() as conn:
+            # Job pickup: WHERE status = ? ORDER BY created_at
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+            # Boomerang children / stitch lookups: WHERE parent_job_id = ? AND job_type = ?
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_parent_type ON jobs(parent_job_id, job_type)")
+            # Automation and analysis waiters - small partial index, only the waiting rows
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_type_status ON jobs(job_type, status) "
+                "WHERE status IN ('waiting_for_analysis', 'waiting_for_children')"
+            )
+            conn.commit()
+        print("Worker: Database indexes ready")
+    except sqlite3.Error as e:
+        print(f"Worker: could not create database indexes: {e}")
+
 def add_white_outline(image_path, outline_width=3):
     """
     Add a white outline around the subject in an image.
     Works best with transparent/semi-transparent PNGs.
     """
     try:
-        from PIL import ImageFilter, ImageOps
-        
         print(f"   ...adding {outline_width}px white outline to image")
         
         # Open image
         img = Image.open(image_path).convert("RGBA")
         
         # Extract alpha channel (transparency mask)
-        alpha = img.split()[3]
+        alpha = cv2.extractChannel(np.asarray(img), 3)
         
-        # Create outline by dilating the alpha mask
-        outline = alpha.filter(ImageFilter.MaxFilter(outline_width * 2 + 1))
+        # Create outline by dilating the alpha mask (square max filter; O(1) per pixel in cv2)
+        kernel_size = outline_width * 2 + 1
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+        outline = cv2.dilate(alpha, kernel)
         
         # Create white outline layer
-        outline_layer = Image.new("RGBA", img.size, (255, 255, 255, 0))
-        outline_layer.putalpha(outline)
+        outline_rgba = np.full((*outline.shape, 4), 255, np.uint8)
+        outline_rgba[:, :, 3] = outline
+        outline_layer = Image.fromarray(outline_rgba, 'RGBA')
         
         # Create final image: white outline + original image
         result = Image.alpha_composite(outline_layer, img)
         
         # Save to temp file
-        output_filename = f"outlined_{uuid.uuid4()}.png"
-        output_path = os.path.join(LIBRARY_FOLDER, output_filename)
+        output_filename = f"outlined_{uuid.uuid4().hex}.png"
+        output_path = LIBRARY_PREFIX + output_filename
         result.save(output_path, 'PNG')
         
         print(f"   ...white outline applied, saved to {output_path}")
@@ -663,15 +1438,95 @@ def add_white_outline(image_path, outline_width=3):
         return public_url
         
     except Exception as e:
-        print(f"   ...warning: could not add white outline: {e}")
-        traceback.print_exc()
+        logger.exception("   ...warning: could not add white outline: %s", e)
         return image_path  # Return original if outline fails
 
+# --- SOURCE FILE HELPERS ---
+DOWNLOAD_TIMEOUT = (10, 300)  # (connect, read) seconds for file downloads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+def download_url_to_file(url, dest_path):
+    """
+    Stream a remote file (S3/Replicate URL) to dest_path in 1MB chunks (never held in memory whole).
+    Objects in our own bucket go through boto3 instead, which fetches large files as parallel ranged GETs.
+    """
+    url = str(url)  # Replicate hands back FileOutput objects, not plain strings
+    s3_key = key_for_url(url)
+    if s3_key and download_file(s3_key, dest_path):
+        return dest_path
+    with HTTP_SESSION.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with open(dest_path, "wb") as f:
+            shutil.copyfileobj(response.raw, f, DOWNLOAD_CHUNK_SIZE)
+    return dest_path
+
+def remove_temp_file(path):
+    """Delete a temporary download, warning instead of raising if it can't be removed."""
+    try:
+        os.remove(path)
+        print(f"   ...cleaned up temp file {os.path.basename(path)}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"   ...warning: could not delete temp file {path}: {e}")
+
+def store_remote_file(url, folder, s3_prefix, extension):
+    """
+    Download a generated file and store it under `s3_prefix/`.
+    With S3 enabled the download is streamed straight into the upload and never touches disk;
+    the file is only written to `folder` when S3 is disabled or the streamed upload failed.
+    Returns the public URL (or local /static path).
+    """
+    url = str(url)  # Replicate hands back FileOutput objects, not plain strings
+    filename = f"{uuid.uuid4().hex}{extension}"
+    s3_key = f"{s3_prefix}/{filename}"
+    if is_s3_enabled():
+        with HTTP_SESSION.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            public_url = upload_fileobj(response.raw, s3_key)
+        if not public_url.startswith('/static/'):
+            return public_url
+        print(f"   ...streamed S3 upload of {filename} failed, retrying from a local copy")
+    filepath = download_url_to_file(url, os.path.join(folder, filename))
+    return upload_file(filepath, s3_key)
+
+def remote_content_length(url):
+    """Size in bytes advertised by a HEAD request, or None if it can't be determined."""
+    try:
+        response = HTTP_SESSION.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT[0])
+        response.raise_for_status()
+        return int(response.headers['Content-Length'])
+    except (requests.RequestException, KeyError, ValueError):
+        return None
+
+def resolve_source(src, prefix, suffix='.png', label='file'):
+    """
+    Resolve an S3 URL or a local static path to a file on disk.
+    Returns (local_path, cleanup) - cleanup deletes the temp download and is a no-op for local files.
+    Raises FileNotFoundError if a local path does not exist.
+    """
+    if src.startswith('http'):
+        print(f"   ...downloading {label} from S3: {src}")
+        fd, temp_path = tempfile.mkstemp(prefix=f"{prefix}_", suffix=suffix, dir=SCRATCH_DIR)
+        os.close(fd)
+        try:
+            download_url_to_file(src, temp_path)
+        except Exception:
+            remove_temp_file(temp_path)
+            raise
+        return temp_path, lambda: remove_temp_file(temp_path)
+    local_path = local_static_path(src)
+    if not os.path.exists(local_path):
+        raise FileNotFoundError(local_path)
+    return local_path, lambda: None
+
 # --- JOB HANDLERS ---
 def handle_boomerang_automation(job, conn):
-    print(f"-> Starting A-B-A Loop Automation for meta-job {job['id']}...")
+    print(f"-> Starting A-B-A Loop Automation for meta-job {job.id}...")
     try:
-        input_data = json.loads(job['input_data'])
+        input_data = job.inputs()
         base_params = {key: value for key, value in input_data.items() if key != 'boomerang_automation'}
         
         # Preprocess both frames with consistent background for boomerang automation
@@ -680,40 +1535,41 @@ def handle_boomerang_automation(job, conn):
         end_frame_url = input_data['end_image_url']
         
         print(f"   ...preprocessing frames for consistent {background_color} background")
-        # Use the same preprocessing logic for both frames to ensure consistency
-        processed_start_url = preprocess_animation_image_for_boomerang(start_frame_url, background_color)
-        processed_end_url = preprocess_animation_image_for_boomerang(end_frame_url, background_color)
+        # Use the same preprocessing logic for both frames to ensure consistency;
+        # the two frames are independent, so they are processed side by side
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="BoomerangPrep") as executor:
+            processed_start_url, processed_end_url = executor.map(
+                preprocess_animation_image_for_boomerang,
+                (start_frame_url, end_frame_url),
+                (background_color, background_color),
+            )
         
         print(f"   ...processed start frame: {processed_start_url}")
         print(f"   ...processed end frame: {processed_end_url}")
         
         # --- Create Job 1: A -> B ---
-        input_data_ab = base_params.copy()
-        input_data_ab['image_url'] = processed_start_url
-        input_data_ab['end_image_url'] = processed_end_url
+        input_data_ab = {**base_params, 'image_url': processed_start_url, 'end_image_url': processed_end_url}
         prompt_ab = f"Animation A->B: {input_data_ab['prompt']}"
-        conn.cursor().execute(
-            "INSERT INTO jobs (job_type, status, created_at, prompt, input_data, parent_job_id) VALUES (?, ?, ?, ?, ?, ?)",
-            ('animation', 'queued', datetime.now(), prompt_ab, json.dumps(input_data_ab), job['id'])
-        )
-        print(f"   ...queued Job 1 (A->B)")
         
         # --- Create Job 2: B -> A ---
-        input_data_ba = base_params.copy()
-        input_data_ba['image_url'] = processed_end_url
-        input_data_ba['end_image_url'] = processed_start_url
+        input_data_ba = {**base_params, 'image_url': processed_end_url, 'end_image_url': processed_start_url}
         prompt_ba = f"Animation B->A: {input_data_ba['prompt']}"
-        conn.cursor().execute(
+        
+        # Queue both children in one statement batch and one commit
+        created_at = datetime.now()
+        conn.executemany(
             "INSERT INTO jobs (job_type, status, created_at, prompt, input_data, parent_job_id) VALUES (?, ?, ?, ?, ?, ?)",
-            ('animation', 'queued', datetime.now(), prompt_ba, json.dumps(input_data_ba), job['id'])
+            [
+                ('animation', 'queued', created_at, prompt_ab, json_dumps(input_data_ab), job.id),
+                ('animation', 'queued', created_at, prompt_ba, json_dumps(input_data_ba), job.id),
+            ]
         )
-        print(f"   ...queued Job 2 (B->A)")
+        print(f"   ...queued Job 1 (A->B) and Job 2 (B->A)")
 
         conn.commit()
         return "waiting_for_children", None
     except Exception as e:
-        print(f"Error in boomerang automation setup: {e}")
-        traceback.print_exc()
+        logger.exception("Error in boomerang automation setup: %s", e)
         # Try to rollback the transaction
         try:
             conn.rollback()
@@ -721,428 +1577,311 @@ def handle_boomerang_automation(job, conn):
             print(f"Could not rollback transaction: {rollback_error}")
         return None, f"A-B-A Loop Automation setup failed: {e}"
 
-def handle_animation(job):
+# Always appended to the user's negative prompt for animation jobs
+ANIMATION_NEGATIVE_ADDITIONS = "contact shadow, drop shadow, change background color, no additions"
+
+def prepare_animation_input(job, cleanup):
+    """
+    Resolve the source frames and build the Replicate input for an animation job.
+    Temp files and open file handles are registered on the `cleanup` ExitStack.
+    Returns (video_model, api_input).
+    """
+    print(f"-> Starting animation generation for job {job.id}...")
+    input_data = job.inputs()
+    video_model = input_data.get("video_model")
+    print(f"   ...using model: {video_model}")
+    
+    # Handle both S3 URLs and local file paths for start image
     try:
-        print(f"-> Starting animation generation for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
-        video_model = input_data.get("video_model")
-        print(f"   ...using model: {video_model}")
-        
-        # Handle both S3 URLs and local file paths for start image
-        image_url = input_data['image_url']
-        temp_start_file = None
-        if image_url.startswith('http'):
-            # It's an S3 URL - download it first
-            print(f"   ...downloading start image from S3: {image_url}")
-            img_response = requests.get(image_url)
-            img_response.raise_for_status()
-            temp_start_file = f"temp_start_{uuid.uuid4()}.png"
-            start_image_path = os.path.join(LIBRARY_FOLDER, temp_start_file)
-            with open(start_image_path, "wb") as f:
-                f.write(img_response.content)
-        else:
-            # It's a local path
-            start_image_path = os.path.join(BASE_DIR, image_url.lstrip('/'))
-            if not os.path.exists(start_image_path):
-                raise FileNotFoundError(f"Start image not found at {start_image_path}")
-        
-        user_negative_prompt = input_data.get("negative_prompt", "").strip()
-        base_negative_additions = "contact shadow, drop shadow, change background color, no additions"
-        final_negative_prompt = f"{user_negative_prompt}, {base_negative_additions}" if user_negative_prompt else base_negative_additions
-        
-        # Add model-specific prompt instructions
-        user_prompt = input_data.get('prompt')
-        if 'kling' in video_model:
-            kling_instructions = "No zoom, no scale changes."
-            final_prompt = f"{user_prompt}. {kling_instructions}"
-            api_input = {"prompt": final_prompt, "negative_prompt": final_negative_prompt}
-            api_input["duration"] = input_data.get('kling_duration', input_data.get('duration', 5))
-            if 'v2.1' in video_model: api_input["mode"] = input_data.get("kling_mode", "pro")
-        elif 'seedance' in video_model:
-            api_input = {"prompt": user_prompt, "negative_prompt": final_negative_prompt}
-            api_input["duration"] = input_data.get('seedance_duration', input_data.get('duration', 5))
-            api_input["resolution"] = input_data.get('seedance_resolution', '1080p')
-            # Get aspect ratio from image or default to 1:1
-            api_input["aspect_ratio"] = input_data.get('seedance_aspect_ratio', '1:1')
-        else:
-            api_input = {"prompt": user_prompt, "negative_prompt": final_negative_prompt}
-        end_file_obj = None
+        start_image_path, remove_start = resolve_source(input_data['image_url'], 'temp_start', label='start image')
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Start image not found at {e}")
+    cleanup.callback(remove_start)
+    
+    user_negative_prompt = input_data.get("negative_prompt", "").strip()
+    final_negative_prompt = f"{user_negative_prompt}, {ANIMATION_NEGATIVE_ADDITIONS}" if user_negative_prompt else ANIMATION_NEGATIVE_ADDITIONS
+    
+    # Add model-specific prompt instructions
+    user_prompt = input_data.get('prompt')
+    if 'kling' in video_model:
+        kling_instructions = "No zoom, no scale changes."
+        final_prompt = f"{user_prompt}. {kling_instructions}"
+        api_input = {"prompt": final_prompt, "negative_prompt": final_negative_prompt}
+        api_input["duration"] = input_data.get('kling_duration', input_data.get('duration', 5))
+        if 'v2.1' in video_model: api_input["mode"] = input_data.get("kling_mode", "pro")
+    elif 'seedance' in video_model:
+        api_input = {"prompt": user_prompt, "negative_prompt": final_negative_prompt}
+        api_input["duration"] = input_data.get('seedance_duration', input_data.get('duration', 5))
+        api_input["resolution"] = input_data.get('seedance_resolution', '1080p')
+        # Get aspect ratio from image or default to 1:1
+        api_input["aspect_ratio"] = input_data.get('seedance_aspect_ratio', '1:1')
+    else:
+        api_input = {"prompt": user_prompt, "negative_prompt": final_negative_prompt}
+    
+    # File handles are registered on the ExitStack so they close before temp files are removed
+    start_file = cleanup.enter_context(open(start_image_path, "rb"))
+    if 'seedance' in video_model: api_input["image"] = start_file
+    else: api_input["start_image"] = start_file
+    
+    end_image_url = input_data.get("end_image_url")
+    if end_image_url and isinstance(end_image_url, str) and end_image_url.strip():
+        # Handle both S3 URLs and local file paths for end image (missing local files are skipped)
+        try:
+            end_image_path, remove_end = resolve_source(end_image_url, 'temp_end', label='end image')
+            cleanup.callback(remove_end)
+            print(f"   ...using end frame from {end_image_path}")
+            api_input["end_image"] = cleanup.enter_context(open(end_image_path, "rb"))
+        except FileNotFoundError:
+            pass
+    
+    # Handle last_frame_url for both Kling and Seedance
+    last_frame_url = input_data.get("last_frame_url")
+    if last_frame_url:
         last_frame_file_obj = None
-        temp_end_file = None
-        temp_last_frame_file = None
         try:
-            with open(start_image_path, "rb") as start_file:
-                if 'seedance' in video_model: api_input["image"] = start_file
-                else: api_input["start_image"] = start_file
-                end_image_url = input_data.get("end_image_url")
-                
-                if end_image_url and isinstance(end_image_url, str) and end_image_url.strip():
-                    # Handle both S3 URLs and local file paths for end image
-                    if end_image_url.startswith('http'):
-                        # It's an S3 URL - download it first
-                        print(f"   ...downloading end image from S3: {end_image_url}")
-                        img_response = requests.get(end_image_url)
-                        img_response.raise_for_status()
-                        temp_end_file = f"temp_end_{uuid.uuid4()}.png"
-                        end_image_path = os.path.join(LIBRARY_FOLDER, temp_end_file)
-                        with open(end_image_path, "wb") as f:
-                            f.write(img_response.content)
-                        end_file_obj = open(end_image_path, "rb")
-                        api_input["end_image"] = end_file_obj
-                    else:
-                        # It's a local path
-                        end_image_path = os.path.join(BASE_DIR, end_image_url.lstrip('/'))
-                        if os.path.exists(end_image_path):
-                            print(f"   ...using end frame from {end_image_path}")
-                            end_file_obj = open(end_image_path, "rb")
-                            api_input["end_image"] = end_file_obj
-                # Handle last_frame_url for both Kling and Seedance
-                last_frame_url = input_data.get("last_frame_url")
-                if last_frame_url:
-                    if last_frame_url.startswith('http'):
-                        # Download from S3
-                        print(f"   ...downloading last frame from S3: {last_frame_url}")
-                        img_response = requests.get(last_frame_url)
-                        img_response.raise_for_status()
-                        temp_last_frame_file = f"temp_last_{uuid.uuid4()}.png"
-                        last_frame_path = os.path.join(LIBRARY_FOLDER, temp_last_frame_file)
-                        with open(last_frame_path, "wb") as f:
-                            f.write(img_response.content)
-                        last_frame_file_obj = open(last_frame_path, "rb")
-                    else:
-                        # Local path
-                        last_frame_path = os.path.join(BASE_DIR, last_frame_url.lstrip('/'))
-                        if os.path.exists(last_frame_path):
-                            print(f"   ...using last frame from {last_frame_path}")
-                            last_frame_file_obj = open(last_frame_path, "rb")
-                    
-                    # Assign to correct parameter based on model
-                    if last_frame_file_obj:
-                        if 'seedance' in video_model:
-                            api_input["last_frame_image"] = last_frame_file_obj
-                            print(f"   ...set last_frame_image for Seedance")
-                        else:
-                            api_input["end_image"] = last_frame_file_obj
-                            print(f"   ...set end_image for Kling")
-                if "end_image" in api_input and 'kling-v2.1' in video_model:
-                    api_input["mode"] = "pro"
-                    print("   ...forcing 'pro' mode for Kling because end_image is present.")
-                loggable_input = {k: v for k, v in api_input.items() if not isinstance(v, io.IOBase)}
-                if "start_image" in api_input or "image" in api_input: loggable_input['start_image_provided'] = True
-                if "end_image" in api_input: loggable_input['end_image_provided'] = True
-                if "last_frame_image" in api_input: loggable_input['last_frame_image_provided'] = True
-                print(f"   ...calling Replicate with parameters: {loggable_input}")
-                video_output_url = replicate.run(video_model, input=api_input)
-        finally:
-            if end_file_obj and not isinstance(end_file_obj, io.BytesIO):
-                try:
-                    end_file_obj.close()
-                except Exception as e:
-                    print(f"   ...warning: could not close end_file_obj: {e}")
-            if last_frame_file_obj and not isinstance(last_frame_file_obj, io.BytesIO):
-                try:
-                    last_frame_file_obj.close()
-                except Exception as e:
-                    print(f"   ...warning: could not close last_frame_file_obj: {e}")
-        video_response = requests.get(video_output_url)
-        video_response.raise_for_status()
-        video_filename = f"{uuid.uuid4()}.mp4"
-        video_filepath = os.path.join(ANIMATIONS_FOLDER_GENERATED, video_filename)
-        with open(video_filepath, "wb") as f: f.write(video_response.content)
-        
-        # Clean up temp files if we downloaded from S3
-        if temp_start_file:
-            try:
-                os.remove(os.path.join(LIBRARY_FOLDER, temp_start_file))
-                print(f"   ...cleaned up temp start file")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp start file: {e}")
-        if temp_end_file:
-            try:
-                os.remove(os.path.join(LIBRARY_FOLDER, temp_end_file))
-                print(f"   ...cleaned up temp end file")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp end file: {e}")
-        if temp_last_frame_file:
-            try:
-                os.remove(os.path.join(LIBRARY_FOLDER, temp_last_frame_file))
-                print(f"   ...cleaned up temp last frame file")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp last frame file: {e}")
-        
-        # Upload to S3 if enabled
-        s3_key = f"animations/generated/{video_filename}"
-        public_url = upload_file(video_filepath, s3_key)
-        return public_url, None
+            last_frame_path, remove_last = resolve_source(last_frame_url, 'temp_last', label='last frame')
+            cleanup.callback(remove_last)
+            print(f"   ...using last frame from {last_frame_path}")
+            last_frame_file_obj = cleanup.enter_context(open(last_frame_path, "rb"))
+        except FileNotFoundError:
+            pass
+        
+        # Assign to correct parameter based on model
+        if last_frame_file_obj:
+            if 'seedance' in video_model:
+                api_input["last_frame_image"] = last_frame_file_obj
+                print(f"   ...set last_frame_image for Seedance")
+            else:
+                api_input["end_image"] = last_frame_file_obj
+                print(f"   ...set end_image for Kling")
+    if "end_image" in api_input and 'kling-v2.1' in video_model:
+        api_input["mode"] = "pro"
+        print("   ...forcing 'pro' mode for Kling because end_image is present.")
+    loggable_input = {k: v for k, v in api_input.items() if not isinstance(v, io.IOBase)}
+    if "start_image" in api_input or "image" in api_input: loggable_input['start_image_provided'] = True
+    if "end_image" in api_input: loggable_input['end_image_provided'] = True
+    if "last_frame_image" in api_input: loggable_input['last_frame_image_provided'] = True
+    print(f"   ...calling Replicate with parameters: {loggable_input}")
+    return video_model, api_input
+
+def save_animation_output(video_output_url):
+    """Download a generated video, store it in the library and return its public URL."""
+    return store_remote_file(video_output_url, ANIMATIONS_FOLDER_GENERATED, "animations/generated", ".mp4")
+
+def handle_animation(job):
+    try:
+        with contextlib.ExitStack() as cleanup:
+            video_model, api_input = prepare_animation_input(job, cleanup)
+            video_output_url = replicate_client.run(get_replicate_model(video_model), input=api_input)
+        return save_animation_output(video_output_url), None
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("   ❌ Animation generation error: %s", e)
+        return None, f"Animation generation error: {e}"
+
+async def handle_animation_async(job):
+    """Same as handle_animation, but awaits Replicate instead of holding a worker thread."""
+    try:
+        with contextlib.ExitStack() as cleanup:
+            video_model, api_input = await asyncio.to_thread(prepare_animation_input, job, cleanup)
+            model = await asyncio.to_thread(get_replicate_model, video_model)
+            video_output_url = await replicate_async_client.async_run(model, input=api_input)
+        return await asyncio.to_thread(save_animation_output, video_output_url), None
+    except Exception as e:
+        logger.exception("   ❌ Animation generation error: %s", e)
         return None, f"Animation generation error: {e}"
 
 def handle_trim(job):
     """Handle video trimming jobs"""
     try:
-        job_id = job['id']
-        print(f"-> Starting trim job #{job_id}...")
-        
-        # Parse trim parameters from input_data
-        trim_params = json.loads(job['input_data'])
-        source_video_url = trim_params['source_video_url']
-        in_point = float(trim_params['in_point'])
-        out_point = float(trim_params['out_point'])
-        pingpong = trim_params.get('pingpong', False)
-        
-        print(f"   Source: {source_video_url}")
-        print(f"   In Point: {in_point}s")
-        print(f"   Out Point: {out_point}s")
-        print(f"   Pingpong: {pingpong}")
-        
-        # Handle S3 URLs or local paths
-        if source_video_url.startswith('http'):
-            # Download from S3 first
-            import requests
-            print(f"   Downloading video from S3...")
-            response = requests.get(source_video_url)
-            response.raise_for_status()
-            temp_input = f"temp_trim_input_{uuid.uuid4().hex[:8]}.webm"
-            input_path = os.path.join(TRANSPARENT_VIDEOS_FOLDER, temp_input)
-            with open(input_path, 'wb') as f:
-                f.write(response.content)
-            cleanup_input = True
-        else:
-            input_path = os.path.join(BASE_DIR, source_video_url.lstrip('/'))
-            if not os.path.exists(input_path):
+        with contextlib.ExitStack() as cleanup:
+            job_id = job.id
+            print(f"-> Starting trim job #{job_id}...")
+            
+            # Parse trim parameters from input_data
+            trim_params = job.inputs()
+            source_video_url = trim_params['source_video_url']
+            in_point = float(trim_params['in_point'])
+            out_point = float(trim_params['out_point'])
+            pingpong = trim_params.get('pingpong', False)
+            
+            print(f"   Source: {source_video_url}")
+            print(f"   In Point: {in_point}s")
+            print(f"   Out Point: {out_point}s")
+            print(f"   Pingpong: {pingpong}")
+            
+            # Handle S3 URLs or local paths
+            try:
+                input_path, remove_input = resolve_source(source_video_url, 'temp_trim_input', suffix='.webm', label='video')
+            except FileNotFoundError:
                 return None, "Source video file not found"
-            cleanup_input = False
-        
-        # Create output filename
-        output_filename = f"trimmed_{job_id}_{uuid.uuid4().hex[:8]}.webm"
-        output_path = os.path.join(TRANSPARENT_VIDEOS_FOLDER, output_filename)
-        
-        # Trim video using ffmpeg
-        duration = out_point - in_point
-        
-        if pingpong:
-            # For pingpong loop: create forward then backward (reverse) sequence
-            print(f"   Creating pingpong loop...")
-            
-            ffmpeg_cmd = [
-                'ffmpeg', '-y',
-                '-ss', str(in_point),
-                '-i', input_path,
-                '-filter_complex',
-                f'[0:v]trim=duration={duration},setpts=PTS-STARTPTS,split[main][copy]; '
-                f'[copy]reverse[rev]; [main][rev]concat=n=2:v=1:a=0[out]',
-                '-map', '[out]',
-                '-c:v', 'libvpx-vp9',
-                '-pix_fmt', 'yuva420p',
-                '-b:v', '0',
-                '-crf', '10',
-                '-quality', 'best',
-                '-cpu-used', '0',
-                output_path
-            ]
-        else:
-            # Normal trim without pingpong
-            print(f"   Trimming video...")
-            
-            ffmpeg_cmd = [
-                'ffmpeg', '-y',
-                '-ss', str(in_point),
-                '-i', input_path,
-                '-t', str(duration),
-                '-c:v', 'libvpx-vp9',
-                '-pix_fmt', 'yuva420p',
-                '-b:v', '0',
-                '-crf', '10',
-                output_path
-            ]
-        
-        print(f"   Running FFmpeg...")
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"   ❌ FFmpeg trim error: {result.stderr}")
-            if cleanup_input and os.path.exists(input_path):
-                os.remove(input_path)
-            return None, f"FFmpeg trimming failed: {result.stderr[:500]}"
-        
-        # Upload trimmed video to S3 if enabled
-        s3_key = f"library/transparent_videos/{output_filename}"
-        trimmed_url = upload_file(output_path, s3_key)
-        
-        # Clean up temp input file if downloaded from S3
-        if cleanup_input and os.path.exists(input_path):
-            os.remove(input_path)
-        
-        print(f"   ✅ Video trimmed successfully: {trimmed_url}")
-        return trimmed_url, None
-        
+            cleanup.callback(remove_input)
+            
+            # Create output filename
+            output_filename = f"trimmed_{job_id}_{uuid.uuid4().hex[:8]}.webm"
+            output_path = TRANSPARENT_VIDEOS_PREFIX + output_filename
+            
+            # Trim video using ffmpeg
+            duration = out_point - in_point
+            
+            if pingpong:
+                # For pingpong loop: create forward then backward (reverse) sequence
+                print(f"   Creating pingpong loop...")
+                
+                ffmpeg_cmd = [
+                    'ffmpeg', '-y',
+                    '-ss', str(in_point),
+                    '-i', input_path,
+                    '-filter_complex',
+                    f'[0:v]trim=duration={duration},setpts=PTS-STARTPTS,split[main][copy]; '
+                    f'[copy]reverse[rev]; [main][rev]concat=n=2:v=1:a=0[out]',
+                    '-map', '[out]',
+                    *vp9_alpha_encoder_args(10, deadline='good', cpu_used=2),  # User-facing - keep the quality
+                    output_path
+                ]
+            else:
+                # Normal trim without pingpong
+                print(f"   Trimming video...")
+                
+                ffmpeg_cmd = [
+                    'ffmpeg', '-y',
+                    '-ss', str(in_point),
+                    '-i', input_path,
+                    '-t', str(duration),
+                    *vp9_alpha_encoder_args(10, deadline='good', cpu_used=2),  # User-facing - keep the quality
+                    output_path
+                ]
+            
+            print(f"   Running FFmpeg...")
+            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+            
+            if result.returncode != 0:
+                print(f"   ❌ FFmpeg trim error: {result.stderr}")
+                return None, f"FFmpeg trimming failed: {result.stderr[:500]}"
+            
+            # Upload trimmed video to S3 if enabled
+            s3_key = f"library/transparent_videos/{output_filename}"
+            trimmed_url = upload_file(output_path, s3_key)
+            
+            print(f"   ✅ Video trimmed successfully: {trimmed_url}")
+            return trimmed_url, None
+            
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("   ❌ Trim error: %s", e)
         return None, f"Trim error: {e}"
 
 def handle_video_stitching(job):
-    temp_video_a = None
-    temp_video_b = None
     try:
-        print(f"-> Starting video stitching for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
-        
-        # Handle both S3 URLs and local file paths for video A
-        video_a_url = input_data['video_a_path']
-        if video_a_url.startswith('http'):
-            # It's an S3 URL - download it first
-            print(f"   ...downloading video A from S3: {video_a_url}")
-            vid_response = requests.get(video_a_url)
-            vid_response.raise_for_status()
-            temp_video_a = f"temp_stitch_a_{uuid.uuid4()}.mp4"
-            video_a_path = os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video_a)
-            with open(video_a_path, "wb") as f:
-                f.write(vid_response.content)
-        else:
-            video_a_path = os.path.join(BASE_DIR, video_a_url.lstrip('/'))
-            if not os.path.exists(video_a_path):
-                return None, f"Source video A not found: {video_a_path}"
-        
-        # Handle both S3 URLs and local file paths for video B
-        video_b_url = input_data['video_b_path']
-        if video_b_url.startswith('http'):
-            # It's an S3 URL - download it first
-            print(f"   ...downloading video B from S3: {video_b_url}")
-            vid_response = requests.get(video_b_url)
-            vid_response.raise_for_status()
-            temp_video_b = f"temp_stitch_b_{uuid.uuid4()}.mp4"
-            video_b_path = os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video_b)
-            with open(video_b_path, "wb") as f:
-                f.write(vid_response.content)
-        else:
-            video_b_path = os.path.join(BASE_DIR, video_b_url.lstrip('/'))
-            if not os.path.exists(video_b_path):
-                return None, f"Source video B not found: {video_b_path}"
+        with contextlib.ExitStack() as cleanup:
+            print(f"-> Starting video stitching for job {job.id}...")
+            input_data = job.inputs()
             
-        # Check file sizes (basic validation)
-        size_a = os.path.getsize(video_a_path)
-        size_b = os.path.getsize(video_b_path)
-        print(f"   ...video A: {size_a/1024/1024:.1f}MB, video B: {size_b/1024/1024:.1f}MB")
-        
-        # Reject very large files to prevent hanging
-        max_size = 100 * 1024 * 1024  # 100MB limit
-        if size_a > max_size or size_b > max_size:
-            return None, f"Video files too large for stitching (limit: 100MB). A: {size_a/1024/1024:.1f}MB, B: {size_b/1024/1024:.1f}MB"
-        
-        output_filename = f"stitched_{uuid.uuid4()}.mp4"
-        output_filepath = os.path.join(LIBRARY_FOLDER, output_filename)
-        
-        print(f"   ...output will be: {output_filepath}")
-        
-        # Import here to avoid circular imports
-        from video_processor import stitch_videos_with_ffmpeg
-        
-        # Call stitching with timeout protection
-        stitch_videos_with_ffmpeg(video_paths=[video_a_path, video_b_path], output_path=output_filepath)
-        
-        # Verify output file was created and has reasonable size
-        if not os.path.exists(output_filepath):
-            return None, "Stitching completed but output file was not created"
+            max_size = 100 * 1024 * 1024  # 100MB limit
             
-        output_size = os.path.getsize(output_filepath)
-        if output_size < 1024:  # Less than 1KB suggests failure
-            return None, f"Stitching produced invalid output file ({output_size} bytes)"
+            # Reject oversize S3 sources from their Content-Length before transferring anything
+            for name in ('A', 'B'):
+                src = input_data[f'video_{name.lower()}_path']
+                remote_size = remote_content_length(src) if src.startswith('http') else None
+                if remote_size is not None and remote_size > max_size:
+                    return None, f"Video files too large for stitching (limit: 100MB). {name}: {remote_size/1024/1024:.1f}MB"
             
-        print(f"   ...stitching successful: {output_size/1024/1024:.1f}MB output")
-        
-        # Upload to S3 if enabled
-        s3_key = f"library/{output_filename}"
-        public_url = upload_file(output_filepath, s3_key)
-        
-        # Clean up temp files if we downloaded from S3
-        if temp_video_a:
-            try:
-                os.remove(os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video_a))
-                print(f"   ...cleaned up temp video A")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp video A: {e}")
-        if temp_video_b:
-            try:
-                os.remove(os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video_b))
-                print(f"   ...cleaned up temp video B")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp video B: {e}")
-        
-        return public_url, None
+            # Handle both S3 URLs and local file paths for video A and video B;
+            # the two downloads are independent, so they run concurrently
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="StitchDownload") as executor:
+                futures = [
+                    (name, executor.submit(resolve_source, input_data[f'video_{name.lower()}_path'],
+                                           f'temp_stitch_{name.lower()}', suffix='.mp4', label=f'video {name}'))
+                    for name in ('A', 'B')
+                ]
+            # Register every successful download for cleanup before reporting a failure
+            video_paths, failures = [], []
+            for name, future in futures:
+                try:
+                    local_path, remove = future.result()
+                except Exception as e:
+                    failures.append((name, e))
+                    continue
+                cleanup.callback(remove)
+                video_paths.append(local_path)
+            for name, e in failures:
+                if isinstance(e, FileNotFoundError):
+                    return None, f"Source video {name} not found: {e}"
+                raise e
+            video_a_path, video_b_path = video_paths
+
+            # Check file sizes (basic validation)
+            size_a = os.path.getsize(video_a_path)
+            size_b = os.path.getsize(video_b_path)
+            print(f"   ...video A: {size_a/1024/1024:.1f}MB, video B: {size_b/1024/1024:.1f}MB")
+            
+            # Reject very large files to prevent hanging
+            if size_a > max_size or size_b > max_size:
+                return None, f"Video files too large for stitching (limit: 100MB). A: {size_a/1024/1024:.1f}MB, B: {size_b/1024/1024:.1f}MB"
+            
+            output_filename = f"stitched_{uuid.uuid4().hex}.mp4"
+            output_filepath = LIBRARY_PREFIX + output_filename
+            
+            print(f"   ...output will be: {output_filepath}")
+            
+            # Call stitching with timeout protection
+            stitch_videos_with_ffmpeg(video_paths=[video_a_path, video_b_path], output_path=output_filepath)
+            
+            # Verify output file was created and has reasonable size
+            if not os.path.exists(output_filepath):
+                return None, "Stitching completed but output file was not created"
+                
+            output_size = os.path.getsize(output_filepath)
+            if output_size < 1024:  # Less than 1KB suggests failure
+                return None, f"Stitching produced invalid output file ({output_size} bytes)"
+                
+            print(f"   ...stitching successful: {output_size/1024/1024:.1f}MB output")
+            
+            # Upload to S3 if enabled
+            s3_key = f"library/{output_filename}"
+            public_url = upload_file(output_filepath, s3_key)
+            
+            return public_url, None
         
     except Exception as e:
-        print(f"   ...ERROR in video stitching: {e}")
-        traceback.print_exc()
-        
-        # Clean up temp files on error too
-        if temp_video_a:
-            try:
-                os.remove(os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video_a))
-            except:
-                pass
-        if temp_video_b:
-            try:
-                os.remove(os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video_b))
-            except:
-                pass
-        
+        logger.exception("   ...ERROR in video stitching: %s", e)
         return None, f"Video stitching error: {e}"
 
 def handle_replicate_openai_generation(job):
     if not OPENAI_API_KEY: return None, "OpenAI API Key is required for this model but not found in .env file."
     try:
-        print(f"-> Starting OpenAI via Replicate generation for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
+        print(f"-> Starting OpenAI via Replicate generation for job {job.id}...")
+        input_data = job.inputs()
         full_prompt = f"{input_data['object_prompt']}, in the style of {input_data['style_prompt']}, on a transparent background"
         api_input = {"prompt": full_prompt, "openai_api_key": OPENAI_API_KEY, "background": "transparent", "quality": "high", "output_format": "png", "aspect_ratio": "1:1"}
         print("   ...calling openai/gpt-image-1 on Replicate.")
-        output = replicate.run("openai/gpt-image-1", input=api_input)
+        output = replicate_client.run("openai/gpt-image-1", input=api_input)
         output_url = output[0] if isinstance(output, list) and output else output if isinstance(output, str) else None
         if not output_url: return None, "Replicate OpenAI model did not return an image URL."
         print(f"   ...downloading image from Replicate: {output_url}")
-        image_res = requests.get(output_url)
-        image_res.raise_for_status()
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(LIBRARY_FOLDER, filename)
-        with open(filepath, "wb") as f: f.write(image_res.content)
-        
-        # Upload to S3 if enabled
-        s3_key = f"library/{filename}"
-        public_url = upload_file(filepath, s3_key)
+        public_url = store_remote_file(output_url, LIBRARY_FOLDER, "library", ".png")
         return public_url, None
     except Exception as e:
         return None, f"Replicate OpenAI generation error: {e}"
 
 def handle_bytedance_generation(job):
     try:
-        print(f"-> Starting Bytedance Seedream-4 generation for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
+        print(f"-> Starting Bytedance Seedream-4 generation for job {job.id}...")
+        input_data = job.inputs()
         engineered_prompt = (f"professional product shot of a {input_data['object_prompt']}, " f"in the style of {input_data['style_prompt']}, centered, " f"on a solid bright green flat neutral background, no shadows")
         print(f"   ...calling bytedance/seedream-4")
-        greenscreen_output = replicate.run("bytedance/seedream-4", input={"prompt": engineered_prompt, "size": "1K", "aspect_ratio": "1:1"})
+        greenscreen_output = replicate_client.run("bytedance/seedream-4", input={"prompt": engineered_prompt, "size": "1K", "aspect_ratio": "1:1"})
         greenscreen_url = greenscreen_output[0] if greenscreen_output else None
         if not greenscreen_url: return None, "Bytedance model did not return an image URL."
         print(f"   ...downloading greenscreen image.")
-        img_res = requests.get(greenscreen_url)
-        img_res.raise_for_status()
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(LIBRARY_FOLDER, filename)
-        with open(filepath, "wb") as f: f.write(img_res.content)
-        
-        # Upload to S3 if enabled
-        s3_key = f"library/{filename}"
-        public_url = upload_file(filepath, s3_key)
+        public_url = store_remote_file(greenscreen_url, LIBRARY_FOLDER, "library", ".png")
         return public_url, None
     except Exception as e:
-        print(f"   ❌ Bytedance generation error: {e}")
-        traceback.print_exc()
+        logger.exception("   ❌ Bytedance generation error: %s", e)
         return None, f"Bytedance generation error: {e}"
 
 def handle_flux_generation(job):
     try:
-        print(f"-> Starting FLUX 1.1 Pro generation for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
+        print(f"-> Starting FLUX 1.1 Pro generation for job {job.id}...")
+        input_data = job.inputs()
         
         # Build prompt from object and style
         full_prompt = f"{input_data['object_prompt']}, in the style of {input_data['style_prompt']}, isolated and centered in the frame not touching the edges, on a white matte flat background, on a transparent background"
@@ -1160,7 +1899,7 @@ def handle_flux_generation(job):
         print(f"   ...calling black-forest-labs/flux-1.1-pro on Replicate")
         print(f"   ...prompt: {full_prompt[:100]}...")
         
-        output = replicate.run("black-forest-labs/flux-1.1-pro", input=api_input)
+        output = replicate_client.run("black-forest-labs/flux-1.1-pro", input=api_input)
         
         # DEBUG: See what FLUX actually returns
         print(f"   ...FLUX output type: {type(output)}")
@@ -1191,72 +1930,39 @@ def handle_flux_generation(job):
             return None, f"FLUX model did not return an image URL. Got: {type(output).__name__}"
         
         print(f"   ...downloading image from Replicate: {output_url}")
-        image_res = requests.get(output_url)
-        image_res.raise_for_status()
-        
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(LIBRARY_FOLDER, filename)
-        with open(filepath, "wb") as f:
-            f.write(image_res.content)
-        
-        # Upload to S3 if enabled
-        s3_key = f"library/{filename}"
-        public_url = upload_file(filepath, s3_key)
+        public_url = store_remote_file(output_url, LIBRARY_FOLDER, "library", ".png")
         return public_url, None
         
     except Exception as e:
-        print(f"   ❌ FLUX generation error: {e}")
-        traceback.print_exc()
+        logger.exception("   ❌ FLUX generation error: %s", e)
         return None, f"FLUX generation error: {e}"
 
 def handle_background_removal(job):
     try:
-        print(f"-> Starting BRIA background removal for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
+        print(f"-> Starting BRIA background removal for job {job.id}...")
+        input_data = job.inputs()
         image_path = input_data.get("image_path")
         if not image_path: return None, "No image path provided for background removal."
         
-        # Handle both S3 URLs and local file paths
-        temp_input_file = None
-        if image_path.startswith('http'):
-            # It's an S3 URL - download it first
-            print(f"   ...downloading image from S3: {image_path}")
-            img_response = requests.get(image_path)
-            img_response.raise_for_status()
-            temp_filename = f"temp_{uuid.uuid4()}.png"
-            temp_input_file = os.path.join(LIBRARY_FOLDER, temp_filename)
-            with open(temp_input_file, "wb") as f:
-                f.write(img_response.content)
-            input_file_handle = open(temp_input_file, "rb")
-        else:
-            # It's a local path
-            if image_path.startswith('/'):
-                full_image_path = os.path.join(BASE_DIR, image_path.lstrip('/'))
-            else:
-                full_image_path = os.path.join(BASE_DIR, image_path)
-            if not os.path.exists(full_image_path): 
-                return None, f"File not found for background removal: {full_image_path}"
-            input_file_handle = open(full_image_path, "rb")
-        
-        print(f"   ...uploading to Replicate (851-labs/background-remover)")
-        output = replicate.run(
-            "851-labs/background-remover:a029dff38972b5fda4ec5d75d7d1cd25aeff621d2cf4946a41055d7db66b80bc",
-            input={
-                "image": input_file_handle,
-                "threshold": 0,
-                "background_type": "rgba",
-                "format": "png"
-            }
-        )
-        input_file_handle.close()
-        
-        # Clean up temp file if we downloaded from S3
-        if temp_input_file:
+        # Handle both S3 URLs and local file paths - the temp download is removed once Replicate has the image
+        with contextlib.ExitStack() as cleanup:
             try:
-                os.remove(temp_input_file)
-                print(f"   ...cleaned up temp input file")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp file: {e}")
+                full_image_path, remove_input = resolve_source(image_path, 'temp', label='image')
+            except FileNotFoundError as e:
+                return None, f"File not found for background removal: {e}"
+            cleanup.callback(remove_input)
+            input_file_handle = cleanup.enter_context(open(full_image_path, "rb"))
+            
+            print(f"   ...uploading to Replicate (851-labs/background-remover)")
+            output = replicate_client.run(
+                get_replicate_model("851-labs/background-remover:a029dff38972b5fda4ec5d75d7d1cd25aeff621d2cf4946a41055d7db66b80bc"),
+                input={
+                    "image": input_file_handle,
+                    "threshold": 0,
+                    "background_type": "rgba",
+                    "format": "png"
+                }
+            )
         
         print(f"   ...downloading result from Replicate")
         # Handle FileOutput object from 851-labs
@@ -1267,36 +1973,29 @@ def handle_background_removal(job):
         else:
             result_url = output[0] if isinstance(output, list) and output else str(output)
         print(f"   ...result URL: {result_url}")
-        result_response = requests.get(result_url)
-        result_response.raise_for_status()
-        
-        filename = f"{uuid.uuid4()}.png"
-        filepath = os.path.join(LIBRARY_FOLDER, filename)
-        with open(filepath, "wb") as f:
-            f.write(result_response.content)
-        
+        public_url = store_remote_file(result_url, LIBRARY_FOLDER, "library", ".png")
         print(f"   ...background removed successfully with 851-labs")
-        
-        # Upload to S3 if enabled
-        s3_key = f"library/{filename}"
-        public_url = upload_file(filepath, s3_key)
         return public_url, None
     except Exception as e:
-        print(f"   ❌ Background removal error: {e}")
-        traceback.print_exc()
+        logger.exception("   ❌ Background removal error: %s", e)
         return None, f"851-labs background removal error: {e}"
 
+# Leonardo status polling backs off 2s -> 3s -> 4.5s ... capped at 10s, giving up after ~10 minutes
+LEONARDO_POLL_INITIAL = 2.0  # seconds
+LEONARDO_POLL_MAX = 10.0  # seconds
+LEONARDO_MAX_POLLS = 60
+
 def handle_leonardo_generation(job):
     try:
-        print(f"-> Starting Leonardo AI image generation for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
+        print(f"-> Starting Leonardo AI image generation for job {job.id}...")
+        input_data = job.inputs()
         model_id = input_data.get("modelId", "b24e16ff-06e3-43eb-8d33-4416c2d75876")
         preset_style = input_data.get("presetStyle", "NONE")
         full_prompt = f"{input_data['object_prompt']}, in the style of {input_data['style_prompt']}, centered, professional product shot"
         url = "https://cloud.leonardo.ai/api/rest/v1/generations"
         payload = {"height": 1024, "width": 1024, "modelId": model_id, "prompt": full_prompt, "num_images": 1, "presetStyle": preset_style, "transparency": "foreground_only", "negative_prompt": "text, watermark, blurry, deformed, distorted, ugly, signature"}
         headers = {"accept": "application/json", "content-type": "application/json", "authorization": f"Bearer {LEONARDO_API_KEY}"}
-        response = requests.post(url, json=payload, headers=headers)
+        response = HTTP_SESSION.post(url, json=payload, headers=headers)
         if response.status_code != 200:
             error_details = response.json().get('error', response.text)
             print(f"   Leonardo API Error: Status {response.status_code}, Details: {error_details}")
@@ -1304,566 +2003,530 @@ def handle_leonardo_generation(job):
         generation_id = response.json()['sdGenerationJob']['generationId']
         print(f"   Job submitted with ID: {generation_id}")
         get_url = f"https://cloud.leonardo.ai/api/rest/v1/generations/{generation_id}"
-        while True:
-            time.sleep(8)
-            response = requests.get(get_url, headers=headers)
+        delay = LEONARDO_POLL_INITIAL
+        for _ in range(LEONARDO_MAX_POLLS):
+            time.sleep(delay)
+            delay = min(delay * 1.5, LEONARDO_POLL_MAX)
+            response = HTTP_SESSION.get(get_url, headers=headers)
             response.raise_for_status()
             response_data = response.json()
             status = response_data['generations_by_pk']['status']
             if status == "COMPLETE":
-                image_urls = [img['url'] for img in response_data['generations_by_pk']['generated_images']]
-                filepaths = []
-                for url in image_urls:
-                    img_res = requests.get(url)
-                    filename = f"{uuid.uuid4()}.png"
-                    filepath = os.path.join(LIBRARY_FOLDER, filename)
-                    with open(filepath, "wb") as f: f.write(img_res.content)
-                    
-                    # Upload to S3 if enabled
-                    s3_key = f"library/{filename}"
-                    public_url = upload_file(filepath, s3_key)
-                    filepaths.append(public_url)
-                return filepaths[0], None
+                # Only the first image becomes the job result, so only that one is stored
+                generated_images = response_data['generations_by_pk']['generated_images']
+                if not generated_images:
+                    return None, "Leonardo AI job completed without any images."
+                return store_remote_file(generated_images[0]['url'], LIBRARY_FOLDER, "library", ".png"), None
             elif status == "FAILED":
                 return None, "Leonardo AI job failed."
+        return None, f"Leonardo AI job did not finish after {LEONARDO_MAX_POLLS} status checks."
     except Exception as e:
-        print(f"   ❌ Leonardo generation error: {e}")
-        traceback.print_exc()
+        logger.exception("   ❌ Leonardo generation error: %s", e)
         return None, f"Image generation error: {e}"
 
+# Image generation handler per modelId; anything else is a Leonardo model id
+IMAGE_HANDLERS = {
+    "bytedance-seedream-4": handle_bytedance_generation,
+    "replicate-gpt-image-1": handle_replicate_openai_generation,
+    "replicate-flux-1.1-pro": handle_flux_generation,
+}
+
 def handle_image_generation(job):
-    input_data = json.loads(job['input_data'])
-    model_id = input_data.get("modelId")
-    if model_id == "bytedance-seedream-4": return handle_bytedance_generation(job)
-    elif model_id == "replicate-gpt-image-1": return handle_replicate_openai_generation(job)
-    elif model_id == "replicate-flux-1.1-pro": return handle_flux_generation(job)
-    else: return handle_leonardo_generation(job)
+    model_id = job.inputs().get("modelId")
+    return IMAGE_HANDLERS.get(model_id, handle_leonardo_generation)(job)
+
+# Closing instruction appended to the system prompt for each single-image vision job type
+VISION_INSTRUCTIONS = {
+    'style_analysis': "Now analyze this image's visual style following the guidelines above.",
+    'palette_analysis': "Now analyze the color palette of this image.",
+    'animation_prompting': "Now provide animation ideas for this image.",
+}
+
+def vision_image_url(src, cleanup):
+    """
+    Image reference for a GPT-4o Vision message. S3/CDN objects are public, so their URL is passed
+    through for OpenAI to fetch; local files are inlined as a base64 data URL.
+    """
+    if src.startswith('http'):
+        print(f"   ...passing image URL to OpenAI: {src}")
+        return src
+    image_path, remove_image = resolve_source(src, 'temp_analysis', label='image')
+    cleanup.callback(remove_image)
+    print(f"   DEBUG: Full image path: {image_path}")
+    with open(image_path, "rb") as image_file:
+        return f"data:image/png;base64,{b64encode_str(image_file.read())}"
 
 def handle_openai_vision_analysis(job):
-    temp_image = None
     if not OPENAI_API_KEY: return None, "OpenAI API key is not initialized. Check API keys."
     try:
-        job_type = job['job_type'].replace('_', ' ').capitalize()
-        print(f"-> Starting OpenAI GPT-4o Vision Analysis ({job_type}) for job {job['id']}...")
-        input_data = json.loads(job['input_data'])
-        print(f"   DEBUG: input_data keys: {input_data.keys()}")
-        print(f"   DEBUG: image_path from input_data: {input_data.get('image_path', 'NOT FOUND')}")
-        system_prompt = input_data.get('system_prompt', 'Analyze this image.')
-        
-        # Handle both S3 URLs and local file paths
-        image_url = input_data['image_path']
-        if image_url.startswith('http'):
-            # It's an S3 URL - download it first
-            print(f"   ...downloading image from S3: {image_url}")
-            img_response = requests.get(image_url)
-            img_response.raise_for_status()
-            temp_image = f"temp_analysis_{uuid.uuid4()}.png"
-            image_path = os.path.join(LIBRARY_FOLDER, temp_image)
-            with open(image_path, "wb") as f:
-                f.write(img_response.content)
-        else:
-            image_path = os.path.join(BASE_DIR, image_url.lstrip('/'))
-            if not os.path.exists(image_path): 
-                return None, f"Image file not found at {image_path}"
-        
-        print(f"   DEBUG: Full image path: {image_path}")
-        print(f"   DEBUG: Image file exists: {os.path.exists(image_path)}")
-        
-        # Determine the appropriate user message based on job type
-        # For vision models, combine system prompt with user message for better instruction following
-        if job['job_type'] == 'style_analysis':
-            user_message = f"{system_prompt}\n\nNow analyze this image's visual style following the guidelines above."
-        elif job['job_type'] == 'palette_analysis':
-            user_message = f"{system_prompt}\n\nNow analyze the color palette of this image."
-        else:  # animation_prompting
-            user_message = f"{system_prompt}\n\nNow provide animation ideas for this image."
-        
-        print(f"   ...calling OpenAI GPT-4o Vision API")
-        print(f"   ...combined prompt length: {len(user_message)}")
-        print(f"   ...user message preview: {user_message[:150]}...")
-        
-        # Encode image to base64
-        import base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        # Use OpenAI's GPT-4o Vision model directly
-        # Note: For vision models, instructions work better in the user message with the image
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": user_message
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=600,  # Reduced to ensure shorter responses (under 1200 chars for Leonardo)
-            temperature=0.7
-        )
-        
-        analysis_text = response.choices[0].message.content
-        
-        print(f"   ...OpenAI GPT-4o analysis complete. Result length: {len(analysis_text) if analysis_text else 0}")
-        if analysis_text:
-            print(f"   ...Result preview: {analysis_text[:100]}...")
-        else:
-            print("   ...WARNING: Empty result from OpenAI!")
-        
-        # Clean up temp file if we downloaded from S3
-        if temp_image:
+        with contextlib.ExitStack() as cleanup:
+            job_type = job.job_type.replace('_', ' ').capitalize()
+            print(f"-> Starting OpenAI GPT-4o Vision Analysis ({job_type}) for job {job.id}...")
+            input_data = job.inputs()
+            print(f"   DEBUG: input_data keys: {input_data.keys()}")
+            print(f"   DEBUG: image_path from input_data: {input_data.get('image_path', 'NOT FOUND')}")
+            system_prompt = input_data.get('system_prompt', 'Analyze this image.')
+            
+            # Handle both S3 URLs and local file paths
             try:
-                os.remove(os.path.join(LIBRARY_FOLDER, temp_image))
-                print(f"   ...cleaned up temp image")
-            except Exception as e:
-                print(f"   ...warning: could not delete temp image: {e}")
+                image_url = vision_image_url(input_data['image_path'], cleanup)
+            except FileNotFoundError as e:
+                return None, f"Image file not found at {e}"
+            
+            # Determine the appropriate user message based on job type
+            # For vision models, combine system prompt with user message for better instruction following
+            instruction = VISION_INSTRUCTIONS.get(job.job_type, VISION_INSTRUCTIONS['animation_prompting'])
+            user_message = f"{system_prompt}\n\n{instruction}"
+            
+            print(f"   ...calling OpenAI GPT-4o Vision API")
+            print(f"   ...combined prompt length: {len(user_message)}")
+            print(f"   ...user message preview: {user_message[:150]}...")
+            
+            # Use OpenAI's GPT-4o Vision model directly
+            # Note: For vision models, instructions work better in the user message with the image
+            response = openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": user_message
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": image_url
+                                }
+                            }
+                        ]
+                    }
+                ],
+                max_tokens=600,  # Reduced to ensure shorter responses (under 1200 chars for Leonardo)
+                temperature=0.7
+            )
+            
+            analysis_text = response.choices[0].message.content
+            
+            print(f"   ...OpenAI GPT-4o analysis complete. Result length: {len(analysis_text) if analysis_text else 0}")
+            if analysis_text:
+                print(f"   ...Result preview: {analysis_text[:100]}...")
+            else:
+                print("   ...WARNING: Empty result from OpenAI!")
             
-        return analysis_text if analysis_text else None, None if analysis_text else "Empty response from OpenAI GPT-4o"
+            return analysis_text if analysis_text else None, None if analysis_text else "Empty response from OpenAI GPT-4o"
+    except Exception as e:
+        return None, f"OpenAI GPT-4o Vision API error: {e}"
+
+def handle_combined_vision_analysis(job):
+    """Style and palette analysis in a single GPT-4o Vision call; result is JSON {"style", "palette"}"""
+    if not OPENAI_API_KEY: return None, "OpenAI API key is not initialized. Check API keys."
+    try:
+        with contextlib.ExitStack() as cleanup:
+            print(f"-> Starting OpenAI GPT-4o Vision Analysis (Combined style + palette) for job {job.id}...")
+            input_data = job.inputs()
+            
+            image_urls = []
+            for key in ('image_path', 'color_image_path'):
+                try:
+                    image_urls.append(vision_image_url(input_data[key], cleanup))
+                except FileNotFoundError as e:
+                    return None, f"Image file not found at {e}"
+            
+            # Same instruction-in-user-message approach as the single analyses, one section per reference
+            user_message = (
+                "You will receive two images. The FIRST image is the style reference, the SECOND image is the color reference.\n\n"
+                f"STYLE INSTRUCTIONS (first image only):\n{input_data.get('style_system_prompt', 'Describe the visual style of this image.')}\n\n"
+                f"COLOR INSTRUCTIONS (second image only):\n{input_data.get('color_system_prompt', 'Extract the 5 most prominent colors of this image.')}\n\n"
+                'REQUIRED FORMAT - Return one valid JSON object only:\n'
+                '{"style": "<style description>", "palette": [{"hex": "#2F4F4F", "name": "dark slate grey"}, ...]}'
+            )
+            
+            print(f"   ...calling OpenAI GPT-4o Vision API (combined prompt length: {len(user_message)})")
+            response = openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [{"type": "text", "text": user_message}] + [
+                            {"type": "image_url", "image_url": {"url": url}} for url in image_urls
+                        ]
+                    }
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=800,
+                temperature=0.7
+            )
+            
+            analysis = json_loads(response.choices[0].message.content or "{}")
+            if not analysis.get('style') and not analysis.get('palette'):
+                return None, "Empty response from OpenAI GPT-4o"
+            
+            print(f"   ...OpenAI GPT-4o combined analysis complete. Palette colors: {len(analysis.get('palette') or [])}")
+            return json_dumps({"style": analysis.get('style') or "", "palette": analysis.get('palette') or []}), None
     except Exception as e:
-        # Clean up temp file on error too
-        if temp_image:
-            try:
-                os.remove(os.path.join(LIBRARY_FOLDER, temp_image))
-            except:
-                pass
         return None, f"OpenAI GPT-4o Vision API error: {e}"
 
 def handle_keying(job):
-    temp_video = None
     try:
-        job_id = job['id']
-        print(f"-> Starting OpenCV keying for job #{job_id}...")
-        print(f"   JOB #{job_id}: Job type: {job['job_type']}")
-        print(f"   JOB #{job_id}: Input video: {job['result_data']}")
-        
-        # Handle both S3 URLs and local file paths
-        video_url = job['result_data']
-        if video_url.startswith('http'):
-            # It's an S3 URL - download it first
-            print(f"   JOB #{job_id}: Downloading video from S3...")
-            vid_response = requests.get(video_url)
-            vid_response.raise_for_status()
-            temp_video = f"temp_keying_{uuid.uuid4()}.mp4"
-            greenscreen_video_path = os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video)
-            with open(greenscreen_video_path, "wb") as f:
-                f.write(vid_response.content)
-            print(f"   JOB #{job_id}: Downloaded {len(vid_response.content)} bytes to {greenscreen_video_path}")
-        else:
-            # It's a local path
-            greenscreen_video_path = os.path.join(BASE_DIR, video_url.lstrip('/'))
-            if not os.path.exists(greenscreen_video_path):
-                error_msg = f"Input video file not found: {greenscreen_video_path}"
+        with contextlib.ExitStack() as cleanup:
+            job_id = job.id
+            print(f"-> Starting OpenCV keying for job #{job_id}...")
+            print(f"   JOB #{job_id}: Job type: {job.job_type}")
+            print(f"   JOB #{job_id}: Input video: {job.result_data}")
+            
+            # Handle both S3 URLs and local file paths
+            try:
+                greenscreen_video_path, remove_video = resolve_source(job.result_data, 'temp_keying', suffix='.mp4', label='video')
+            except FileNotFoundError as e:
+                error_msg = f"Input video file not found: {e}"
                 print(f"   JOB #{job_id}: ERROR - {error_msg}")
                 return None, error_msg
+            cleanup.callback(remove_video)
+                
+            print(f"   JOB #{job_id}: Full input path: {greenscreen_video_path}")
+            print(f"   JOB #{job_id}: File exists: {os.path.exists(greenscreen_video_path)}")
+            print(f"   JOB #{job_id}: File size: {os.path.getsize(greenscreen_video_path)} bytes")
             
-        print(f"   JOB #{job_id}: Full input path: {greenscreen_video_path}")
-        print(f"   JOB #{job_id}: File exists: {os.path.exists(greenscreen_video_path)}")
-        print(f"   JOB #{job_id}: File size: {os.path.getsize(greenscreen_video_path)} bytes")
-        
-        # Parse keying settings
-        settings = json.loads(job['keying_settings'])
-        print(f"   JOB #{job_id}: Keying settings: {settings}")
-        
-        # Generate unique output filename
-        output_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.webm"
-        final_output_path = os.path.join(TRANSPARENT_VIDEOS_FOLDER, output_filename)
-        print(f"   JOB #{job_id}: Output will be: {final_output_path}")
-        
-        # Prepare keying parameters
-        lower_green = [settings['hue_center'] - settings['hue_tolerance'], settings['saturation_min'], settings['value_min']]
-        upper_green = [settings['hue_center'] + settings['hue_tolerance'], 255, 255]
-        print(f"   JOB #{job_id}: Color range - Lower: {lower_green}, Upper: {upper_green}")
-        
-        # Check if sticker effect OR posterize OR any exports are requested BEFORE processing
-        sticker_effect_requested = settings.get('sticker_effect', False)
-        posterize_requested = settings.get('posterize_enabled', False)
-        export_gif = settings.get('export_gif', False)
-        export_png_zip = settings.get('export_png_zip', False)
-        skip_encoding_needed = sticker_effect_requested or posterize_requested or export_gif or export_png_zip
-        
-        # Initialize export URLs (will be set if exports are requested)
-        gif_url = None
-        zip_url = None
-        
-        # Process video (keying)
-        print(f"   JOB #{job_id}: ▶️  Starting video keying...")
-        if skip_encoding_needed:
-            effects_list = []
-            if sticker_effect_requested:
-                effects_list.append("sticker effects")
-            if posterize_requested:
-                effects_list.append("posterize time")
-            if export_gif:
-                effects_list.append("GIF export")
-            if export_png_zip:
-                effects_list.append("PNG ZIP export")
-            print(f"   JOB #{job_id}: 🎨 {', '.join(effects_list)} requested - will skip encoding until after processing")
-        
-        keying_result = process_video_with_opencv(
-            video_path=greenscreen_video_path, 
-            output_path=final_output_path, 
-            lower_green=lower_green, 
-            upper_green=upper_green, 
-            erode_amount=settings['erode'], 
-            dilate_amount=settings['dilate'], 
-            blur_amount=settings['blur'], 
-            spill_amount=settings['spill'],
-            skip_encoding=skip_encoding_needed  # Skip encoding if any post-effects will be applied
-        )
-        
-        # If any post-processing is requested, keying_result = (fps, frame_count, keyed_frames_dir)
-        if skip_encoding_needed:
-            fps, frame_count, keyed_frames_dir = keying_result
-            print(f"   JOB #{job_id}: ✅ Keying complete - {frame_count} frames saved to {keyed_frames_dir}")
+            # Parse keying settings
+            settings = json_loads(job.keying_settings)
+            print(f"   JOB #{job_id}: Keying settings: {settings}")
             
-            # STEP 1: Apply sticker effects if requested
-            if sticker_effect_requested:
-                print(f"   JOB #{job_id}: 🎨 Applying sticker effects to keyed frames...")
-                
-                # Get sticker effect parameters
-                displacement_intensity = settings.get('displacement_intensity', 50)
-                darker_opacity = settings.get('darker_opacity', 1.0)
-                screen_opacity = settings.get('screen_opacity', 0.7)
-                enable_bevel = settings.get('enable_bevel', False)
-                bevel_depth = settings.get('bevel_depth', 3)
-                bevel_highlight = settings.get('bevel_highlight', 0.5)
-                bevel_shadow = settings.get('bevel_shadow', 0.5)
-                enable_alpha_bevel = settings.get('enable_alpha_bevel', False)
-                alpha_bevel_size = settings.get('alpha_bevel_size', 15)
-                alpha_bevel_blur = settings.get('alpha_bevel_blur', 2)
-                alpha_bevel_angle = settings.get('alpha_bevel_angle', 70)
-                alpha_bevel_highlight = settings.get('alpha_bevel_highlight', 0.6)
-                alpha_bevel_shadow = settings.get('alpha_bevel_shadow', 0.6)
-                enable_shadow = settings.get('enable_shadow', False)
-                shadow_blur = settings.get('shadow_blur', 0)
-                shadow_x = settings.get('shadow_x', 1)
-                shadow_y = settings.get('shadow_y', 1)
-                shadow_opacity = settings.get('shadow_opacity', 1.0)
-                
-                print(f"      Displacement: {displacement_intensity}, Multiply: {darker_opacity}, Add: {screen_opacity}")
-                print(f"      Surface bevel: {enable_bevel}, Alpha bevel: {enable_alpha_bevel}, Drop shadow: {enable_shadow}")
-                
-                # Load textures
-                disp_textures = load_texture_sequence(TEXTURE_DISPLACEMENT_FOLDER)
-                screen_textures = load_texture_sequence(TEXTURE_SCREEN_FOLDER)
-                print(f"   JOB #{job_id}: 📦 Loaded {len(disp_textures)} displacement textures, {len(screen_textures)} screen textures")
+            # Generate unique output filename
+            output_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.webm"
+            final_output_path = TRANSPARENT_VIDEOS_PREFIX + output_filename
+            print(f"   JOB #{job_id}: Output will be: {final_output_path}")
+            
+            # Prepare keying parameters
+            lower_green = [settings['hue_center'] - settings['hue_tolerance'], settings['saturation_min'], settings['value_min']]
+            upper_green = [settings['hue_center'] + settings['hue_tolerance'], 255, 255]
+            print(f"   JOB #{job_id}: Color range - Lower: {lower_green}, Upper: {upper_green}")
+            
+            # Check if sticker effect OR posterize OR any exports are requested BEFORE processing
+            sticker_effect_requested = settings.get('sticker_effect', False)
+            posterize_requested = settings.get('posterize_enabled', False)
+            export_gif = settings.get('export_gif', False)
+            export_png_zip = settings.get('export_png_zip', False)
+            skip_encoding_needed = sticker_effect_requested or posterize_requested or export_gif or export_png_zip
+            
+            # Initialize export URLs (will be set if exports are requested)
+            gif_url = None
+            zip_url = None
+            
+            # Process video (keying)
+            print(f"   JOB #{job_id}: ▶️  Starting video keying...")
+            if skip_encoding_needed:
+                effects_list = []
+                if sticker_effect_requested:
+                    effects_list.append("sticker effects")
+                if posterize_requested:
+                    effects_list.append("posterize time")
+                if export_gif:
+                    effects_list.append("GIF export")
+                if export_png_zip:
+                    effects_list.append("PNG ZIP export")
+                print(f"   JOB #{job_id}: 🎨 {', '.join(effects_list)} requested - will skip encoding until after processing")
+            
+            # Only the PNG ZIP export needs the frames on disk. Everything else (sticker effects, posterize,
+            # GIF export) streams keyed frames from memory into the WebM encoder, and the GIF encoder if requested.
+            stream_frames = skip_encoding_needed and not export_png_zip
+            posterize_fps = int(settings.get('posterize_fps', 12)) if posterize_requested else None
+            if stream_frames:
+                gif_path = None
+                if export_gif:
+                    gif_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.gif"
+                    gif_path = TRANSPARENT_VIDEOS_PREFIX + gif_filename
+                error_msg = encode_keyed_video_streaming(
+                    job_id, greenscreen_video_path, final_output_path,
+                    keying_args=(lower_green, upper_green, settings['erode'], settings['dilate'], settings['blur'], settings['spill']),
+                    sticker=load_sticker_settings(settings) if sticker_effect_requested else None,
+                    posterize_fps=posterize_fps,
+                    gif_path=gif_path
+                )
+                if error_msg:
+                    return None, error_msg
+                if gif_path and os.path.exists(gif_path):
+                    gif_url = f"{STATIC_URL_PREFIX}library/transparent_videos/{gif_filename}"
+                    print(f"   JOB #{job_id}: ✅ GIF exported: {gif_url}")
+                log_memory(job_id, "after streaming encode")
+                clear_memory()
+            else:
+                # Posterize time: frames it drops are never keyed, written or sticker-processed
+                frame_interval = posterize_frame_step(get_video_fps(greenscreen_video_path), posterize_fps) if posterize_requested else 1
+                keying_result = process_video_with_opencv(
+                    video_path=greenscreen_video_path, 
+                    output_path=final_output_path, 
+                    lower_green=lower_green, 
+                    upper_green=upper_green, 
+                    erode_amount=settings['erode'], 
+                    dilate_amount=settings['dilate'], 
+                    blur_amount=settings['blur'], 
+                    spill_amount=settings['spill'],
+                    skip_encoding=skip_encoding_needed,  # Skip encoding if any post-effects will be applied
+                    scratch_dir=SCRATCH_DIR,
+                    frame_step=frame_interval
+                )
+            
+            # If post-processing runs on the frame folder, keying_result = (fps, frame_count, keyed_frames_dir)
+            if skip_encoding_needed and not stream_frames:
+                fps, frame_count, keyed_frames_dir = keying_result
+                cleanup.callback(shutil.rmtree, keyed_frames_dir, ignore_errors=True)  # Also on any exception below
+                print(f"   JOB #{job_id}: ✅ Keying complete - {frame_count} frames saved to {keyed_frames_dir}")
                 
-                # Process each keyed frame with sticker effects
-                for frame_idx in range(frame_count):
-                    frame_filename = f"frame_{frame_idx:05d}.png"
-                    frame_path = os.path.join(keyed_frames_dir, frame_filename)
-                    
-                    if not os.path.exists(frame_path):
-                        print(f"   ⚠️ Warning: Frame {frame_idx} not found at {frame_path}")
-                        continue
+                # STEP 1: Apply sticker effects if requested
+                if sticker_effect_requested:
+                    print(f"   JOB #{job_id}: 🎨 Applying sticker effects to keyed frames...")
                     
-                    # Read keyed frame as PIL Image with alpha
-                    frame_pil = Image.open(frame_path).convert('RGBA')
+                    sticker = load_sticker_settings(settings)
+                    frame_paths = [os.path.join(keyed_frames_dir, f"frame_{frame_idx:05d}.png") for frame_idx in range(frame_count)]
+                    first_frame = next((path for path in frame_paths if os.path.exists(path)), None)
                     
-                    # Get animated textures for this frame
-                    disp_texture = disp_textures[frame_idx % len(disp_textures)] if disp_textures else None
-                    screen_texture = screen_textures[frame_idx % len(screen_textures)] if screen_textures else None
+                    # Textures are loaded and pre-resized once for the frame size (read from the first PNG header)
+                    disp_textures = screen_textures = ()
+                    if first_frame:
+                        with Image.open(first_frame) as first_image:
+                            frame_size = first_image.size
+                        disp_textures = get_sticker_textures(TEXTURE_DISPLACEMENT_FOLDER, frame_size)
+                        screen_textures = get_sticker_textures(TEXTURE_SCREEN_FOLDER, frame_size)
+                        print(f"   JOB #{job_id}: 📦 Loaded {len(disp_textures)} displacement textures, {len(screen_textures)} screen textures")
                     
-                    # Resize textures to match frame size
-                    if disp_texture:
-                        disp_texture = disp_texture.resize(frame_pil.size, Image.LANCZOS)
-                    if screen_texture:
-                        screen_texture = screen_texture.resize(frame_pil.size, Image.LANCZOS)
+                    # Frames are independent read -> process -> overwrite steps; the cv2/numba work releases
+                    # the GIL, so the sticker frame pool runs them side by side
+                    def process_frame_file(frame_idx):
+                        source_idx = frame_idx * frame_interval  # Textures follow the source frame number
+                        return _process_sticker_frame_file(
+                            frame_paths[frame_idx],
+                            disp_textures[source_idx % len(disp_textures)] if disp_textures else None,
+                            screen_textures[source_idx % len(screen_textures)] if screen_textures else None,
+                            sticker
+                        )
                     
-                    # Apply sticker effects to this frame
-                    processed_frame = apply_sticker_effect_to_frame(
-                        frame_pil, disp_texture, screen_texture,
-                        displacement_intensity, darker_opacity, screen_opacity,
-                        enable_bevel, bevel_depth, bevel_highlight, bevel_shadow,
-                        enable_alpha_bevel, alpha_bevel_size, alpha_bevel_blur, 
-                        alpha_bevel_angle, alpha_bevel_highlight, alpha_bevel_shadow,
-                        enable_shadow, shadow_blur, shadow_x, shadow_y, shadow_opacity
-                    )
+                    # Pool tasks take STICKER_FRAME_BATCH frames each, like the streaming pipelines
+                    def process_frame_files(start):
+                        return [process_frame_file(frame_idx) for frame_idx in range(start, min(start + STICKER_FRAME_BATCH, frame_count))]
                     
-                    # Save processed frame (overwrite the keyed frame)
-                    processed_frame.save(frame_path, 'PNG')
+                    with ThreadPoolExecutor(max_workers=STICKER_FRAME_WORKERS, thread_name_prefix="StickerFrame") as executor:
+                        batches = executor.map(process_frame_files, range(0, frame_count, STICKER_FRAME_BATCH))
+                        for frame_idx, processed in enumerate(itertools.chain.from_iterable(batches)):
+                            if not processed:
+                                print(f"   ⚠️ Warning: Frame {frame_idx} not found at {frame_paths[frame_idx]}")
+                            if frame_idx % 10 == 0 and frame_idx > 0:
+                                print(f"      Processed {frame_idx}/{frame_count} frames...")
+                                log_memory(job_id, f"at frame {frame_idx}/{frame_count}")
                     
-                    # CRITICAL: Clear frame from memory immediately to prevent accumulation
-                    del frame_pil, processed_frame
-                    if disp_texture:
-                        del disp_texture
-                    if screen_texture:
-                        del screen_texture
+                    print(f"   JOB #{job_id}: ✅ All {frame_count} frames processed with sticker effects")
+                    log_memory(job_id, "after sticker effects")
+                    clear_memory()  # Force cleanup before next step
+                
+                # STEP 2: Posterize time - keying already kept only every Nth frame, so just slow the output rate
+                output_fps = fps  # Default to original FPS
+                if posterize_requested:
+                    output_fps = posterize_fps
+                    print(f"   JOB #{job_id}: ⏱️  Posterize time: {fps}fps → {output_fps}fps, kept every {frame_interval} frame(s) ({frame_count} frames)")
+                
+                # STEP 3: Export GIF if requested
+                gif_url = None
+                if settings.get('export_gif', False):
+                    print(f"   JOB #{job_id}: 🎞️  Exporting GIF from PNG sequence...")
+                    gif_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.gif"
+                    gif_path = TRANSPARENT_VIDEOS_PREFIX + gif_filename
                     
-                    if frame_idx % 10 == 0 and frame_idx > 0:
-                        print(f"      Processed {frame_idx}/{frame_count} frames...")
-                        log_memory(job_id, f"at frame {frame_idx}/{frame_count}")
-                        clear_memory()  # Periodic cleanup during processing
+                    try:
+                        # Use ffmpeg to create GIF with good quality and transparency support
+                        gif_cmd = [
+                            'ffmpeg', '-y',
+                            '-framerate', str(output_fps),
+                            '-i', os.path.join(keyed_frames_dir, 'frame_%05d.png'),
+                            '-filter_complex', GIF_PALETTE_FILTER,
+                            gif_path
+                        ]
+                        result = subprocess.run(gif_cmd, capture_output=True, text=True)
+                        
+                        if result.returncode == 0:
+                            # Upload to S3 if enabled
+                            gif_url = f"{STATIC_URL_PREFIX}library/transparent_videos/{gif_filename}"
+                            print(f"   JOB #{job_id}: ✅ GIF exported: {gif_url}")
+                        else:
+                            print(f"   JOB #{job_id}: ⚠️ GIF export failed: {result.stderr}")
+                    except Exception as e:
+                        print(f"   JOB #{job_id}: ⚠️ GIF export error: {e}")
                 
-                print(f"   JOB #{job_id}: ✅ All {frame_count} frames processed with sticker effects")
-                log_memory(job_id, "after sticker effects")
-                clear_memory()  # Force cleanup before next step
-            
-            # STEP 2: Apply posterize time if requested
-            output_fps = fps  # Default to original FPS
-            if posterize_requested:
-                target_fps = int(settings.get('posterize_fps', 12))  # Convert to int
-                print(f"   JOB #{job_id}: ⏱️  Applying posterize time: {fps}fps → {target_fps}fps")
+                # STEP 4: Export PNG sequence as ZIP if requested
+                # The ZIP is disk-bound, so it is written on its own thread while ffmpeg encodes the WebM
+                zip_url = None
+                zip_future = None
+                if settings.get('export_png_zip', False):
+                    print(f"   JOB #{job_id}: 📦 Exporting PNG sequence as ZIP...")
+                    zip_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.zip"
+                    zip_path = TRANSPARENT_VIDEOS_PREFIX + zip_filename
+                    zip_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PngZip")
+                    zip_future = zip_executor.submit(write_png_zip, keyed_frames_dir, frame_count, zip_path)
+                    zip_executor.shutdown(wait=False)  # Its thread exits once the ZIP is written
                 
-                # Calculate frame interval: keep every Nth frame
-                frame_interval = int(fps / target_fps)
-                print(f"   JOB #{job_id}: 📐 Frame interval: keeping every {frame_interval} frame(s)")
+                print(f"   JOB #{job_id}: 🎬 Now encoding to final transparent WebM...")
+                log_memory(job_id, "before encoding")
                 
-                # Get all frame files
-                all_frames = sorted([f for f in os.listdir(keyed_frames_dir) if f.startswith('frame_') and f.endswith('.png')])
-                print(f"   JOB #{job_id}: 📋 Found {len(all_frames)} total frames")
+                # Encode the processed frames to WebM with transparency
+                # Use output_fps (which may be modified by posterize time)
+                ffmpeg_cmd = [
+                    'ffmpeg', '-y',
+                    '-framerate', str(output_fps),
+                    '-i', os.path.join(keyed_frames_dir, 'frame_%05d.png'),
+                    *vp9_alpha_encoder_args(15),
+                    final_output_path
+                ]
                 
-                # Delete frames that don't match the interval
-                frames_to_keep = []
-                for i, frame_file in enumerate(all_frames):
-                    if i % frame_interval == 0:
-                        frames_to_keep.append(frame_file)
-                    else:
-                        frame_path = os.path.join(keyed_frames_dir, frame_file)
-                        os.remove(frame_path)
+                print(f"   📝 FFmpeg command: {' '.join(ffmpeg_cmd)}")
+                result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
                 
-                print(f"   JOB #{job_id}: 🗑️  Deleted {len(all_frames) - len(frames_to_keep)} frames, kept {len(frames_to_keep)}")
+                if zip_future is not None:
+                    # The frames are deleted below, so the ZIP has to be finished first
+                    try:
+                        zipped_frames = zip_future.result()
+                        zip_url = f"{STATIC_URL_PREFIX}library/transparent_videos/{zip_filename}"
+                        print(f"   JOB #{job_id}: ✅ PNG ZIP exported ({zipped_frames} frames): {zip_url}")
+                    except Exception as e:
+                        print(f"   JOB #{job_id}: ⚠️ PNG ZIP export error: {e}")
                 
-                # Rename remaining frames to be sequential
-                for new_idx, old_frame_file in enumerate(frames_to_keep):
-                    old_path = os.path.join(keyed_frames_dir, old_frame_file)
-                    new_filename = f"frame_{new_idx:05d}.png"
-                    new_path = os.path.join(keyed_frames_dir, new_filename)
-                    
-                    if old_path != new_path:
-                        os.rename(old_path, new_path)
+                if result.returncode != 0:
+                    print(f"   ❌ FFmpeg encoding error: {result.stderr}")
+                    print(f"   📄 FFmpeg stdout: {result.stdout}")
+                    shutil.rmtree(keyed_frames_dir, ignore_errors=True)
+                    return None, "FFmpeg encoding failed after sticker effects"
                 
-                print(f"   JOB #{job_id}: ✅ Frames renumbered sequentially: 0 to {len(frames_to_keep)-1}")
+                # Verify output
+                verify_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', 
+                              '-show_entries', 'stream=pix_fmt', '-of', 'default=noprint_wrappers=1:nokey=1', 
+                              final_output_path]
+                verify_result = subprocess.run(verify_cmd, capture_output=True, text=True)
+                output_pix_fmt = verify_result.stdout.strip()
+                print(f"   🔍 Output pixel format: {output_pix_fmt}")
+                if 'yuva' not in output_pix_fmt:
+                    print(f"   ⚠️ WARNING: Output video may not have alpha channel! Got {output_pix_fmt} instead of yuva420p")
                 
-                # Update frame count and output FPS
-                frame_count = len(frames_to_keep)
-                output_fps = target_fps
-                print(f"   JOB #{job_id}: 🎬 Will encode at {output_fps}fps for stop-motion effect")
-                log_memory(job_id, "after posterize time")
-                clear_memory()  # Force cleanup before encoding
-            
-            # STEP 3: Export GIF if requested
-            gif_url = None
-            if settings.get('export_gif', False):
-                print(f"   JOB #{job_id}: 🎞️  Exporting GIF from PNG sequence...")
-                gif_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.gif"
-                gif_path = os.path.join(TRANSPARENT_VIDEOS_FOLDER, gif_filename)
+                # Clean up keyed frames directory
+                print(f"   JOB #{job_id}: 🧹 Cleaning up temporary frames...")
+                shutil.rmtree(keyed_frames_dir, ignore_errors=True)
+                clear_memory()  # Final cleanup
+                log_memory(job_id, "after cleanup")
                 
-                try:
-                    # Use ffmpeg to create GIF with good quality and transparency support
-                    # Create palette first for better quality
-                    palette_path = os.path.join(keyed_frames_dir, 'palette.png')
-                    palette_cmd = [
-                        'ffmpeg', '-y',
-                        '-framerate', str(output_fps),
-                        '-i', os.path.join(keyed_frames_dir, 'frame_%05d.png'),
-                        '-vf', 'palettegen=stats_mode=diff',
-                        palette_path
-                    ]
-                    subprocess.run(palette_cmd, capture_output=True, check=True)
-                    
-                    # Generate GIF using the palette
-                    gif_cmd = [
-                        'ffmpeg', '-y',
-                        '-framerate', str(output_fps),
-                        '-i', os.path.join(keyed_frames_dir, 'frame_%05d.png'),
-                        '-i', palette_path,
-                        '-lavfi', 'paletteuse=dither=bayer:bayer_scale=5',
-                        gif_path
-                    ]
-                    result = subprocess.run(gif_cmd, capture_output=True, text=True)
-                    
-                    if result.returncode == 0:
-                        # Upload to S3 if enabled
-                        s3_key = f"library/transparent_videos/{gif_filename}"
-                        gif_url = upload_file(gif_path, s3_key)
-                        print(f"   JOB #{job_id}: ✅ GIF exported: {gif_url}")
-                    else:
-                        print(f"   JOB #{job_id}: ⚠️ GIF export failed: {result.stderr}")
-                except Exception as e:
-                    print(f"   JOB #{job_id}: ⚠️ GIF export error: {e}")
+            elif not skip_encoding_needed:
+                # No sticker effects - video was encoded directly by process_video_with_opencv
+                print(f"   JOB #{job_id}: ✅ Keying completed (no sticker effects)")
             
-            # STEP 4: Export PNG sequence as ZIP if requested
-            zip_url = None
-            if settings.get('export_png_zip', False):
-                print(f"   JOB #{job_id}: 📦 Exporting PNG sequence as ZIP...")
-                zip_filename = f"keyed_{job_id}_{uuid.uuid4().hex[:8]}.zip"
-                zip_path = os.path.join(TRANSPARENT_VIDEOS_FOLDER, zip_filename)
+            # Verify final output was created
+            if not os.path.exists(final_output_path):
+                error_msg = f"Output file was not created: {final_output_path}"
+                print(f"   JOB #{job_id}: ERROR - {error_msg}")
+                return None, error_msg
                 
-                try:
-                    import zipfile
-                    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
-                        frame_files = sorted([f for f in os.listdir(keyed_frames_dir) if f.startswith('frame_') and f.endswith('.png')])
-                        for frame_file in frame_files:
-                            frame_path = os.path.join(keyed_frames_dir, frame_file)
-                            zipf.write(frame_path, arcname=frame_file)
-                    
-                    # Upload to S3 if enabled
-                    s3_key = f"library/transparent_videos/{zip_filename}"
-                    zip_url = upload_file(zip_path, s3_key)
-                    print(f"   JOB #{job_id}: ✅ PNG ZIP exported ({len(frame_files)} frames): {zip_url}")
-                except Exception as e:
-                    print(f"   JOB #{job_id}: ⚠️ PNG ZIP export error: {e}")
-            
-            print(f"   JOB #{job_id}: 🎬 Now encoding to final transparent WebM...")
-            log_memory(job_id, "before encoding")
-            
-            # Encode the processed frames to WebM with transparency
-            # Use output_fps (which may be modified by posterize time)
-            ffmpeg_cmd = [
-                'ffmpeg', '-y',
-                '-framerate', str(output_fps),
-                '-i', os.path.join(keyed_frames_dir, 'frame_%05d.png'),
-                '-c:v', 'libvpx-vp9',
-                '-pix_fmt', 'yuva420p',
-                '-crf', '15',
-                '-b:v', '0',
-                final_output_path
-            ]
+            output_size = os.path.getsize(final_output_path)
+            print(f"   JOB #{job_id}: ✅ Final video ready!")
+            print(f"   JOB #{job_id}: Output file: {final_output_path}")
+            print(f"   JOB #{job_id}: Output size: {output_size} bytes")
             
-            print(f"   📝 FFmpeg command: {' '.join(ffmpeg_cmd)}")
-            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"   ❌ FFmpeg encoding error: {result.stderr}")
-                print(f"   📄 FFmpeg stdout: {result.stdout}")
-                shutil.rmtree(keyed_frames_dir, ignore_errors=True)
-                return None, "FFmpeg encoding failed after sticker effects"
-            
-            # Verify output
-            verify_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', 
-                          '-show_entries', 'stream=pix_fmt', '-of', 'default=noprint_wrappers=1:nokey=1', 
-                          final_output_path]
-            verify_result = subprocess.run(verify_cmd, capture_output=True, text=True)
-            output_pix_fmt = verify_result.stdout.strip()
-            print(f"   🔍 Output pixel format: {output_pix_fmt}")
-            if 'yuva' not in output_pix_fmt:
-                print(f"   ⚠️ WARNING: Output video may not have alpha channel! Got {output_pix_fmt} instead of yuva420p")
-            
-            # Clean up keyed frames directory
-            print(f"   JOB #{job_id}: 🧹 Cleaning up temporary frames...")
-            shutil.rmtree(keyed_frames_dir, ignore_errors=True)
-            clear_memory()  # Final cleanup
-            log_memory(job_id, "after cleanup")
+            # Local URLs for now - with S3 enabled the upload thread swaps in the public URLs
+            public_url = f"{STATIC_URL_PREFIX}library/transparent_videos/{output_filename}"
             
-        else:
-            # No sticker effects - video was encoded directly by process_video_with_opencv
-            print(f"   JOB #{job_id}: ✅ Keying completed (no sticker effects)")
-        
-        # Verify final output was created
-        if not os.path.exists(final_output_path):
-            error_msg = f"Output file was not created: {final_output_path}"
-            print(f"   JOB #{job_id}: ERROR - {error_msg}")
-            return None, error_msg
+            # Build result data with all export URLs
+            result_data = {
+                'webm': public_url,
+                'gif': gif_url,
+                'png_zip': zip_url
+            }
             
-        output_size = os.path.getsize(final_output_path)
-        print(f"   JOB #{job_id}: ✅ Final video ready!")
-        print(f"   JOB #{job_id}: Output file: {final_output_path}")
-        print(f"   JOB #{job_id}: Output size: {output_size} bytes")
-        
-        # Upload to S3 if enabled
-        s3_key = f"library/transparent_videos/{output_filename}"
-        print(f"   JOB #{job_id}: 📤 Uploading keyed video to S3: {s3_key}")
-        public_url = upload_file(final_output_path, s3_key)
-        print(f"   JOB #{job_id}: 📤 S3 upload complete. Public URL: {public_url}")
-        
-        if not public_url:
-            error_msg = "S3 upload failed - no URL returned"
-            print(f"   JOB #{job_id}: ❌ ERROR: {error_msg}")
-            return None, error_msg
-        
-        # Clean up temp INPUT file if we downloaded from S3
-        if temp_video:
-            temp_path = os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video)
-            try:
-                print(f"   JOB #{job_id}: 🧹 Cleaning up temp INPUT file: {temp_path}")
-                os.remove(temp_path)
-                print(f"   JOB #{job_id}: ✅ Temp INPUT file deleted")
-            except Exception as e:
-                print(f"   JOB #{job_id}: ⚠️ Warning: could not delete temp INPUT file: {e}")
-        
-        # Build result data with all export URLs
-        result_data = {
-            'webm': public_url,
-            'gif': gif_url,
-            'png_zip': zip_url
-        }
-        
-        # Return as JSON string for backward compatibility with existing code
-        result_json = json.dumps(result_data)
-        print(f"   JOB #{job_id}: 🎉 Returning keyed video result: {result_json}")
-        return result_json, None
+            # Return as JSON string for backward compatibility with existing code
+            result_json = json_dumps(result_data)
+            print(f"   JOB #{job_id}: 🎉 Returning keyed video result: {result_json}")
+            return result_json, None
     except Exception as e:
-        print(f"   JOB #{job.get('id', '???')}: ❌ Keying failed with error: {e}")
-        traceback.print_exc()
-        
-        # Clean up temp file on error too
-        if temp_video:
-            try:
-                os.remove(os.path.join(ANIMATIONS_FOLDER_GENERATED, temp_video))
-            except:
-                pass
-        
+        logger.exception("   JOB #%s: ❌ Keying failed with error: %s", job.id, e)
         return None, f"Keying error: {e}"
 
+def ffmpeg_process_ages_from_proc():
+    """Yield (pid, minutes running) for ffmpeg processes by walking /proc (Linux, no subprocesses)."""
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    with open('/proc/uptime') as f:
+        uptime_seconds = float(f.read().split()[0])
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry.name}/comm') as f:
+                if f.read().strip() != 'ffmpeg':
+                    continue
+            with open(f'/proc/{entry.name}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue  # Process exited while we were looking
+        # starttime is field 22; split after the ")" that closes comm since comm may contain spaces
+        start_ticks = int(stat.rsplit(')', 1)[1].split()[19])
+        yield int(entry.name), int((uptime_seconds - start_ticks / clock_ticks) // 60)
+
+# ps etime formats: MM:SS, HH:MM:SS, D-HH:MM:SS
+ETIME_PATTERN = re.compile(r'^(?:(\d+)-)?(?:(\d+):)?(\d+):(\d+)$')
+
+def ffmpeg_process_ages_from_ps():
+    """Yield (pid, minutes running) for ffmpeg processes using pgrep/ps (macOS and other non-/proc systems)."""
+    # Find ffmpeg processes
+    result = subprocess.run(['pgrep', '-f', 'ffmpeg'], capture_output=True, text=True)
+    if result.returncode != 0:
+        return  # No ffmpeg processes found
+        
+    pids = result.stdout.strip().split('\n')
+    for pid in pids:
+        if not pid:
+            continue
+            
+        try:
+            # Get process start time
+            ps_result = subprocess.run(['ps', '-o', 'etime=', '-p', pid], capture_output=True, text=True)
+            if ps_result.returncode != 0:
+                continue
+                
+            match = ETIME_PATTERN.match(ps_result.stdout.strip())
+            if not match:
+                continue
+            days, hours, mins, _ = (int(part or 0) for part in match.groups())
+            yield int(pid), days * 1440 + hours * 60 + mins
+        except ValueError:
+            continue
+
+def ffmpeg_process_ages_from_psutil():
+    """Yield (pid, minutes running) for ffmpeg processes from a single psutil sweep (no subprocesses)."""
+    now = time.time()
+    for process in psutil.process_iter(['name', 'create_time']):
+        if process.info['name'] == 'ffmpeg' and process.info['create_time']:
+            yield process.pid, int((now - process.info['create_time']) // 60)
+
 def kill_stuck_ffmpeg_processes():
     """
     Kill ffmpeg processes that have been running too long.
     This prevents system resource exhaustion from stuck processes.
     """
     try:
-        # Find ffmpeg processes
-        result = subprocess.run(['pgrep', '-f', 'ffmpeg'], capture_output=True, text=True)
-        if result.returncode != 0:
-            return  # No ffmpeg processes found
-            
-        pids = result.stdout.strip().split('\n')
-        for pid in pids:
-            if not pid:
-                continue
-                
+        if MEMORY_MONITORING_AVAILABLE:
+            process_ages = ffmpeg_process_ages_from_psutil()
+        elif os.path.exists('/proc/uptime'):
+            process_ages = ffmpeg_process_ages_from_proc()
+        else:
+            process_ages = ffmpeg_process_ages_from_ps()
+        
+        for pid, minutes in process_ages:
             try:
-                # Get process start time
-                ps_result = subprocess.run(['ps', '-o', 'etime=', '-p', pid], capture_output=True, text=True)
-                if ps_result.returncode != 0:
-                    continue
-                    
-                elapsed_str = ps_result.stdout.strip()
-                
-                # Parse elapsed time (formats: MM:SS, H:MM:SS, or D-HH:MM:SS)
-                minutes = 0
-                if ':' in elapsed_str:
-                    parts = elapsed_str.split(':')
-                    if len(parts) == 2:  # MM:SS
-                        minutes = int(parts[0])
-                    elif len(parts) == 3:  # H:MM:SS or HH:MM:SS
-                        minutes = int(parts[0]) * 60 + int(parts[1])
-                    elif '-' in elapsed_str:  # D-HH:MM:SS
-                        days_part, time_part = elapsed_str.split('-')
-                        hours, mins, secs = time_part.split(':')
-                        minutes = int(days_part) * 24 * 60 + int(hours) * 60 + int(mins)
-                
                 # Kill processes running more than 5 minutes
                 if minutes > 5:
                     print(f"-> Killing stuck ffmpeg process {pid} (running {minutes} minutes)")
-                    os.kill(int(pid), signal.SIGTERM)
+                    os.kill(pid, signal.SIGTERM)
                     time.sleep(1)
                     # Force kill if still running
                     try:
-                        os.kill(int(pid), signal.SIGKILL)
+                        os.kill(pid, signal.SIGKILL)
                     except ProcessLookupError:
                         pass  # Already dead
                         
-            except (ValueError, ProcessLookupError, PermissionError) as e:
+            except (ProcessLookupError, PermissionError) as e:
                 # Process might have died or we don't have permission
                 continue
                 
@@ -1872,66 +2535,76 @@ def kill_stuck_ffmpeg_processes():
 
 def check_for_completed_automations(conn):
     cursor = conn.cursor()
-    waiting_jobs = cursor.execute("SELECT * FROM jobs WHERE job_type = 'boomerang_automation' AND status = 'waiting_for_children'").fetchall()
-    for meta_job in waiting_jobs:
-        children = cursor.execute("SELECT * FROM jobs WHERE parent_job_id = ? AND job_type = 'animation'", (meta_job['id'],)).fetchall()
-        if len(children) < 2: continue
-        
-        # Check for completed children - only consider truly completed (not pending_review)
-        # For boomerang automation, we only need result_data, not keyed_result_data
-        completed_children = [c for c in children if c['status'] == 'completed' and c['result_data']]
-        failed_children = [c for c in children if c['status'] == 'failed']
-        
-        # Count pending_review as not completed for boomerang - they need to finish processing first
-        pending_review = [c for c in children if c['status'] == 'pending_review']
-        
-        print(f"Checking automation job #{meta_job['id']}: {len(children)} children, {len(completed_children)} completed, {len(pending_review)} pending_review, {len(failed_children)} failed")
-        
-        if failed_children:
-            print(f"A child job for Automation Job #{meta_job['id']} failed. Marking as failed.")
-            error_messages = [f"Child job #{c['id']} failed: {c['error_message']}" for c in failed_children]
-            cursor.execute("UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ?", ("\n".join(error_messages), meta_job['id']))
-            conn.commit()
-            continue
-            
-        if len(completed_children) == 2:
-            print(f"All children for Automation Job #{meta_job['id']} are complete. Triggering stitch.")
+    # One aggregate query over all waiting automations; only those with a failed child or
+    # both children done come back, so idle ticks don't fetch any child rows.
+    # Only truly completed children count (not pending_review), and for boomerang
+    # automation we only need result_data, not keyed_result_data.
+    ready_automations = cursor.execute("""
+        SELECT p.id, p.prompt,
+               COUNT(*) AS total,
+               SUM(CASE WHEN c.status = 'completed' AND c.result_data IS NOT NULL AND c.result_data != '' THEN 1 ELSE 0 END) AS completed,
+               SUM(CASE WHEN c.status = 'failed' THEN 1 ELSE 0 END) AS failed,
+               SUM(CASE WHEN c.status = 'pending_review' THEN 1 ELSE 0 END) AS pending_review
+        FROM jobs p
+        JOIN jobs c ON c.parent_job_id = p.id AND c.job_type = 'animation'
+        WHERE p.job_type = 'boomerang_automation' AND p.status = 'waiting_for_children'
+        GROUP BY p.id
+        HAVING total >= 2 AND (failed > 0 OR completed = 2)
+    """).fetchall()
+    if not ready_automations:
+        return
+    
+    # Children and any existing stitch job of every ready automation, in one query
+    ready_ids = [meta_job['id'] for meta_job in ready_automations]
+    related = collections.defaultdict(list)
+    for row in cursor.execute(
+        f"SELECT id, parent_job_id, job_type, status, result_data, error_message FROM jobs "
+        f"WHERE parent_job_id IN ({', '.join('?' * len(ready_ids))}) AND job_type IN ('animation', 'video_stitching') ORDER BY id",
+        ready_ids
+    ):
+        related[row['parent_job_id']].append(row)
+    
+    # All status changes of this tick go into one transaction (one commit)
+    with conn:
+        for meta_job in ready_automations:
+            print(f"Checking automation job #{meta_job['id']}: {meta_job['total']} children, {meta_job['completed']} completed, {meta_job['pending_review']} pending_review, {meta_job['failed']} failed")
             
-            # Check if stitching job already exists to prevent duplicates
-            existing_stitch = cursor.execute("SELECT id FROM jobs WHERE parent_job_id = ? AND job_type = 'video_stitching'", (meta_job['id'],)).fetchone()
-            if existing_stitch:
-                print(f"   ...stitching job already exists (#{existing_stitch['id']}), skipping duplicate creation")
-                cursor.execute("UPDATE jobs SET status = 'stitching' WHERE id = ?", (meta_job['id'],))
-                conn.commit()
+            if meta_job['failed']:
+                print(f"A child job for Automation Job #{meta_job['id']} failed. Marking as failed.")
+                failed_children = [c for c in related[meta_job['id']] if c['job_type'] == 'animation' and c['status'] == 'failed']
+                error_messages = [f"Child job #{c['id']} failed: {c['error_message']}" for c in failed_children]
+                cursor.execute("UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ?", ("\n".join(error_messages), meta_job['id']))
                 continue
-            
-            # For boomerang automation, always use raw video results (not keyed) for stitching
-            # Sort to ensure consistent A->B, B->A order (first created, then second created)
-            children_sorted = sorted(completed_children, key=lambda x: x['id'])
-            video_paths = []
-            for c in children_sorted:
-                # Use raw result_data for boomerang automation stitching
-                video_path = c['result_data']
-                if not video_path:
-                    print(f"   ...warning: child job {c['id']} has no result_data")
+                
+            if meta_job['completed'] == 2:
+                print(f"All children for Automation Job #{meta_job['id']} are complete. Triggering stitch.")
+                
+                # Check if stitching job already exists to prevent duplicates
+                existing_stitch = next((c for c in related[meta_job['id']] if c['job_type'] == 'video_stitching'), None)
+                if existing_stitch:
+                    print(f"   ...stitching job already exists (#{existing_stitch['id']}), skipping duplicate creation")
+                    cursor.execute("UPDATE jobs SET status = 'stitching' WHERE id = ?", (meta_job['id'],))
                     continue
-                video_paths.append(video_path)
-            
-            if len(video_paths) == 2:
-                prompt = f"Stitched Loop: {meta_job['prompt']}"
-                stitch_input_data = json.dumps({"video_a_path": video_paths[0], "video_b_path": video_paths[1]})
-                # Create stitching job with current timestamp
-                stitch_timestamp = datetime.now()
-                cursor.execute("INSERT INTO jobs (job_type, status, created_at, prompt, input_data, parent_job_id) VALUES (?, ?, ?, ?, ?, ?)", ('video_stitching', 'queued', stitch_timestamp, prompt, stitch_input_data, meta_job['id']))
-                # Update parent job status and timestamp to be 1 second after stitching job so it appears above in queue
-                parent_timestamp = stitch_timestamp + timedelta(seconds=1)
-                cursor.execute("UPDATE jobs SET status = 'stitching', created_at = ? WHERE id = ?", (parent_timestamp, meta_job['id']))
-                conn.commit()
-                print(f"   ...queued stitching job for raw videos: {video_paths}")
-            else:
-                print(f"   ...error: not enough valid video paths for stitching: {video_paths}")
-        else:
-            print(f"   ...waiting for more children to complete: {len(completed_children)}/2")
+                
+                # For boomerang automation, always use raw video results (not keyed) for stitching
+                # Sort to ensure consistent A->B, B->A order (first created, then second created)
+                children_sorted = [c for c in related[meta_job['id']]
+                                   if c['job_type'] == 'animation' and c['status'] == 'completed' and c['result_data']]
+                # Use raw result_data for boomerang automation stitching
+                video_paths = [c['result_data'] for c in children_sorted]
+                
+                if len(video_paths) == 2:
+                    prompt = f"Stitched Loop: {meta_job['prompt']}"
+                    stitch_input_data = json_dumps({"video_a_path": video_paths[0], "video_b_path": video_paths[1]})
+                    # Create stitching job with current timestamp
+                    stitch_timestamp = datetime.now()
+                    cursor.execute("INSERT INTO jobs (job_type, status, created_at, prompt, input_data, parent_job_id) VALUES (?, ?, ?, ?, ?, ?)", ('video_stitching', 'queued', stitch_timestamp, prompt, stitch_input_data, meta_job['id']))
+                    # Update parent job status and timestamp to be 1 second after stitching job so it appears above in queue
+                    parent_timestamp = stitch_timestamp + timedelta(seconds=1)
+                    cursor.execute("UPDATE jobs SET status = 'stitching', created_at = ? WHERE id = ?", (parent_timestamp, meta_job['id']))
+                    print(f"   ...queued stitching job for raw videos: {video_paths}")
+                else:
+                    print(f"   ...error: not enough valid video paths for stitching: {video_paths}")
 
 def check_for_analysis_completion(conn):
     """Check if image generation jobs waiting for analysis can proceed"""
@@ -1939,35 +2612,71 @@ def check_for_analysis_completion(conn):
     waiting_jobs = cursor.execute(
         "SELECT * FROM jobs WHERE job_type = 'image_generation' AND status = 'waiting_for_analysis'"
     ).fetchall()
+    if not waiting_jobs:
+        return
     
+    # Parse every waiting job once and fetch all the analysis jobs they depend on in one query
+    waiting_inputs = {}
     for job in waiting_jobs:
         try:
-            input_data = json.loads(job['input_data'])
+            waiting_inputs[job['id']] = cached_json_loads(job['input_data'])
+        except Exception as e:
+            print(f"Error checking analysis for job {job['id']}: {e}")
+    analysis_ids = {
+        analysis_id
+        for input_data in waiting_inputs.values()
+        for analysis_id in (input_data.get('style_analysis_job_id'), input_data.get('color_analysis_job_id'))
+        if analysis_id
+    }
+    analysis_jobs = {}
+    if analysis_ids:
+        placeholders = ",".join("?" * len(analysis_ids))
+        analysis_jobs = {
+            row['id']: row for row in cursor.execute(
+                f"SELECT id, status, result_data FROM jobs WHERE id IN ({placeholders})", list(analysis_ids)
+            )
+        }
+    
+    queued_updates = []
+    for job in waiting_jobs:
+        if job['id'] not in waiting_inputs:
+            continue
+        try:
+            input_data = dict(waiting_inputs[job['id']])
             style_job_id = input_data.get('style_analysis_job_id')
             color_job_id = input_data.get('color_analysis_job_id')
             
             # Check if all required analysis jobs are completed
             analyses_complete = True
             style_result = None
-            color_result = None
+            color_result = None  # Colour analysis as stored (JSON text)
+            color_data = None  # ...or already parsed, when it came out of a combined analysis
             
-            if style_job_id:
-                style_job = cursor.execute(
-                    "SELECT status, result_data FROM jobs WHERE id = ?", (style_job_id,)
-                ).fetchone()
-                if style_job and style_job['status'] == 'completed':
-                    style_result = style_job['result_data']
+            if style_job_id and style_job_id == color_job_id:
+                # Single combined_vision_analysis child: split its JSON into the two results
+                combined_job = analysis_jobs.get(style_job_id)
+                if combined_job and combined_job['status'] == 'completed':
+                    combined = json_loads(combined_job['result_data'])
+                    style_result = combined.get('style')
+                    if combined.get('palette'):
+                        color_data = {"palette": combined['palette']}
                 else:
                     analyses_complete = False
             
-            if color_job_id:
-                color_job = cursor.execute(
-                    "SELECT status, result_data FROM jobs WHERE id = ?", (color_job_id,)
-                ).fetchone()
-                if color_job and color_job['status'] == 'completed':
-                    color_result = color_job['result_data']
-                else:
-                    analyses_complete = False
+            else:
+                if style_job_id:
+                    style_job = analysis_jobs.get(style_job_id)
+                    if style_job and style_job['status'] == 'completed':
+                        style_result = style_job['result_data']
+                    else:
+                        analyses_complete = False
+            
+                if color_job_id:
+                    color_job = analysis_jobs.get(color_job_id)
+                    if color_job and color_job['status'] == 'completed':
+                        color_result = color_job['result_data']
+                    else:
+                        analyses_complete = False
             
             # If all analyses are complete, merge results and queue the job
             if analyses_complete:
@@ -1977,14 +2686,18 @@ def check_for_analysis_completion(conn):
                 if style_result:
                     merged_style = style_result if not merged_style else f"{style_result}. {merged_style}"
                 
-                if color_result:
+                if color_result or color_data:
                     # Parse color palette and append
                     try:
-                        color_data = json.loads(color_result)
+                        if color_data is None:
+                            color_data = json_loads(color_result)
                         if 'palette' in color_data:
                             color_desc = ", ".join([f"{c['name']} ({c['hex']})" for c in color_data['palette']])
                             merged_style = f"{merged_style}. Color palette: {color_desc}" if merged_style else f"Color palette: {color_desc}"
-                    except:
+                    except (ValueError, TypeError, KeyError) as e:
+                        # Not a {"palette": [{name, hex}, ...]} result - use the text as it is
+                        logger.debug("Job %s: colour analysis is not a palette (%s), appending it verbatim", job['id'], e)
+                        color_result = color_result or json_dumps(color_data)
                         merged_style = f"{merged_style}. {color_result}" if merged_style else color_result
                 
                 # Update input_data with merged style
@@ -1994,226 +2707,529 @@ def check_for_analysis_completion(conn):
                 object_prompt = input_data.get('object_prompt', '')
                 new_prompt = f"{object_prompt}, in the style of {merged_style}" if merged_style else object_prompt
                 
-                # Update job to queued status with merged data
-                cursor.execute(
-                    "UPDATE jobs SET status = 'queued', prompt = ?, input_data = ? WHERE id = ?",
-                    (new_prompt, json.dumps(input_data), job['id'])
-                )
-                conn.commit()
-                print(f"-> Analysis complete for image_generation job {job['id']}, queued for processing")
+                # Update job to queued status with merged data (written below, one commit for all)
+                queued_updates.append((new_prompt, json_dumps(input_data), job['id']))
                 
         except Exception as e:
-            print(f"Error checking analysis for job {job['id']}: {e}")
-            traceback.print_exc()
+            logger.exception("Error checking analysis for job %s: %s", job['id'], e)
+    
+    if queued_updates:
+        with conn:
+            conn.executemany(
+                "UPDATE jobs SET status = 'queued', prompt = ?, input_data = ? WHERE id = ? AND status = 'waiting_for_analysis'",
+                queued_updates
+            )
+        for _, _, job_id in queued_updates:
+            print(f"-> Analysis complete for image_generation job {job_id}, queued for processing")
 
 def process_job(job, conn):
-    job_type = job['job_type']
-    status = job['status']
-    print(f"Processing job {job['id']} of type '{job_type}' with status '{status}'...")
+    job_type = job.job_type
+    status = job.status
+    print(f"Processing job {job.id} of type '{job_type}' with status '{status}'...")
     
     # Status-based routing takes precedence (for keying, etc.)
     if status in ['keying_queued', 'keying_processing']: 
-        print(f"   DEBUG: Job {job['id']} going to handle_keying() - type: {job_type}, status: {status}")
+        print(f"   DEBUG: Job {job.id} going to handle_keying() - type: {job_type}, status: {status}")
         return handle_keying(job)  # Any job type can be keyed
     
     # Job-type based routing for normal processing
     elif job_type == 'image_generation': return handle_image_generation(job)
     elif job_type == 'background_removal': return handle_background_removal(job)
     elif job_type in ['style_analysis', 'palette_analysis', 'animation_prompting']: return handle_openai_vision_analysis(job)
+    elif job_type == 'combined_vision_analysis': return handle_combined_vision_analysis(job)
     elif job_type == 'video_stitching': return handle_video_stitching(job)
     elif job_type == 'boomerang_automation': return handle_boomerang_automation(job, conn)
     elif job_type == 'trim': return handle_trim(job)
     elif job_type == 'animation' and status in ['queued', 'processing']: return handle_animation(job)
     else: return None, f"Unknown job type/status: {job_type}/{status}"
 
-def process_single_job_worker(job):
+# Finished-job UPDATEs by the column that carries the outcome (None = status only). The SQL text is fixed
+# per outcome, so each connection's statement cache prepares every one of them just once.
+JOB_RESULT_SQL = {
+    'error_message': "UPDATE jobs SET status = ?, error_message = ? WHERE id = ?",
+    'keyed_result_data': "UPDATE jobs SET status = ?, keyed_result_data = ? WHERE id = ?",
+    'result_data': "UPDATE jobs SET status = ?, result_data = ? WHERE id = ?",
+    None: "UPDATE jobs SET status = ? WHERE id = ?",
+}
+
+def apply_job_result(cursor, job, result_data, error_message):
+    """Write a finished job's outcome (and any boomerang parent/child status changes). Returns the new status."""
+    job_id = job.id
+    new_status, column, value = 'completed', 'result_data', result_data  # Default case for completion
+    if error_message is not None:
+        new_status, column, value = 'failed', 'error_message', str(error_message)
+        logger.info("   JOB #%s: ❌ Marking as FAILED with error: %s", job_id, error_message)
+    elif job.status in ['keying_queued', 'keying_processing']:
+        # Handle keying completion BEFORE checking job_type
+        if is_s3_enabled():
+            new_status = 'keying_processing'  # Upload thread completes it once the outputs are on S3
+        column = 'keyed_result_data'
+        logger.debug("   JOB #%s: ✅ Marking as %s with keyed_result_data: %s", job_id, new_status.upper(), result_data)
+    elif job.job_type == 'boomerang_automation':
+        # This is for initial boomerang setup, not keying
+        new_status, column = result_data, None  # This should be 'waiting_for_children'
+    elif job.status in ['queued', 'processing'] and job.parent_job_id and job.job_type in ['animation', 'video_stitching']:
+        if job.parent_job_type != 'boomerang_automation':
+            new_status = 'pending_review'  # Regular workflow needs review
+            logger.info("   ...setting %s job %s to pending_review (parent type: %s)", job.job_type, job_id, job.parent_job_type)
+        elif job.job_type == 'animation':
+            # Complete without keying for boomerang automation
+            logger.info("   ...auto-completing animation job %s (part of boomerang automation #%s)", job_id, job.parent_job_id)
+        else:
+            # The stitched result is the boomerang automation's result
+            logger.info("   ...completing stitching job %s and parent boomerang job #%s with the stitched result", job_id, job.parent_job_id)
+            cursor.execute(JOB_RESULT_SQL['result_data'], ('completed', result_data, job.parent_job_id))
+    
+    cursor.execute(JOB_RESULT_SQL[column], (new_status, value, job_id) if column else (new_status, job_id))
+    return new_status
+
+def flush_job_results(batch):
+    """Apply a batch of (job, result_data, error_message) updates in a single transaction."""
+    try:
+        with get_thread_db_connection() as conn:
+            cursor = conn.cursor()
+            finished = [(job.id, apply_job_result(cursor, job, result_data, error_message)) for job, result_data, error_message in batch]
+            conn.commit()
+        for job_id, new_status in finished:
+            logger.info("[StatusWriter] Job %s finished with status: %s", job_id, new_status)
+        for job_id, new_status in finished:
+            if new_status == 'keying_processing':
+                UPLOAD_QUEUE.put(job_id)  # Only after the commit, so the upload thread can see the row
+        notify_job_event()
+        return
+    except Exception as db_error:
+        logger.warning("[StatusWriter] Database error updating %s job(s): %s - retrying individually", len(batch), db_error)
+    
+    for job, result_data, error_message in batch:
+        job_id = job.id
+        try:
+            with get_thread_db_connection() as conn:
+                new_status = apply_job_result(conn.cursor(), job, result_data, error_message)
+                conn.commit()
+            logger.info("[StatusWriter] Job %s finished with status: %s", job_id, new_status)
+            if new_status == 'keying_processing':
+                UPLOAD_QUEUE.put(job_id)
+        except Exception as db_error:
+            logger.error("[StatusWriter] Database error updating job %s: %s", job_id, db_error)
+            # Try to at least mark the job as failed if we can't update it properly
+            try:
+                with get_thread_db_connection() as conn:
+                    conn.cursor().execute("UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ?", (f"Database update error: {db_error}", job_id))
+                    conn.commit()
+            except Exception as final_error:
+                logger.error("[StatusWriter] Could not even mark job %s as failed: %s", job_id, final_error)
+    notify_job_event()
+
+def record_job_result(job, result_data, error_message):
+    """Queue a finished job's outcome for the status writer thread."""
+    PENDING_UPDATES.put((job, result_data, error_message))
+
+def status_writer_loop():
+    """Collect finished-job updates for STATUS_FLUSH_INTERVAL and write each batch in one commit."""
+    running = True
+    while running:
+        batch = [PENDING_UPDATES.get()]
+        time.sleep(STATUS_FLUSH_INTERVAL)  # Let other jobs finishing around the same time join this batch
+        while True:
+            try:
+                batch.append(PENDING_UPDATES.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:  # Shutdown sentinel - flush what we have and stop
+            running = False
+            batch = [update for update in batch if update is not None]
+        if batch:
+            flush_job_results(batch)
+    close_thread_db_connection()
+
+def start_status_writer():
+    """Start the status writer on a background thread and return it."""
+    writer = threading.Thread(target=status_writer_loop, name="StatusWriter", daemon=True)
+    writer.start()
+    return writer
+
+def stop_status_writer(writer):
+    """Flush any queued updates and wait for the status writer to exit."""
+    PENDING_UPDATES.put(None)
+    writer.join(timeout=30)
+
+def upload_keyed_outputs(conn, job_id, keyed_result_data):
+    """Upload one keyed job's local outputs to S3 and mark it completed with the public URLs."""
+    try:
+        result_data = json_loads(keyed_result_data)
+        pending_uploads = {}
+        for export_type, url in result_data.items():
+            if url and url.startswith(STATIC_URL_PREFIX):
+                s3_key = url[len(STATIC_URL_PREFIX):]
+                local_path = os.path.join(STATIC_FOLDER, s3_key)
+                if not os.path.exists(local_path):
+                    raise FileNotFoundError(f"Keyed {export_type} output missing: {local_path}")
+                logger.info("   JOB #%s: 📤 Uploading keyed %s to S3: %s", job_id, export_type, s3_key)
+                pending_uploads[export_type] = (local_path, s3_key)
+        # The WebM, GIF and ZIP are independent and network-bound, so they upload side by side
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="KeyedUpload") as executor:
+            futures = {export_type: executor.submit(upload_file, local_path, s3_key)
+                       for export_type, (local_path, s3_key) in pending_uploads.items()}
+            for export_type, future in futures.items():
+                result_data[export_type] = future.result()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'completed', keyed_result_data = ? WHERE id = ? AND status = 'keying_processing'",
+                (json_dumps(result_data), job_id)
+            )
+        logger.info("   JOB #%s: 📤 S3 upload complete: %s", job_id, result_data)
+    except Exception as e:
+        logger.error("   JOB #%s: ❌ S3 upload failed: %s", job_id, e)
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ? AND status = 'keying_processing'",
+                (f"S3 upload failed: {e}", job_id)
+            )
+
+def s3_upload_loop():
+    """Upload keyed outputs of the queued job ids until the None sentinel (rows left over from a restart included)."""
+    conn = get_db_connection()
+    try:
+        leftovers = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'keying_processing' AND keyed_result_data LIKE ? ORDER BY id",
+            (f'%"{STATIC_URL_PREFIX}%',)
+        ).fetchall()
+        for row in leftovers:
+            UPLOAD_QUEUE.put(row['id'])
+        while True:
+            job_id = UPLOAD_QUEUE.get()
+            if job_id is None:  # Shutdown sentinel - everything queued before it has been uploaded
+                return
+            try:
+                row = conn.execute(
+                    "SELECT keyed_result_data FROM jobs WHERE id = ? AND status = 'keying_processing'", (job_id,)
+                ).fetchone()
+                if row and row['keyed_result_data']:
+                    upload_keyed_outputs(conn, job_id, row['keyed_result_data'])
+            except Exception as e:
+                logger.exception("[S3Uploader] Error while uploading outputs of job %s: %s", job_id, e)
+    finally:
+        conn.close()
+
+def start_s3_uploader():
+    """Start the write-behind upload thread and return it, or None when S3 is disabled."""
+    if not is_s3_enabled():
+        return None
+    uploader = threading.Thread(target=s3_upload_loop, name="S3Uploader", daemon=True)
+    uploader.start()
+    return uploader
+
+def stop_s3_uploader(uploader):
+    """Finish the uploads that are already queued, then stop the upload thread."""
+    if uploader is None:
+        return
+    UPLOAD_QUEUE.put(None)
+    uploader.join()
+
+FFMPEG_CLEANUP_INTERVAL = 30.0  # seconds
+
+def ffmpeg_janitor_loop(stop_event):
+    """Kill stuck ffmpeg processes every FFMPEG_CLEANUP_INTERVAL until stop_event is set."""
+    while not stop_event.wait(timeout=FFMPEG_CLEANUP_INTERVAL):
+        kill_stuck_ffmpeg_processes()
+
+def automation_checker_loop(stop_event):
+    """Advance waiting automations and analysis jobs whenever another connection has committed to the DB."""
+    conn = get_db_connection()
+    last_data_version = None
+    try:
+        while not stop_event.is_set():
+            try:
+                # data_version only moves when another connection (web app, job threads, status writer) commits
+                data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != last_data_version:
+                    last_data_version = data_version
+                    changes = conn.total_changes
+                    check_for_completed_automations(conn)
+                    check_for_analysis_completion(conn)
+                    if conn.total_changes != changes:
+                        notify_job_event()  # Stitch jobs / analysed image jobs were just queued - let main() claim them
+            except Exception as e:
+                logger.exception("[AutomationChecker] Error while checking waiting jobs: %s", e)
+            # Finished jobs wake us straight away, the web app's commits are picked up on the next poll
+            with JOB_EVENTS:
+                JOB_EVENTS.wait(timeout=JOB_POLL_INTERVAL)
+    finally:
+        conn.close()
+
+def start_background_checks():
+    """Start the ffmpeg janitor and automation checker threads. Returns (threads, stop_event)."""
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=ffmpeg_janitor_loop, args=(stop_event,), name="FFmpegJanitor", daemon=True),
+        threading.Thread(target=automation_checker_loop, args=(stop_event,), name="AutomationChecker", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    return threads, stop_event
+
+def stop_background_checks(background_checks):
+    """Stop the background check threads without waiting out their poll intervals."""
+    threads, stop_event = background_checks
+    stop_event.set()
+    notify_job_event()
+    for thread in threads:
+        thread.join(timeout=5)
+
+def process_single_job_worker(job, conn):
     """
     Process a single job in a worker thread.
     This function handles the entire lifecycle of job processing.
+    `conn` is the calling thread's own long-lived DB connection.
     """
-    job_id = job['id']
+    job_id = job.id
     try:
-        print(f"[Thread-{threading.current_thread().name}] Processing job {job_id}...")
+        logger.info("[Thread-%s] Processing job %s...", threading.current_thread().name, job_id)
         
         # Process the job
         result_data, error_message = None, None
         try:
-            with get_db_connection() as conn:
-                result_data, error_message = process_job(dict(job), conn)
+            with conn:
+                result_data, error_message = process_job(job, conn)
         except Exception as e:
-            print(f"[Thread-{threading.current_thread().name}] Unhandled exception during job {job_id} processing: {e}")
-            traceback.print_exc()
+            logger.exception("[Thread-%s] Unhandled exception during job %s processing: %s", threading.current_thread().name, job_id, e)
             error_message = f"Unhandled worker exception: {e}"
 
         # Update job status in database
+        record_job_result(job, result_data, error_message)
+        
+    except Exception as e:
+        logger.exception("[Thread-%s] FATAL ERROR processing job %s: %s", threading.current_thread().name, job_id, e)
         try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                if error_message is not None:
-                    new_status = 'failed'
-                    print(f"   JOB #{job_id}: ❌ Marking as FAILED with error: {error_message}")
-                    cursor.execute("UPDATE jobs SET status = ?, error_message = ? WHERE id = ?", (new_status, str(error_message), job_id))
-                elif job['status'] in ['keying_queued', 'keying_processing']:
-                    # Handle keying completion BEFORE checking job_type
-                    new_status = 'completed'
-                    print(f"   JOB #{job_id}: ✅ Marking as COMPLETED with keyed_result_data: {result_data}")
-                    cursor.execute("UPDATE jobs SET status = ?, keyed_result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                    print(f"   JOB #{job_id}: 💾 Database updated successfully")
-                elif job['job_type'] == 'boomerang_automation':
-                    # This is for initial boomerang setup, not keying
-                    new_status = result_data # This should be 'waiting_for_children'
-                    cursor.execute("UPDATE jobs SET status = ? WHERE id = ?", (new_status, job_id))
-                elif job['status'] in ['queued', 'processing']:
-                    # For animations that are part of boomerang automation, complete them automatically
-                    if job['job_type'] == 'animation' and job['parent_job_id']:
-                        try:
-                            parent_job = cursor.execute("SELECT job_type FROM jobs WHERE id = ?", (job['parent_job_id'],)).fetchone()
-                            if parent_job and parent_job['job_type'] == 'boomerang_automation':
-                                new_status = 'completed'  # Complete without keying for boomerang automation
-                                print(f"   ...auto-completing animation job {job_id} (part of boomerang automation #{job['parent_job_id']})")
-                                cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                            else:
-                                new_status = 'pending_review'  # Regular workflow needs review
-                                print(f"   ...setting animation job {job_id} to pending_review (parent type: {parent_job['job_type'] if parent_job else 'None'})")
-                                cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                        except Exception as e:
-                            print(f"   ...error checking parent job for {job_id}: {e}, defaulting to completed")
-                            new_status = 'completed'  # Safe default for boomerang children
-                            cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                    # For stitching jobs that are part of boomerang automation, update the parent with the result
-                    elif job['job_type'] == 'video_stitching' and job['parent_job_id']:
-                        try:
-                            parent_job = cursor.execute("SELECT job_type FROM jobs WHERE id = ?", (job['parent_job_id'],)).fetchone()
-                            if parent_job and parent_job['job_type'] == 'boomerang_automation':
-                                new_status = 'completed'  # Complete the stitching job
-                                print(f"   ...completing stitching job {job_id} (part of boomerang automation #{job['parent_job_id']})")
-                                cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                                # Update the parent boomerang automation job with the stitched result
-                                print(f"   ...updating parent boomerang job #{job['parent_job_id']} with stitched result")
-                                cursor.execute("UPDATE jobs SET status = 'completed', result_data = ? WHERE id = ?", (result_data, job['parent_job_id']))
-                            else:
-                                new_status = 'pending_review'  # Regular stitching workflow needs review
-                                cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                        except Exception as e:
-                            print(f"   ...error checking parent job for stitching {job_id}: {e}, defaulting to pending_review")
-                            new_status = 'pending_review'
-                            cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                    else:
-                        # Mark all jobs as completed (animations no longer need review)
-                        new_status = 'completed'
-                        cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
-                else: # Default case for completion
-                    new_status = 'completed'
-                    cursor.execute("UPDATE jobs SET status = ?, result_data = ? WHERE id = ?", (new_status, result_data, job_id))
+            with conn:
+                conn.execute("UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ?", (f"Fatal worker error: {e}", job_id))
+        except Exception as db_e:
+            logger.error("[Thread-%s] Could not even update DB for failed job: %s", threading.current_thread().name, db_e)
 
-                conn.commit()
-                print(f"[Thread-{threading.current_thread().name}] Job {job_id} finished with status: {new_status}")
-        except Exception as db_error:
-            print(f"[Thread-{threading.current_thread().name}] Database error updating job {job_id}: {db_error}")
-            # Try to at least mark the job as failed if we can't update it properly
+def job_worker_loop(job_queue):
+    """Long-lived job thread: owns one DB connection for its lifetime and runs queued jobs until it gets None."""
+    conn = get_db_connection()
+    try:
+        while True:
+            job = job_queue.get()
+            if job is None:
+                job_queue.task_done()
+                break
             try:
-                with get_db_connection() as conn:
-                    conn.cursor().execute("UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ?", (f"Database update error: {db_error}", job_id))
-                    conn.commit()
-            except Exception as final_error:
-                print(f"[Thread-{threading.current_thread().name}] Could not even mark job {job_id} as failed: {final_error}")
-                
+                process_single_job_worker(job, conn)
+            finally:
+                job_queue.task_done()
+                notify_job_event()
+    finally:
+        conn.close()
+
+def start_job_workers(job_queue, count, name="JobWorker"):
+    """Start `count` job threads fed from `job_queue`."""
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(target=job_worker_loop, args=(job_queue,), name=f"{name}_{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def stop_job_workers(job_queue, threads, wait=True):
+    """Let the job threads finish what they have queued, then exit."""
+    for _ in threads:
+        job_queue.put(None)
+    if wait:
+        for thread in threads:
+            thread.join()
+
+def _sql_list(values):
+    return ", ".join(f"'{value}'" for value in values)
+
+def job_claim_query(thread_slots, io_slots, async_slots, io_lane, async_lane):
+    """
+    SELECT of the job ids to claim next: up to the number of free slots in each lane, keying first, then oldest.
+    Animation jobs go to the async loop, IO_JOB_TYPES to the I/O threads (animation too when there is
+    no async loop), keying and everything else to the job threads. Returns None if no lane has a free slot.
+    """
+    async_types = ('animation',) if async_lane else ()
+    io_types = (IO_JOB_TYPES + (() if async_lane else ('animation',))) if io_lane else ()
+    offloaded = io_types + async_types
+    
+    lanes = []
+    if thread_slots > 0:
+        # Keying jobs always need a job thread, whatever their type
+        queued = f"(status = 'queued' AND job_type NOT IN ({_sql_list(offloaded)}))" if offloaded else "status = 'queued'"
+        lanes.append((f"status = 'keying_queued' OR {queued}", thread_slots))
+    if io_slots > 0 and io_types:
+        lanes.append((f"status = 'queued' AND job_type IN ({_sql_list(io_types)})", io_slots))
+    if async_slots > 0 and async_types:
+        lanes.append(("status = 'queued' AND job_type = 'animation'", async_slots))
+    # One LIMITed subquery per lane, so a backlog of one job type can't take another lane's slots
+    return " UNION ALL ".join(
+        f"SELECT id FROM (SELECT id FROM jobs WHERE {condition} "
+        f"ORDER BY CASE status WHEN 'keying_queued' THEN 0 ELSE 1 END, created_at ASC LIMIT {slots})"
+        for condition, slots in lanes
+    ) or None
+
+def job_lane(job, io_lane, async_lane):
+    """Which lane a freshly claimed job runs on: 'async', 'io' or 'thread'."""
+    if job.status != 'processing':
+        return 'thread'
+    if async_lane and job.job_type == 'animation':
+        return 'async'
+    if io_lane and (job.job_type in IO_JOB_TYPES or job.job_type == 'animation'):
+        return 'io'
+    return 'thread'
+
+async def process_single_job_async(job):
+    """Coroutine counterpart of process_single_job_worker for animation jobs on the async loop."""
+    job_id = job.id
+    logger.info("[AsyncLoop] Processing job %s...", job_id)
+    try:
+        result_data, error_message = await handle_animation_async(job)
     except Exception as e:
-        print(f"[Thread-{threading.current_thread().name}] FATAL ERROR processing job {job_id}: {e}")
-        traceback.print_exc()
-        try:
-            with get_db_connection() as conn:
-                conn.cursor().execute("UPDATE jobs SET status = 'failed', error_message = ? WHERE id = ?", (f"Fatal worker error: {e}", job_id))
-                conn.commit()
-        except Exception as db_e:
-            print(f"[Thread-{threading.current_thread().name}] Could not even update DB for failed job: {db_e}")
+        logger.exception("[AsyncLoop] Unhandled exception during job %s processing: %s", job_id, e)
+        result_data, error_message = None, f"Unhandled worker exception: {e}"
+    record_job_result(job, result_data, error_message)
+
+def start_async_loop():
+    """Start an asyncio event loop on a daemon thread and return it."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="AsyncLoop", daemon=True).start()
+    return loop
 
 def main():
     print("=" * 60)
     print("Starting Multi-Threaded Worker")
     print(f"Max concurrent jobs: {MAX_CONCURRENT_JOBS}")
+    print(f"Max I/O-bound jobs: {MAX_IO_JOBS}")
+    print(f"Max async animation jobs: {MAX_ASYNC_JOBS}")
+    print(f"NVENC encoding: {'available' if nvenc_available() else 'not available (using libx264)'}")
     print("=" * 60)
     
-    last_cleanup = time.time()
-    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="JobWorker")
-    active_futures = {}  # Maps future -> job_id for tracking
+    ensure_db_indexes()
+    threading.Thread(target=warm_up_sticker_kernels, name="NumbaWarmup", daemon=True).start()
+    job_queue = queue.Queue()  # Claimed jobs handed to the long-lived job threads
+    job_threads = start_job_workers(job_queue, MAX_CONCURRENT_JOBS)
+    io_queue = queue.Queue()  # Claimed network-bound jobs for the I/O threads
+    io_threads = start_job_workers(io_queue, MAX_IO_JOBS, name="IOWorker")
+    async_loop = start_async_loop() if MAX_ASYNC_JOBS > 0 else None
+    async_futures = {}  # Animation jobs running on the event loop, tracked separately from the thread pool
+    finished_async_futures = queue.Queue()  # Filled by done-callbacks, so the loop never scans async_futures
+    status_writer = start_status_writer()
+    s3_uploader = start_s3_uploader()
+    # ffmpeg cleanup and automation/analysis completion run on their own threads so they never delay pickup
+    background_checks = start_background_checks()
+    last_data_version = None  # PRAGMA data_version at the last tick that tried to claim
+    idle_claim_query = None  # Claim query that last found nothing to claim at that data version
     
     try:
         while True:
             try:
-                # Kill stuck ffmpeg processes every 30 seconds
-                current_time = time.time()
-                if current_time - last_cleanup > 30:
-                    kill_stuck_ffmpeg_processes()
-                    last_cleanup = current_time
+                # Only another connection's commit (web app, job threads, status writer) can add claimable jobs
+                data_version = get_thread_db_connection().execute("PRAGMA data_version").fetchone()[0]
+                db_changed = data_version != last_data_version
+                last_data_version = data_version
                 
-                # Check for completed automations and analysis in main thread
-                with get_db_connection() as conn:
-                    check_for_completed_automations(conn)
-                    check_for_analysis_completion(conn)
-                
-                # Clean up completed futures
-                completed_futures = [f for f in active_futures.keys() if f.done()]
-                for future in completed_futures:
-                    job_id = active_futures.pop(future)
+                # Clean up completed async futures
+                while True:
+                    try:
+                        future = finished_async_futures.get_nowait()
+                    except queue.Empty:
+                        break
+                    job_id = async_futures.pop(future)
                     try:
                         future.result()  # This will raise any exceptions that occurred
                     except Exception as e:
-                        print(f"Future for job {job_id} raised exception: {e}")
+                        logger.error("Future for job %s raised exception: %s", job_id, e)
                 
-                # Check if we have capacity for more jobs
-                if len(active_futures) < MAX_CONCURRENT_JOBS:
-                    # Try to fetch a new job
-                    job = None
-                    with get_db_connection() as conn:
+                # Free slots per lane (job threads, I/O threads and/or async loop)
+                # unfinished_tasks counts jobs handed to the threads that have not finished yet
+                active_thread_jobs = job_queue.unfinished_tasks
+                active_io_jobs = io_queue.unfinished_tasks
+                thread_slots = MAX_CONCURRENT_JOBS - active_thread_jobs
+                io_slots = MAX_IO_JOBS - active_io_jobs
+                async_slots = MAX_ASYNC_JOBS - len(async_futures) if async_loop is not None else 0
+                # Only pick job types that have a free slot to run in
+                claim_query = job_claim_query(thread_slots, io_slots, async_slots,
+                                              io_lane=MAX_IO_JOBS > 0, async_lane=async_loop is not None)
+                # Nothing new to claim if the same lanes already came up empty and the database hasn't changed
+                if claim_query and (db_changed or claim_query != idle_claim_query):
+                    # Try to fetch new jobs - enough to fill every free slot in one round trip
+                    jobs = []
+                    with get_thread_db_connection() as conn:
                         cursor = conn.cursor()
                         
-                        # Count jobs in each status for debugging
-                        keying_count = cursor.execute("SELECT COUNT(*) FROM jobs WHERE status = 'keying_queued'").fetchone()[0]
-                        queued_count = cursor.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
-                        print(f"🔍 Worker checking for jobs: {keying_count} keying_queued, {queued_count} queued, {len(active_futures)}/{MAX_CONCURRENT_JOBS} active")
+                        # Count jobs in each status for debugging (WORKER_LOG_LEVEL=DEBUG only - two extra queries per claim)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            keying_count, queued_count = cursor.execute(
+                                "SELECT COUNT(*) FILTER (WHERE status = 'keying_queued'), COUNT(*) FILTER (WHERE status = 'queued') "
+                                "FROM jobs WHERE status IN ('keying_queued', 'queued')"
+                            ).fetchone()
+                            logger.debug("🔍 Worker checking for jobs: %s keying_queued, %s queued, %s/%s active, %s/%s I/O, %s/%s async",
+                                         keying_count, queued_count, active_thread_jobs, MAX_CONCURRENT_JOBS,
+                                         active_io_jobs, MAX_IO_JOBS, len(async_futures), MAX_ASYNC_JOBS)
                         
-                        # Priority: keying jobs first
-                        job = cursor.execute("SELECT * FROM jobs WHERE status = 'keying_queued' ORDER BY created_at ASC LIMIT 1").fetchone()
-                        if job:
-                            print(f"   🎬 Found KEYING job #{job['id']} - updating to keying_processing")
-                            cursor.execute("UPDATE jobs SET status = 'keying_processing' WHERE id = ?", (job['id'],))
-                            conn.commit()
-                            job = cursor.execute("SELECT * FROM jobs WHERE id = ?", (job['id'],)).fetchone()
+                        # Atomic claim: pick the next jobs and flip their status in one statement (SQLite >= 3.35)
+                        rows = cursor.execute(
+                            "UPDATE jobs SET status = CASE status WHEN 'keying_queued' THEN 'keying_processing' ELSE 'processing' END "
+                            f"WHERE id IN ({claim_query}) "
+                            "RETURNING *, (SELECT parent.job_type FROM jobs parent WHERE parent.id = jobs.parent_job_id) AS parent_job_type"
+                        ).fetchall()
+                        conn.commit()
+                        # RETURNING order is unspecified - hand them out keying first, then oldest first
+                        jobs = sorted((Job.from_row(row) for row in rows),
+                                      key=lambda job: (job.status != 'keying_processing', job.created_at or ''))
+                    
+                    for job in jobs:
+                        lane = job_lane(job, io_lane=MAX_IO_JOBS > 0, async_lane=async_loop is not None)
+                        if lane == 'async':
+                            # Animation jobs mostly wait on Replicate - run them on the event loop
+                            future = asyncio.run_coroutine_threadsafe(process_single_job_async(job), async_loop)
+                            async_futures[future] = job.id
+                            future.add_done_callback(finished_async_futures.put)
+                            future.add_done_callback(notify_job_event)
+                            logger.info("   ✅ Claimed job #%s (type=%s, now %s) -> async loop (%s/%s active)",
+                                        job.id, job.job_type, job.status, len(async_futures), MAX_ASYNC_JOBS)
+                        elif lane == 'io':
+                            # Network-bound job - hand it to the I/O threads
+                            io_queue.put(job)
+                            logger.info("   ✅ Claimed job #%s (type=%s, now %s) -> I/O threads (%s/%s active)",
+                                        job.id, job.job_type, job.status, io_queue.unfinished_tasks, MAX_IO_JOBS)
                         else:
-                            # Then regular queued jobs
-                            job = cursor.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at ASC LIMIT 1").fetchone()
-                            if job:
-                                print(f"   📋 Found REGULAR job #{job['id']} - updating to processing")
-                                cursor.execute("UPDATE jobs SET status = 'processing' WHERE id = ?", (job['id'],))
-                                conn.commit()
-                                job = cursor.execute("SELECT * FROM jobs WHERE id = ?", (job['id'],)).fetchone()
+                            # Hand job to the job threads
+                            job_queue.put(job)
+                            logger.info("   ✅ Claimed job #%s (type=%s, now %s) -> job threads (%s/%s active)",
+                                        job.id, job.job_type, job.status, job_queue.unfinished_tasks, MAX_CONCURRENT_JOBS)
                     
-                    if job:
-                        # Submit job to thread pool
-                        job_dict = dict(job)
-                        print(f"   ✅ Submitting job #{job['id']} to thread pool (type={job['job_type']}, status={job['status']})")
-                        future = executor.submit(process_single_job_worker, job_dict)
-                        active_futures[future] = job['id']
-                        print(f"Submitted job {job['id']} to worker thread pool ({len(active_futures)}/{MAX_CONCURRENT_JOBS} active)")
+                    if jobs:
+                        idle_claim_query = None
+                        continue  # Claim again right away in case a lane's backlog is larger than its free slots
+                    idle_claim_query = claim_query
                 
-                # Sleep briefly to avoid tight loop
-                time.sleep(1)
+                # Wait for a job to finish in this process, or poll again for jobs queued by the web app
+                with JOB_EVENTS:
+                    JOB_EVENTS.wait(timeout=JOB_POLL_INTERVAL)
                 
             except Exception as e:
-                print(f"ERROR in worker's main loop: {e}")
-                traceback.print_exc()
+                logger.exception("ERROR in worker's main loop: %s", e)
                 time.sleep(5)
     
     except KeyboardInterrupt:
         print("\n\nShutting down worker...")
         print("Waiting for active jobs to complete...")
-        executor.shutdown(wait=True)
+        stop_job_workers(job_queue, job_threads)
+        stop_job_workers(io_queue, io_threads)
+        wait_futures(list(async_futures))
+        stop_status_writer(status_writer)
+        stop_background_checks(background_checks)
+        stop_s3_uploader(s3_uploader)
+        close_thread_db_connection()
         print("Worker stopped cleanly.")
     except Exception as e:
-        print(f"FATAL ERROR: {e}")
-        traceback.print_exc()
-        executor.shutdown(wait=False)
+        logger.exception("FATAL ERROR: %s", e)
+        stop_job_workers(job_queue, job_threads, wait=False)
+        stop_job_workers(io_queue, io_threads, wait=False)
+        stop_status_writer(status_writer)
+        stop_background_checks(background_checks)
 
 if __name__ == "__main__":
     main()